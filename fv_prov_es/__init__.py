@@ -10,6 +10,17 @@ from fv_prov_es.models import db
 
 from fv_prov_es.extensions import (
     cache,
+    es,
+    id_resolver,
+    doc_cache,
+    export_cache,
+    query_cache,
+    facet_counts,
+    graph_cache,
+    layout_cache,
+    layout_pool,
+    provconvert,
+    expansion_map,
     assets_env,
     debug_toolbar,
     login_manager
@@ -89,6 +100,17 @@ def create_app(object_name, env="prod"):
 
     #init extensions
     cache.init_app(app)
+    es.init_app(app)
+    id_resolver.init_app(app)
+    doc_cache.init_app(app)
+    export_cache.init_app(app)
+    query_cache.init_app(app)
+    facet_counts.init_app(app)
+    graph_cache.init_app(app)
+    layout_cache.init_app(app)
+    layout_pool.init_app(app)
+    provconvert.init_app(app)
+    expansion_map.init_app(app)
     debug_toolbar.init_app(app)
     db.init_app(app)
     login_manager.init_app(app)
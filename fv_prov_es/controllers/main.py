@@ -3,12 +3,17 @@ from datetime import datetime
 from flask import Blueprint, render_template, flash, request, redirect, url_for, Response, current_app, jsonify
 from flask.ext.login import login_user, logout_user, login_required
 
-from fv_prov_es import cache
+from fv_prov_es import cache, graph_cache, layout_cache, layout_pool
 from fv_prov_es.forms import LoginForm
 from fv_prov_es.models import User
-from fv_prov_es.lib.graphviz import add_graphviz_positions
-from fv_prov_es.lib.utils import get_prov_es_json, update_dict, get_expansion_map
-from fv_prov_es.lib.d3_utils import get_agent_node, get_activity_node, get_entity_node
+from fv_prov_es.lib.graphviz import get_topology_key, get_positions, set_positions
+from fv_prov_es.lib.layout_utils import (add_layout_positions, add_degraded_positions,
+                                        get_pinned_positions, LAYOUT_ENGINES)
+from fv_prov_es.lib.layout_pool import LayoutBusy, LayoutTimeout
+from fv_prov_es.lib.lineage import traverse_lineage, DIRECTIONS
+from fv_prov_es.lib.utils import (get_prov_es_json, get_prov_es_jsons, get_json_hash,
+                                  get_expansion_map, PROV_RELATIONS)
+from fv_prov_es.lib.d3_utils import get_agent_node, get_activity_node, get_entity_node, D3Graph
 
 main = Blueprint('main', __name__)
 
@@ -85,202 +90,225 @@ def fdl():
                            current_year=datetime.now().year)
 
 
-def expand_activity_prov(a, act, pem, pej, nodes, viz_dict, associations, a2e_relations):
+# concepts referenced by each relation: (attribute, concept type)
+RELATION_REFS = {
+    'used':               (('prov:activity', 'activity'), ('prov:entity', 'entity')),
+    'wasGeneratedBy':     (('prov:activity', 'activity'), ('prov:entity', 'entity')),
+    'hadMember':          (('prov:collection', 'entity'), ('prov:entity', 'entity')),
+    'wasAssociatedWith':  (('prov:activity', 'activity'), ('prov:agent', 'agent')),
+    'actedOnBehalfOf':    (('prov:activity', 'activity'), ('prov:delegate', 'agent'),
+                           ('prov:responsible', 'agent')),
+}
+
+
+def get_expansion_refs(concept, doc, pem):
+    """Return list of (type, id) tuples of objects a concept references
+       through the expansion map."""
+
+    refs = []
+    for pred, obj_type, obj_is_source, obj_ids in pem.expansions(concept, doc):
+        refs.extend([(obj_type, obj_id) for obj_id in obj_ids])
+    return refs
+
+
+def get_es_prov_doc(es_doc, obj_type, obj_id):
+    """Return PROV-ES doc for a concept from an ES document."""
+
+    if '_source' not in es_doc: return {}
+    return es_doc['_source']['prov_es_json'].get(obj_type, {}).get(obj_id, {})
+
+
+def resolve_prov_docs(pej, pem):
+    """Return dict of ES documents for all concepts referenced by relations
+       or expansions in pej that are not defined locally. Referenced docs are
+       fetched in batches; ids not found in ES map to an empty dict."""
+
+    resolved = {}
+
+    def fetch(refs):
+        ids = set([obj_id for obj_type, obj_id in refs
+                   if obj_id not in pej.get(obj_type, {}) and obj_id not in resolved])
+        if len(ids) == 0: return
+        docs = get_prov_es_jsons(ids)
+        for obj_id in ids: resolved[obj_id] = docs.get(obj_id, {})
+
+    # relation endpoints and expansions of local concepts
+    refs = []
+    expand_refs = []
+    for rel in RELATION_REFS:
+        for rel_doc in pej.get(rel, {}).itervalues():
+            for attr, obj_type in RELATION_REFS[rel]:
+                refs.append((obj_type, rel_doc[attr]))
+                if rel != 'hadMember' and obj_type in ('activity', 'entity'):
+                    expand_refs.append((obj_type, rel_doc[attr]))
+    for concept in ('activity', 'entity'):
+        for obj_id, doc in pej.get(concept, {}).iteritems():
+            refs.extend(get_expansion_refs(concept, doc, pem))
+    fetch(refs)
+
+    # expansions of fetched activities and entities
+    refs = []
+    for obj_type, obj_id in expand_refs:
+        if obj_id in resolved:
+            doc = get_es_prov_doc(resolved[obj_id], obj_type, obj_id)
+            refs.extend(get_expansion_refs(obj_type, doc, pem))
+    fetch(refs)
+    return resolved
+
+
+def get_prov_doc(pej, obj_type, obj_id, resolved=None):
+    """Return PROV-ES doc for a concept from the local document, resolved
+       documents or ES."""
+
+    if obj_id in pej.get(obj_type, {}):
+        return pej[obj_type][obj_id]
+    if resolved is not None and obj_id in resolved:
+        return get_es_prov_doc(resolved[obj_id], obj_type, obj_id)
+    return get_es_prov_doc(get_prov_es_json(obj_id), obj_type, obj_id)
+
+
+def expand_activity_prov(a, act, pem, pej, resolved, graph, associations, a2e_relations):
     """Expand PROV-ES for activity."""
 
-    for pred in pem.get('activity', {}):
-        obj_type = pem['activity'][pred]['type']
-        obj_is_source = pem['activity'][pred]['source']
-        if pred in act:
-            obj_ids = act[pred] if isinstance(act[pred], (types.ListType, types.TupleType)) else [act[pred]]
-            for obj_id in obj_ids:
-                if obj_id in pej.get(obj_type, {}):
-                    obj_doc = pej[obj_type][obj_id]
+    for pred, obj_type, obj_is_source, obj_ids in pem.expansions('activity', act):
+        for obj_id in obj_ids:
+            if obj_id not in graph:
+                obj_doc = get_prov_doc(pej, obj_type, obj_id, resolved)
+                graph.add_node(D3_NODE_FUNC[obj_type](obj_id, obj_doc))
+            if obj_type == "agent": links_ref = associations
+            elif obj_type == "entity": links_ref = a2e_relations
+            else: links_ref = None
+            if links_ref is not None:
+                if obj_is_source:
+                    links_ref.append({
+                        'source': obj_id,
+                        'target': a,
+                        'concept': pred,
+                    })
                 else:
-                    obj_doc = get_prov_es_json(obj_id)['_source']['prov_es_json'][obj_type][obj_id]
-                viz_dict['nodes'].append(D3_NODE_FUNC[obj_type](obj_id, obj_doc))
-                nodes.append(obj_id)
-                if obj_type == "agent": links_ref = associations
-                elif obj_type == "entity": links_ref = a2e_relations
-                else: links_ref = None
-                if links_ref is not None:
-                    if obj_is_source:
-                        links_ref.append({
-                            'source': obj_id,
-                            'target': a,
-                            'concept': pred,
-                        })
-                    else:
-                        links_ref.append({
-                            'source': a,
-                            'target': obj_id,
-                            'concept': pred,
-                        })
+                    links_ref.append({
+                        'source': a,
+                        'target': obj_id,
+                        'concept': pred,
+                    })
         
 
-def expand_entity_prov(e, ent, pem, pej, nodes, viz_dict, e2e_relations):
+def expand_entity_prov(e, ent, pem, pej, resolved, graph, e2e_relations):
     """Expand PROV-ES for entity."""
    
-    for pred in pem.get('entity', {}):
-        obj_type = pem['entity'][pred]['type']
-        obj_is_source = pem['entity'][pred]['source']
-        if pred in ent:
-            obj_ids = ent[pred] if isinstance(ent[pred], (types.ListType, types.TupleType)) else [ent[pred]]
-            for obj_id in obj_ids:
-                if obj_id in pej.get(obj_type, {}):
-                    obj_doc = pej[obj_type][obj_id]
+    for pred, obj_type, obj_is_source, obj_ids in pem.expansions('entity', ent):
+        for obj_id in obj_ids:
+            if obj_id not in graph:
+                obj_doc = get_prov_doc(pej, obj_type, obj_id, resolved)
+                graph.add_node(D3_NODE_FUNC[obj_type](obj_id, obj_doc))
+            if obj_type in ("agent", "entity"): links_ref = e2e_relations
+            else: links_ref = None
+            if links_ref is not None:
+                if obj_is_source:
+                    links_ref.append({
+                        'source': obj_id,
+                        'target': e,
+                        'concept': pred,
+                    })
                 else:
-                    es_doc = get_prov_es_json(obj_id)
-                    if '_source' not in es_doc:
-                        obj_doc = {}
-                    else:
-                        obj_doc = es_doc['_source']['prov_es_json'][obj_type][obj_id]
-                viz_dict['nodes'].append(D3_NODE_FUNC[obj_type](obj_id, obj_doc))
-                nodes.append(obj_id)
-                if obj_type in ("agent", "entity"): links_ref = e2e_relations
-                else: links_ref = None
-                if links_ref is not None:
-                    if obj_is_source:
-                        links_ref.append({
-                            'source': obj_id,
-                            'target': e,
-                            'concept': pred,
-                        })
-                    else:
-                        links_ref.append({
-                            'source': e,
-                            'target': obj_id,
-                            'concept': pred,
-                        })
+                    links_ref.append({
+                        'source': e,
+                        'target': obj_id,
+                        'concept': pred,
+                    })
         
 
-@cache.cached(timeout=1000)
+def get_graph_key(pej, pem):
+    """Return cache key of the D3 graph of a PROV-ES document."""
+
+    return get_json_hash([pem.version, pej])
+
+
 def parse_d3(pej):
-    """Return d3 node data structure for an activity, entity, or agent."""
+    """Return d3 node data structure for an activity, entity, or agent.
+       Results are cached by content hash and shared between callers, so
+       they must not be modified."""
 
     # get expansion map
     pem = get_expansion_map()
     #current_app.logger.debug("prov_expansion_map: %s" % json.dumps(pem, indent=2))
 
-    # viz dict
-    nodes = [] 
-    input_ents = []
-    output_ents = []
+    # check cache
+    key = get_graph_key(pej, pem)
+    viz_dict = graph_cache.get(key)
+    if viz_dict is not None: return viz_dict
+
+    # batch fetch referenced concepts that are not in this document
+    resolved = resolve_prov_docs(pej, pem)
+
+    # viz graph; relations are collected and linked once all nodes are known
+    graph = D3Graph()
+    expanded = set()
     associations = []
     delegations = []
     e2e_relations = []
     a2e_relations = []
-    viz_dict = {'nodes': [], 'links': []}
+
+    def add_agent(ag, agent=None):
+        if ag in graph: return
+        if agent is None: agent = get_prov_doc(pej, 'agent', ag, resolved)
+        graph.add_node(get_agent_node(ag, agent))
+        #expand_agent_prov(ag, agent, pem, pej, resolved, graph, associations)
+
+    def add_activity(a, act=None):
+        if a in expanded: return
+        if act is None: act = get_prov_doc(pej, 'activity', a, resolved)
+        graph.add_node(get_activity_node(a, act))
+        expand_activity_prov(a, act, pem, pej, resolved, graph, associations, a2e_relations)
+        expanded.add(a)
+
+    def add_entity(e, ent=None, expand=True):
+        if e in expanded or (not expand and e in graph): return
+        if ent is None: ent = get_prov_doc(pej, 'entity', e, resolved)
+        graph.add_node(get_entity_node(e, ent))
+        if expand:
+            expand_entity_prov(e, ent, pem, pej, resolved, graph, e2e_relations)
+            expanded.add(e)
 
     # add agent nodes
-    for a in pej.get('agent', {}):
-        viz_dict['nodes'].append(get_agent_node(a, pej['agent'][a]))
-        nodes.append(a)
+    for ag in pej.get('agent', {}):
+        add_agent(ag, pej['agent'][ag])
 
     # add activities
     for a in pej.get('activity', {}):
-        act = pej['activity'][a]
-        viz_dict['nodes'].append(get_activity_node(a, act))
-        nodes.append(a)
-        expand_activity_prov(a, act, pem, pej, nodes, viz_dict, associations, a2e_relations)
+        add_activity(a, pej['activity'][a])
         
     # add entities
     for e in pej.get('entity', {}):
-        ent = pej['entity'][e]
-        viz_dict['nodes'].append(get_entity_node(e, ent))
-        nodes.append(e)
-        expand_entity_prov(e, ent, pem, pej, nodes, viz_dict, e2e_relations)
+        add_entity(e, pej['entity'][e])
         
     # add used links
     for u in pej.get('used', {}):
         used = pej['used'][u]
-
-        # get activity
         a = used['prov:activity']
-        if a in pej.get('activity', {}):
-            act = pej['activity'][a]
-        else:
-            act = get_prov_es_json(a)['_source']['prov_es_json']['activity'][a]
-        viz_dict['nodes'].append(get_activity_node(a, act))
-        nodes.append(a)
-        expand_activity_prov(a, act, pem, pej, nodes, viz_dict, associations, a2e_relations)
-
-        # get entity
         e = used['prov:entity']
-        if e in pej.get('entity', {}):
-            ent = pej['entity'][e]
-        else:
-            ent = get_prov_es_json(e)['_source']['prov_es_json']['entity'][e]
-        viz_dict['nodes'].append(get_entity_node(e, ent))
-        nodes.append(e)
-        expand_entity_prov(e, ent, pem, pej, nodes, viz_dict, e2e_relations)
-        
-        viz_dict['links'].append({
-            'source': nodes.index(a),
-            'target': nodes.index(e),
-            'type': 'used',
-            'concept': 'prov:used',
-            'value': 1,
-            'doc': used,
-        })
-        input_ents.append(e)
+        add_activity(a)
+        add_entity(e)
+        graph.add_link(a, e, 'used', 'prov:used', used)
+        graph.input_ents.add(e)
         
     # add generated links
     for g in pej.get('wasGeneratedBy', {}):
         gen = pej['wasGeneratedBy'][g]
-
-        # get activity
         a = gen['prov:activity']
-        if a in pej.get('activity', {}):
-            act = pej['activity'][a]
-        else:
-            act = get_prov_es_json(a)['_source']['prov_es_json']['activity'][a]
-        viz_dict['nodes'].append(get_activity_node(a, act))
-        nodes.append(a)
-        expand_activity_prov(a, act, pem, pej, nodes, viz_dict, associations, a2e_relations)
-        
-        # get entity
         e = gen['prov:entity']
-        if e in pej.get('entity', {}):
-            ent = pej['entity'][e]
-        else:
-            ent = get_prov_es_json(e)['_source']['prov_es_json']['entity'][e]
-        viz_dict['nodes'].append(get_entity_node(e, ent))
-        nodes.append(e)
-        expand_entity_prov(e, ent, pem, pej, nodes, viz_dict, e2e_relations)
-        
-        viz_dict['links'].append({
-            'source': nodes.index(e),
-            'target': nodes.index(a),
-            'type': 'wasGeneratedBy',
-            'concept': 'prov:wasGeneratedBy',
-            'value': 1,
-            'doc': gen,
-        })
-        output_ents.append(e)
+        add_activity(a)
+        add_entity(e)
+        graph.add_link(e, a, 'wasGeneratedBy', 'prov:wasGeneratedBy', gen)
+        graph.output_ents.add(e)
         
     # add hadMember links
     for h in pej.get('hadMember', {}):
         hm = pej['hadMember'][h]
-
-        # get collection
         c = hm['prov:collection']
-        if c in pej.get('entity', {}):
-            col = pej['entity'][c]
-        else:
-            col = get_prov_es_json(c)['_source']['prov_es_json']['entity'][c]
-            viz_dict['nodes'].append(get_entity_node(c, col))
-            nodes.append(c)
-        
-        # get entity
         e = hm['prov:entity']
-        if e in pej.get('entity', {}):
-            ent = pej['entity'][e]
-        else:
-            ent = get_prov_es_json(e)['_source']['prov_es_json']['entity'][e]
-            viz_dict['nodes'].append(get_entity_node(e, ent))
-            nodes.append(e)
-        
+        add_entity(c, expand=False)
+        add_entity(e, expand=False)
         e2e_relations.append({
             'source': c,
             'target': e,
@@ -291,27 +319,10 @@ def parse_d3(pej):
     # add association links
     for w in pej.get('wasAssociatedWith', {}):
         waw = pej['wasAssociatedWith'][w]
-
-        # get activity
         a = waw['prov:activity']
-        if a in pej.get('activity', {}):
-            act = pej['activity'][a]
-        else:
-            act = get_prov_es_json(a)['_source']['prov_es_json']['activity'][a]
-        viz_dict['nodes'].append(get_activity_node(a, act))
-        nodes.append(a)
-        expand_activity_prov(a, act, pem, pej, nodes, viz_dict, associations, a2e_relations)
-        
-        # get agent
         ag = waw['prov:agent']
-        if ag in pej.get('agent', {}):
-            agent = pej['agent'][ag]
-        else:
-            agent = get_prov_es_json(ag)['_source']['prov_es_json']['agent'][ag]
-        viz_dict['nodes'].append(get_agent_node(ag, agent))
-        nodes.append(ag)
-        #expand_agent_prov(ag, agent, pem, pej, nodes, viz_dict, associations)
-
+        add_activity(a)
+        add_agent(ag)
         associations.append({
             'source': ag,
             'target': a,
@@ -321,118 +332,46 @@ def parse_d3(pej):
     # add delegation links
     for d in pej.get('actedOnBehalfOf', {}):
         dlg = pej['actedOnBehalfOf'][d]
-
-        # get activity
         a = dlg['prov:activity']
-        if a in pej.get('activity', {}):
-            act = pej['activity'][a]
-        else:
-            act = get_prov_es_json(a)['_source']['prov_es_json']['activity'][a]
-        viz_dict['nodes'].append(get_activity_node(a, act))
-        nodes.append(a)
-        expand_activity_prov(a, act, pem, pej, nodes, viz_dict, associations, a2e_relations)
-        
-        # get delegate agent
         dlg_ag = dlg['prov:delegate']
-        if dlg_ag in pej.get('agent', {}):
-            dlg_agent = pej['agent'][dlg_ag]
-        else:
-            dlg_agent = get_prov_es_json(dlg_ag)['_source']['prov_es_json']['agent'][dlg_ag]
-        viz_dict['nodes'].append(get_agent_node(dlg_ag, dlg_agent))
-        nodes.append(dlg_ag)
-        #expand_agent_prov(ag, agent, pem, pej, nodes, viz_dict, associations)
-
-        # get responsible agent
         rsp_ag = dlg['prov:responsible']
-        if rsp_ag in pej.get('agent', {}):
-            rsp_agent = pej['agent'][rsp_ag]
-        else:
-            rsp_agent = get_prov_es_json(rsp_ag)['_source']['prov_es_json']['agent'][rsp_ag]
-        viz_dict['nodes'].append(get_agent_node(rsp_ag, rsp_agent))
-        nodes.append(rsp_ag)
-        #expand_agent_prov(ag, agent, pem, pej, nodes, viz_dict, associations)
-
+        add_activity(a)
+        add_agent(dlg_ag)
+        add_agent(rsp_ag)
         delegations.append({
             'source': dlg_ag,
             'target': rsp_ag,
             'doc': dlg,
         })
 
-    # modify color of entities that are inputs and outputs or just outputs
-    new_nodes = []
-    for n in viz_dict['nodes']:
-        if n['id'] in input_ents and n['id'] in output_ents:
-            n['group'] = 6
-        elif n['id'] in output_ents:
-            n['group'] = 5
-        elif n['id'] in input_ents:
-            n['group'] = 4
-        new_nodes.append(n)
-    viz_dict['nodes'] = new_nodes
-    
     # add association links
-    asc_dict = {}
     for a in associations:
-        asc = "%s_%s" % (a['source'], a['target'])
-        if asc in asc_dict: continue
-        viz_dict['links'].append({
-            'source': nodes.index(a['source']),
-            'target': nodes.index(a['target']),
-            'type': 'associated',
-            'concept': 'prov:wasAssociatedWith',
-            'value': 1,
-            'doc': a.get('doc', None),
-        })
-        asc_dict[asc] = True
+        graph.add_link(a['source'], a['target'], 'associated',
+                       'prov:wasAssociatedWith', a.get('doc', None), unique=True)
 
     # add delegation links
-    dlg_dict = {}
     for d in delegations:
-        dlg = "%s_%s" % (d['source'], d['target'])
-        if dlg in dlg_dict: continue
-        viz_dict['links'].append({
-            'source': nodes.index(d['source']),
-            'target': nodes.index(d['target']),
-            'type': 'delegated',
-            'concept': 'prov:actedOnBehalfOf',
-            'value': 1,
-            'doc': d.get('doc', None),
-        })
-        dlg_dict[dlg] = True
+        graph.add_link(d['source'], d['target'], 'delegated',
+                       'prov:actedOnBehalfOf', d.get('doc', None), unique=True)
 
     # add e2e_relations links
-    e2e_rel_dict = {}
     for r in e2e_relations:
-        rel = "%s_%s" % (r['source'], r['target'])
-        if rel in e2e_rel_dict: continue
-        if r['source'] not in nodes or r['target'] not in nodes: continue
-        viz_dict['links'].append({
-            'source': nodes.index(r['source']),
-            'target': nodes.index(r['target']),
-            'type': 'e2e_related',
-            'concept': r['concept'],
-            'value': 1,
-            'doc': r.get('doc', None),
-        })
-        e2e_rel_dict[rel] = True
+        if r['source'] not in graph or r['target'] not in graph: continue
+        graph.add_link(r['source'], r['target'], 'e2e_related',
+                       r['concept'], r.get('doc', None), unique=True)
 
     # add a2e_relations links
-    a2e_rel_dict = {}
     for r in a2e_relations:
-        rel = "%s_%s" % (r['source'], r['target'])
-        if rel in a2e_rel_dict: continue
-        if r['source'] not in nodes or r['target'] not in nodes: continue
-        viz_dict['links'].append({
-            'source': nodes.index(r['source']),
-            'target': nodes.index(r['target']),
-            'type': 'a2e_related',
-            'concept': r['concept'],
-            'value': 1,
-            'doc': r.get('doc', None),
-        })
-        a2e_rel_dict[rel] = True
+        if r['source'] not in graph or r['target'] not in graph: continue
+        graph.add_link(r['source'], r['target'], 'a2e_related',
+                       r['concept'], r.get('doc', None), unique=True)
 
+    viz_dict = graph.get_viz_dict()
     #current_app.logger.debug("viz_dict: %s" % json.dumps(viz_dict, indent=2))
+
+    # don't cache graphs with unresolved references; they may be indexed later
+    if all(len(doc) > 0 for doc in resolved.itervalues()):
+        graph_cache.set(key, viz_dict)
     return viz_dict
        
 
@@ -454,60 +393,164 @@ def fdl_data():
     if lineage == "false":
         viz_dict = parse_d3(get_prov_es_json(id)['_source']['prov_es_json'])
     else:
-        es_url = current_app.config['ES_URL']
-        es_index = current_app.config['PROVES_ES_ALIAS']
-        query = { 'query': { 'query_string': { 'query': '"%s"' % id } } }
-        #current_app.logger.debug("ES query for query(): %s" % json.dumps(query, indent=2))
-        r = requests.post('%s/%s/_search?search_type=scan&scroll=60m&size=100' %
-                          (es_url, es_index), data=json.dumps(query))
-        scan_result = r.json()
-        if r.status_code != 200:
-            current_app.logger.debug("Failed to query ES. Got status code %d:\n%s" %
-                                     (r.status_code, json.dumps(scan_result, indent=2)))
-        r.raise_for_status()
-
-        # get results
-        results = []
-        scroll_id = scan_result['_scroll_id']
-        while True:
-            r = requests.post('%s/_search/scroll?scroll=10m' % es_url, data=scroll_id)
-            res = r.json()
-            scroll_id = res['_scroll_id']
-            if len(res['hits']['hits']) == 0: break
-            results.extend(res['hits']['hits'])
-
-            # break at 100 results or else FDL gets overwhelmed
-            if len(results) > 100: break
-
-        #current_app.logger.debug("result: %s" % pformat(r.json()))
-        merged_doc = {}
-        for d in results:
-            merged_doc = update_dict(merged_doc, d['_source']['prov_es_json'])
+        direction = request.args.get('direction', 'both')
+        if direction not in DIRECTIONS:
+            return jsonify({
+                'success': False,
+                'message': "Invalid direction %s. Must be one of %s." % (direction, ", ".join(DIRECTIONS))
+            }), 500
+        try:
+            depth = int(request.args.get('depth', current_app.config['LINEAGE_DEPTH']))
+            max_nodes = int(request.args.get('max_nodes', current_app.config['LINEAGE_NODE_BUDGET']))
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'message': "Invalid depth or max_nodes specified."
+            }), 500
+        depth = max(1, min(depth, current_app.config['LINEAGE_DEPTH_MAX']))
+        max_nodes = max(1, min(max_nodes, current_app.config['LINEAGE_NODE_BUDGET']))
+        merged_doc, lineage_info = traverse_lineage(id, depth, direction, max_nodes,
+                                                    current_app.config['LINEAGE_HOP_SIZE'])
         #current_app.logger.debug("merged_doc: %s" % json.dumps(merged_doc, indent=2))
-        viz_dict = parse_d3(merged_doc)
+        viz_dict = dict(parse_d3(merged_doc))
+        viz_dict['lineage'] = lineage_info
+
+    # add positions computed from the graph just built
+    layout = request.args.get('layout', 'false')
+    if layout != "false":
+        engine = current_app.config['LAYOUT_ENGINE'] if layout == "true" else layout
+        if engine not in LAYOUT_ENGINES:
+            return invalid_engine_response(engine)
+
+        # parse_d3() results are cached so lay out copies of the nodes
+        viz_dict = dict(viz_dict)
+        viz_dict['nodes'] = [dict(node_data) for node_data in viz_dict['nodes']]
+        try: viz_dict = layout_viz_dict(viz_dict, engine)
+        except (LayoutBusy, LayoutTimeout), e:
+            return layout_busy_response(e)
 
     #current_app.logger.debug("fdl_data viz_dict: %s" % json.dumps(viz_dict, indent=2))
     return jsonify(viz_dict)
 
 
+def layout_viz_dict(viz_dict, engine, pinned=None):
+    """Add positions to viz dict. Full layouts are cached by engine and graph
+    topology. If the layout pool is saturated, add a degraded layout instead
+    or reraise if LAYOUT_DEGRADE is off or the graph has more than
+    LAYOUT_DEGRADE_NODES nodes."""
+
+    key = None if pinned else get_topology_key(viz_dict)
+    if key is not None: key = "%s:%s" % (engine, key)
+    positions = layout_cache.get(key) if key is not None else None
+    if positions is not None: return set_positions(viz_dict, positions)
+    try:
+        viz_dict = add_layout_positions(viz_dict, engine, pinned)
+        if key is not None: layout_cache.set(key, get_positions(viz_dict))
+    except (LayoutBusy, LayoutTimeout), e:
+        current_app.logger.warning("Layout of %d nodes failed: %s" % (len(viz_dict['nodes']), str(e)))
+        if not current_app.config['LAYOUT_DEGRADE'] or \
+           len(viz_dict['nodes']) > current_app.config['LAYOUT_DEGRADE_NODES']: raise
+        viz_dict = add_degraded_positions(viz_dict)
+        viz_dict['degraded'] = True
+    return viz_dict
+
+
+def invalid_engine_response(engine):
+    """Return error response for an unknown layout engine."""
+
+    return jsonify({
+        'success': False,
+        'message': "Invalid layout engine %s. Must be one of %s." % (engine, ", ".join(sorted(LAYOUT_ENGINES)))
+    }), 500
+
+
+def layout_busy_response(e):
+    """Return 503 response for a layout rejected by the layout pool."""
+
+    response = jsonify({
+        'success': False,
+        'message': "Layout service busy: %s" % str(e)
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(current_app.config['LAYOUT_TIMEOUT'])
+    return response
+
+
+def parse_topology(topology):
+    """Return viz dict of a compact topology: a dict with the list of node
+    ids, links as [source index, target index] and optional node positions
+    as [x, y] or null for nodes to be laid out."""
+
+    ids = topology['nodes']
+    positions = topology.get('positions', None) or [None] * len(ids)
+    if len(positions) != len(ids):
+        raise ValueError("Got %d positions for %d nodes." % (len(positions), len(ids)))
+    nodes = []
+    for id, position in zip(ids, positions):
+        node_data = {'id': id}
+        if position is not None: node_data['gv_x'], node_data['gv_y'] = position
+        nodes.append(node_data)
+    links = []
+    for source, target in topology['links']:
+        if not (0 <= source < len(ids) and 0 <= target < len(ids)):
+            raise ValueError("Invalid link %s -> %s." % (source, target))
+        links.append({'source': source, 'target': target})
+    return {'nodes': nodes, 'links': links}
+
+
 @main.route('/fdl/data/layout', methods=['POST'])
-@cache.cached(timeout=1000)
 def layout():
-    """Return graphviz locations for FDL data for visualization."""
+    """Return graphviz locations for FDL data for visualization.
 
-    # get viz dict
+    Takes either the full viz_dict or a compact topology, in which case only
+    the list of [x, y] node positions is returned."""
+
+    # get viz dict or topology
     viz_dict = request.form.get('viz_dict', None)
-    if viz_dict is None:
+    topology = request.form.get('topology', None)
+    if viz_dict is None and topology is None:
         return jsonify({
             'success': False,
-            'message': "No viz_dict specified."
+            'message': "No viz_dict or topology specified."
         }), 500
-    viz_dict = json.loads(viz_dict)
+    if topology is not None:
+        try: viz_dict = parse_topology(json.loads(topology))
+        except (ValueError, KeyError, TypeError), e:
+            return jsonify({
+                'success': False,
+                'message': "Invalid topology: %s" % str(e)
+            }), 500
+    else: viz_dict = json.loads(viz_dict)
+
+    # get layout engine
+    engine = request.values.get('engine', current_app.config['LAYOUT_ENGINE'])
+    if engine not in LAYOUT_ENGINES:
+        return invalid_engine_response(engine)
+
+    # in incremental mode nodes that already have positions stay in place
+    if request.values.get('incremental', 'false') == 'true':
+        pinned = get_pinned_positions(viz_dict)
+    else: pinned = {}
+
+    # add positions
+    try: viz_dict = layout_viz_dict(viz_dict, engine, pinned)
+    except (LayoutBusy, LayoutTimeout), e:
+        return layout_busy_response(e)
+    if topology is None: return jsonify(viz_dict)
+    result = {
+        'positions': [[node_data['gv_x'], node_data['gv_y']] for node_data in viz_dict['nodes']]
+    }
+    if viz_dict.get('degraded', False): result['degraded'] = True
+    return jsonify(result)
 
-    # add graphviz position
-    viz_dict = add_graphviz_positions(viz_dict)
 
-    return jsonify(viz_dict)
+@main.route('/fdl/data/layout/stats', methods=['GET'])
+def layout_stats():
+    """Return layout cache and pool statistics."""
+
+    stats = layout_cache.stats()
+    stats['pool'] = layout_pool.stats()
+    return jsonify(stats)
 
 
 @main.route('/search_bundle', methods=['GET'])
@@ -523,11 +566,24 @@ def search_bundle():
             'message': "No id specified."
         }), 500
 
-    # query
+    # query docs referencing the id in relation attributes, expansion
+    # predicates or bundle member lists; all exact matches on raw fields
+    pem = get_expansion_map()
+    fields = set(['entity', 'activity', 'agent'])
+    for rel in PROV_RELATIONS:
+        fields.add(rel)
+        fields.update(PROV_RELATIONS[rel])
+    fields.update(pem.predicates)
     query = {
         "query": {
-            "query_string": {
-                "query": '"%s"' % id
+            "bool": {
+                "should": [
+                    { "ids": { "values": [ id ] } },
+                    { "multi_match": {
+                        "query": id,
+                        "fields": [ "%s.raw" % f for f in sorted(fields) ]
+                    } }
+                ]
             }
         }
     }
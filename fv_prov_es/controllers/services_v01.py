@@ -1,13 +1,18 @@
 import os, sys, json, requests, traceback
 from datetime import datetime
 
-from flask import Blueprint, request, redirect, url_for, Response, current_app
+from flask import (Blueprint, request, redirect, url_for, Response, current_app, jsonify,
+                   stream_with_context)
 from flask.ext.restplus import Api, apidoc, Resource, fields
 from flask.ext.login import login_user, logout_user, login_required
 
-from fv_prov_es import cache
-from fv_prov_es.lib.utils import get_prov_es_json, get_ttl
-from fv_prov_es.lib.import_utils import get_es_conn, import_prov
+from fv_prov_es import cache, es, id_resolver, query_cache, facet_counts
+from fv_prov_es.lib.utils import (get_prov_es_json, get_ttl, convert_prov,
+                                  PROVCONVERT_FORMATS)
+from fv_prov_es.lib.provconvert_pool import ConverterBusy
+from fv_prov_es.lib.export_utils import (make_export_response, warm_exports, iter_scan,
+                                         iter_id_hits, iter_ndjson, iter_zip, EXPORT_FORMATS)
+from fv_prov_es.lib.import_utils import create_index, import_prov, record_indexed, BulkIndexer
 
 
 NAMESPACE = "prov_es"
@@ -31,8 +36,12 @@ def swagger_ui():
 class Query(Resource):
     """Query ElasticSearch index and return results as a JSONP response."""
 
-    @api.doc(params={ 'callback': 'JSONP callback function name',
-                      'source'  : 'JSON query source string'})
+    @api.doc(params={ 'callback'     : 'JSONP callback function name',
+                      'source'       : 'JSON query source string',
+                      'profile'      : 'name of a server-defined _source projection, e.g. list or detail',
+                      'passthrough'  : "if 'true', stream the raw ES response without parsing it; " +
+                                       "facets are computed by ES and results are not cached",
+                      'legacy_fields': "with passthrough, if 'false', don't copy hit _source into fields" })
     def get(self):
         # get callback, source
         callback = request.args.get('callback', None)
@@ -44,31 +53,148 @@ class Query(Resource):
             return {'success': False,
                     'message': "Missing source parameter."}, 400
     
-        # query
-        es_url = current_app.config['ES_URL']
+        # project hit sources
+        profile = request.args.get('profile', current_app.config['QUERY_DEFAULT_PROFILE'])
+        if profile is not None:
+            profiles = current_app.config['QUERY_PROFILES']
+            if profile not in profiles:
+                return {'success': False,
+                        'message': "Invalid profile %s. Use one of: %s." %
+                                   (profile, ", ".join(sorted(profiles)))}, 400
+            try: source = apply_profile(source, profiles[profile])
+            except ValueError, e:
+                return {'success': False,
+                        'message': "Invalid source: %s" % str(e)}, 400
+
+        # stream ES response bytes into the JSONP wrapper; the response is
+        # raw ES output, so precomputed facets aren't served, results aren't
+        # cached and hit locations aren't remembered for lookups by id
         es_index = current_app.config['PROVES_ES_ALIAS']
-        #current_app.logger.debug("ES query for query(): %s" % json.dumps(json.loads(source), indent=2))
-        r = requests.post('%s/%s/_search' % (es_url, es_index), data=source.encode('utf-8'))
-        result = r.json()
-        if r.status_code != 200:
-            message = "Failed to query ES. Got status code %d:\n%s" % \
-                      (r.status_code, json.dumps(result, indent=2))
-            current_app.logger.debug(message)
-            return {'success': False, 'message': message}, 500
-        #current_app.logger.debug("result: %s" % pformat(r.json()))
-    
-        # return only one url
-        for hit in result['hits']['hits']:
-            # emulate result format from ElasticSearch <1.0
-            #current_app.logger.debug("hit: %s" % pformat(hit))
-            if '_source' in hit: hit.setdefault('fields', {}).update(hit['_source'])
-            hit['fields']['_type'] = hit['_type']
+        if request.args.get('passthrough', 'false').lower() == 'true':
+            r = es.post('/%s/_search' % es_index, data=source.encode('utf-8'), stream=True)
+            if r.status_code != 200:
+                message = "Failed to query ES. Got status code %d:\n%s" % \
+                          (r.status_code, r.text)
+                current_app.logger.debug(message)
+                return {'success': False, 'message': message}, 500
+            legacy = request.args.get('legacy_fields', 'true').lower() != 'false'
+            return Response(iter_jsonp(callback, r, LEGACY_FIELDS_JS if legacy else None),
+                            mimetype="application/javascript")
+
+        # query; identical queries share cached or in-flight results
+        try: result = query_cache.get(query_cache.key(es_index, source),
+                                      lambda: run_query(es_index, source))
+        except QueryError, e:
+            current_app.logger.debug(str(e))
+            return {'success': False, 'message': str(e)}, 500
     
         # return JSONP
-        return Response('%s(%s)' % (callback, json.dumps(result)),
+        return Response('%s(%s)' % (callback, result),
                         mimetype="application/javascript")
 
 
+def apply_profile(source, projection):
+    """Return JSON query source with a _source projection. _source is
+       dropped from requested fields since it would return the full source."""
+
+    query = json.loads(source)
+    if '_source' in query.get('fields', []):
+        query['fields'] = [f for f in query['fields'] if f != '_source']
+    query['_source'] = projection
+    return json.dumps(query)
+
+
+# JavaScript function emulating the result format from ElasticSearch <1.0
+# in the client: copies hit _source into fields and sets fields._type
+LEGACY_FIELDS_JS = "(function(r){var h=r.hits.hits;for(var i=0;i<h.length;i++){" + \
+                   "var f=h[i].fields=h[i].fields||{},s=h[i]._source;" + \
+                   "for(var k in s)if(s.hasOwnProperty(k))f[k]=s[k];f._type=h[i]._type;}return r;})"
+
+
+def iter_jsonp(callback, r, transform=None):
+    """Yield JSONP wrapping the body of a streamed ES response, passed
+       through a JavaScript transform function if given."""
+
+    if transform: prefix, suffix = '%s(%s(' % (callback, transform), '))'
+    else: prefix, suffix = '%s(' % callback, ')'
+    try:
+        yield prefix
+        for chunk in r.iter_content(65536): yield chunk
+        yield suffix
+    finally:
+        r.close()
+
+
+class QueryError(Exception):
+    """Raised when ES fails to execute a query."""
+    pass
+
+
+def run_query(es_index, source):
+    """Query ElasticSearch index and return the results as JSON. Facets that
+       are precomputed are left out of the ES query and added to the result."""
+
+    #current_app.logger.debug("ES query for query(): %s" % json.dumps(json.loads(source), indent=2))
+    facets = {}
+    try: query = json.loads(source)
+    except ValueError: pass
+    else:
+        facets = facet_counts.serve(query)
+        if facets: source = json.dumps(query)
+    r = es.post('/%s/_search' % es_index, data=source.encode('utf-8'))
+    result = r.json()
+    if r.status_code != 200:
+        raise QueryError("Failed to query ES. Got status code %d:\n%s" %
+                         (r.status_code, json.dumps(result, indent=2)))
+    #current_app.logger.debug("result: %s" % pformat(r.json()))
+
+    # remember indices of hits for lookups of their documents by id
+    id_resolver.remember(result['hits']['hits'])
+
+    # return only one url
+    for hit in result['hits']['hits']:
+        # emulate result format from ElasticSearch <1.0
+        #current_app.logger.debug("hit: %s" % pformat(hit))
+        if '_source' in hit: hit.setdefault('fields', {}).update(hit['_source'])
+        hit['fields']['_type'] = hit['_type']
+    if facets: result.setdefault('facets', {}).update(facets)
+    return json.dumps(result)
+
+
+@ns.route('/facets', endpoint='facets')
+@api.doc(responses={ 200: "Success",
+                     400: "Invalid parameters",
+                     503: "Facet counts not available" },
+         description="Return precomputed facet counts of all PROV-ES documents or of one concept.")
+class Facets(Resource):
+    """Return precomputed facet counts."""
+
+    @api.doc(params={ 'concept': 'count only documents of this concept, e.g. entity',
+                      'size'   : 'max terms per terms facet (default 10, at most FACET_TERMS_SIZE)'})
+    def get(self):
+        concept = request.args.get('concept', None)
+        try: size = int(request.args.get('size', 10))
+        except ValueError: size = -1
+        if not 0 <= size <= facet_counts.terms_size:
+            return {'success': False,
+                    'message': "Invalid size parameter. Must be 0 to %d." % facet_counts.terms_size}, 400
+
+        snapshot = facet_counts.current()
+        if snapshot is None:
+            return {'success': False,
+                    'message': "Facet counts are not available: %s" %
+                               facet_counts.last_error}, 503
+        facets = {}
+        for field in facet_counts.terms_fields:
+            facets[field] = snapshot.get_terms_facet(field, concept, size)
+        for field in facet_counts.date_fields:
+            facets[field] = snapshot.get_date_histogram_facet(field, concept)
+        return {'success': True,
+                'message': "",
+                'watermark': snapshot.watermark,
+                'facets': facets}
+
+
 @ns.route('/json', endpoint='prov_es_json')
 @api.doc(responses={ 200: "Success",
                      400: "Invalid parameters",
@@ -124,14 +250,12 @@ def download_prov_es_json():
             'message': "No id specified."
         }), 500
 
-    pej = get_prov_es_json(id)
-    if pej is None:
+    response = make_export_response(id, 'json')
+    if response is None:
         return jsonify({
             'success': False,
             'message': "No document found with id %s." % id
         }), 500
-    response = Response(json.dumps(pej['_source']['prov_es_json'], indent=2))
-    response.headers["Content-Disposition"] = "attachment; filename=prov_es.json"
     return response
 
 
@@ -202,11 +326,116 @@ def download_prov_es_ttl():
             'message': "No id specified."
         }), 500
 
-    # return turtle
+    # stream turtle
+    response = make_export_response(id, 'ttl')
+    if response is None:
+        return jsonify({
+            'success': False,
+            'message': "No PROV-ES document found with id %s." % id
+        }), 500
+    return response
+
+
+@services.route('/%s/download/<any(%s):fmt>' % (NAMESPACE, ", ".join(sorted(PROVCONVERT_FORMATS))),
+                endpoint="download_prov_es_format", methods=['GET'])
+def download_prov_es_format(fmt):
+
+    # get id
+    id = request.args.get('id', None)
+    if id is None:
+        return jsonify({
+            'success': False,
+            'message': "No id specified."
+        }), 500
+
+    # convert with provconvert
     j = get_prov_es_json(id)
-    ttl = get_ttl(j['_source']['prov_es_json'])
-    response = Response(ttl)
-    response.headers["Content-Disposition"] = "attachment; filename=prov_es.ttl"
+    if len(j) == 0:
+        return jsonify({
+            'success': False,
+            'message': "No PROV-ES document found with id %s." % id
+        }), 500
+    try: output = convert_prov(j['_source']['prov_es_json'], fmt)
+    except ConverterBusy, e:
+        response = jsonify({
+            'success': False,
+            'message': "Converter busy: %s" % str(e)
+        })
+        response.status_code = 503
+        response.headers['Retry-After'] = str(current_app.config['PROVCONVERT_QUEUE_TIMEOUT'])
+        return response
+    except Exception, e:
+        return jsonify({
+            'success': False,
+            'message': "Failed to convert PROV-ES document for id %s: %s" % (id, str(e))
+        }), 500
+    response = Response(output, mimetype=PROVCONVERT_FORMATS[fmt])
+    response.headers["Content-Disposition"] = "attachment; filename=prov_es.%s" % fmt
+    return response
+
+
+@services.route('/%s/download/bulk' % NAMESPACE,
+                endpoint="download_prov_es_bulk", methods=['GET', 'POST'])
+def download_prov_es_bulk():
+    """Download many PROV-ES documents selected by ids (repeated id or comma
+       separated ids parameters) or by a JSON query source as NDJSON or as a
+       zip archive of json or ttl files. Documents are read from ES in
+       batches and streamed as they are serialized."""
+
+    # get ids or query
+    ids = []
+    seen = set()
+    for i in request.values.getlist('id') + ",".join(request.values.getlist('ids')).split(','):
+        i = i.strip()
+        if i == '' or i in seen: continue
+        seen.add(i)
+        ids.append(i)
+    source = request.values.get('source', None)
+    if len(ids) == 0 and source is None:
+        return jsonify({
+            'success': False,
+            'message': "No ids or query source specified."
+        }), 400
+
+    # get output format
+    fmt = request.values.get('format', 'ndjson')
+    files = request.values.get('files', 'json')
+    if fmt not in ('ndjson', 'zip') or files not in EXPORT_FORMATS:
+        return jsonify({
+            'success': False,
+            'message': "Invalid format %s or files %s." % (fmt, files)
+        }), 400
+
+    # read documents by id in batches or scroll through query hits; paging
+    # and aggregations of the query source are ignored
+    batch_size = current_app.config['EXPORT_BULK_BATCH_SIZE']
+    if len(ids) > 0: hits = iter_id_hits(ids, batch_size)
+    else:
+        try:
+            source = json.loads(source)
+            query = { 'query': source.get('query', { 'match_all': {} }),
+                      '_source': [ 'prov_es_json' ] }
+            if 'filter' in source: query['filter'] = source['filter']
+        except Exception, e:
+            return jsonify({
+                'success': False,
+                'message': "Invalid query source: %s" % str(e)
+            }), 400
+        try: hits = iter_scan(current_app.config['PROVES_ES_ALIAS'], query, batch_size,
+                              current_app.config['EXPORT_BULK_SCROLL'])
+        except Exception, e:
+            return jsonify({
+                'success': False,
+                'message': "Failed to query PROV-ES documents: %s" % str(e)
+            }), 500
+
+    if fmt == 'ndjson':
+        response = Response(stream_with_context(iter_ndjson(hits)),
+                            mimetype='application/x-ndjson')
+    else:
+        response = Response(stream_with_context(iter_zip(hits, files)),
+                            mimetype='application/zip')
+    response.headers["Content-Disposition"] = "attachment; filename=prov_es.%s" % fmt
     return response
 
 
@@ -321,13 +550,18 @@ class ImportProvEs(Resource):
                      'result': {} }, 500
 
         # import prov
-        es_url = current_app.config['ES_URL']
         dt = datetime.utcnow()
         es_index = "%s-%04d.%02d.%02d" % (current_app.config['PROVES_ES_PREFIX'],
                                           dt.year, dt.month, dt.day)
         alias = current_app.config['PROVES_ES_ALIAS']
-        conn = get_es_conn(es_url, es_index, alias)
-        try: import_prov(conn, es_index, alias, pej)
+        edge_index = current_app.config['PROVES_ES_EDGE_INDEX']
+        create_index(es, es_index, alias)
+        if edge_index is not None: create_index(es, edge_index)
+        bulk = BulkIndexer(es, current_app.config['ES_BULK_MAX_ACTIONS'],
+                           current_app.config['ES_BULK_MAX_BYTES'], record_indexed)
+        try:
+            written = import_prov(es, es_index, alias, pej, edge_index, bulk)
+            bulk.flush()
         except Exception, e:
             current_app.logger.debug("Got error: %s" % e)
             current_app.logger.debug("Traceback: %s" % traceback.format_exc())
@@ -337,6 +571,19 @@ class ImportProvEs(Resource):
                      'message': message,
                      'result': {} }, 500
 
+        # report documents that failed to index
+        if len(bulk.errors) > 0:
+            message = "Failed to index %d of %d documents: %s" % \
+                      (len(bulk.errors), len(bulk.errors) + bulk.indexed,
+                       json.dumps(bulk.errors))
+            current_app.logger.debug(message)
+            return { 'success': False,
+                     'message': message,
+                     'result': {} }, 500
+
+        # generate downloads of the new documents
+        if current_app.config['EXPORT_EAGER']: warm_exports(written)
+
         # return result
         return { 'success': True,
                  'message': "" }
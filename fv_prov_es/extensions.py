@@ -4,10 +4,50 @@ from flask.ext.login import LoginManager
 from flask_assets import Environment
 
 from fv_prov_es.models import User
+from fv_prov_es.lib.es_client import ESClient
+from fv_prov_es.lib.cache_utils import LRUCache, DocCache, ExportCache, QueryCache
+from fv_prov_es.lib.expansion_map import ExpansionMap
+from fv_prov_es.lib.facet_utils import FacetCounts
+from fv_prov_es.lib.id_resolver import IdResolver
+from fv_prov_es.lib.layout_pool import LayoutPool
+from fv_prov_es.lib.provconvert_pool import ProvConvertPool
 
 # Setup flask cache
 cache = Cache()
 
+# pooled ElasticSearch client
+es = ESClient()
+
+# index locations of PROV-ES document ids
+id_resolver = IdResolver()
+
+# PROV-ES document cache
+doc_cache = DocCache()
+
+# serialized exports keyed by format, id and content hash
+export_cache = ExportCache()
+
+# JSONP query responses keyed by normalized query source
+query_cache = QueryCache()
+
+# precomputed facet counts
+facet_counts = FacetCounts()
+
+# parse_d3 results keyed by content hash
+graph_cache = LRUCache(config_prefix='GRAPH_CACHE')
+
+# node positions keyed by graph topology
+layout_cache = LRUCache(config_prefix='LAYOUT_CACHE')
+
+# bounded pool of layout processes
+layout_pool = LayoutPool()
+
+# warm provconvert processes for format conversions
+provconvert = ProvConvertPool()
+
+# compiled concept expansion map
+expansion_map = ExpansionMap()
+
 # init flask assets
 assets_env = Environment()
 
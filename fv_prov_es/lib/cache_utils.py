@@ -0,0 +1,313 @@
+import json, time, hashlib, threading, collections
+from werkzeug.contrib.cache import FileSystemCache
+
+
+class LRUCache(object):
+    """Thread-safe size-bounded LRU cache with optional expiry in seconds.
+    Counts hits, misses and evictions.
+
+    If config_prefix is set, init_app() reads the size and expiry from the
+    <config_prefix>_SIZE and <config_prefix>_TTL settings.
+    """
+
+    def __init__(self, maxsize=1000, ttl=None, config_prefix=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.config_prefix = config_prefix
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Configure cache from app config."""
+
+        self.maxsize = app.config.get('%s_SIZE' % self.config_prefix, self.maxsize)
+        self.ttl = app.config.get('%s_TTL' % self.config_prefix, self.ttl)
+        self.clear()
+        app.extensions[self.config_prefix.lower()] = self
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        """Return cached value and mark it as most recently used."""
+
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is None or (item[1] is not None and item[1] < time.time()):
+                self.misses += 1
+                return default
+            self._data[key] = item
+            self.hits += 1
+            return item[0]
+
+    def set(self, key, value):
+        """Cache value, evicting least recently used entries over maxsize."""
+
+        if self.maxsize <= 0: return
+        expires = None if self.ttl is None else time.time() + self.ttl
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, expires)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        """Remove key; return True if it was cached."""
+
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """Return dict of cache size and counters."""
+
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': float(self.hits) / lookups if lookups else 0.,
+        }
+
+
+class TieredCache(object):
+    """Base of caches with a per-worker LRU tier and, if a cache directory
+    is configured, a filesystem tier shared by all workers and scripts on
+    the host. Values found in the shared tier are promoted to the local one.
+    """
+
+    def __init__(self, maxsize, ttl=None, cache_dir=None, dir_threshold=500,
+                 dir_ttl=300):
+        self.configure(maxsize, ttl, cache_dir, dir_threshold, dir_ttl)
+
+    def configure(self, maxsize, ttl=None, cache_dir=None, dir_threshold=500,
+                  dir_ttl=300):
+        """(Re)create both tiers and reset counters."""
+
+        self.local = LRUCache(maxsize, ttl)
+        self.shared = None
+        self.shared_hits = 0
+        if cache_dir is not None:
+            self.shared = FileSystemCache(cache_dir, dir_threshold, dir_ttl)
+
+    def init_tiers(self, app, config_prefix, dir_threshold, dir_ttl):
+        """Configure both tiers from the <config_prefix>_SIZE, _TTL, _DIR,
+        _DIR_THRESHOLD and _DIR_TTL settings."""
+
+        self.configure(app.config.get('%s_SIZE' % config_prefix, self.local.maxsize),
+                       app.config.get('%s_TTL' % config_prefix, self.local.ttl),
+                       app.config.get('%s_DIR' % config_prefix, None),
+                       app.config.get('%s_DIR_THRESHOLD' % config_prefix, dir_threshold),
+                       app.config.get('%s_DIR_TTL' % config_prefix, dir_ttl))
+
+    def get_value(self, key):
+        """Return cached value of key from either tier or None."""
+
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.shared_hits += 1
+                self.local.set(key, value)
+        return value
+
+    def set_value(self, key, value):
+        """Cache value in both tiers."""
+
+        self.local.set(key, value)
+        if self.shared is not None: self.shared.set(key, value)
+
+    def delete_value(self, key):
+        """Remove key from both tiers."""
+
+        self.local.delete(key)
+        if self.shared is not None: self.shared.delete(key)
+
+    def stats(self):
+        """Return dict of counters of both tiers."""
+
+        stats = self.local.stats()
+        stats['shared'] = self.shared is not None
+        stats['shared_hits'] = self.shared_hits
+        stats['misses'] -= self.shared_hits
+        lookups = stats['hits'] + stats['shared_hits'] + stats['misses']
+        stats['hit_rate'] = float(stats['hits'] + stats['shared_hits']) / lookups if lookups else 0.
+        return stats
+
+
+class DocCache(TieredCache):
+    """Cache of PROV-ES documents keyed by id in both tiers.
+
+    Documents are stored serialized so every get() returns a fresh copy
+    that callers are free to modify.
+    """
+
+    def __init__(self, maxsize=10000, ttl=300, cache_dir=None,
+                 dir_threshold=50000, dir_ttl=86400, namespace='prov_es'):
+        self.namespace = namespace
+        super(DocCache, self).__init__(maxsize, ttl, cache_dir, dir_threshold, dir_ttl)
+
+    def init_app(self, app):
+        """Configure cache from app config."""
+
+        self.namespace = app.config['PROVES_ES_ALIAS']
+        self.init_tiers(app, 'DOC_CACHE', 50000, 86400)
+        app.extensions['doc_cache'] = self
+
+    def _key(self, id):
+        return '%s/%s' % (self.namespace, id)
+
+    def get(self, id):
+        """Return cached document or None."""
+
+        value = self.get_value(self._key(id))
+        if value is None: return None
+        return json.loads(value)
+
+    def get_many(self, ids):
+        """Return dict of id to cached document for cached ids."""
+
+        docs = {}
+        for id in ids:
+            doc = self.get(id)
+            if doc is not None: docs[id] = doc
+        return docs
+
+    def set(self, id, doc):
+        """Cache document. Empty documents are not cached so that ids that
+        are indexed later are picked up."""
+
+        if not doc: return
+        self.set_value(self._key(id), json.dumps(doc))
+
+    def delete_many(self, ids):
+        """Invalidate cached documents."""
+
+        for id in ids: self.delete_value(self._key(id))
+
+
+class ExportCache(TieredCache):
+    """Cache of serialized document exports keyed by format, id and content
+    hash in both tiers. Since the key changes with the content, entries
+    never need to be invalidated.
+    """
+
+    def __init__(self, maxsize=1000, cache_dir=None, dir_threshold=10000,
+                 dir_ttl=604800):
+        super(ExportCache, self).__init__(maxsize, None, cache_dir, dir_threshold, dir_ttl)
+
+    def init_app(self, app):
+        """Configure cache from app config."""
+
+        self.init_tiers(app, 'EXPORT_CACHE', 10000, 604800)
+        app.extensions['export_cache'] = self
+
+    def _key(self, fmt, id, digest):
+        return 'export/%s/%s/%s' % (fmt, digest, id)
+
+    def get(self, fmt, id, digest):
+        """Return cached export or None."""
+
+        return self.get_value(self._key(fmt, id, digest))
+
+    def set(self, fmt, id, digest, value):
+        """Cache export."""
+
+        self.set_value(self._key(fmt, id, digest), value)
+
+
+class QueryCache(object):
+    """Short-lived cache of query responses keyed by index and normalized
+    query source. Concurrent misses of the same query are coalesced: the
+    first request computes the response while the others wait for it and
+    share its result or exception. Responses larger than max_bytes are not
+    cached.
+    """
+
+    def __init__(self, maxsize=500, ttl=10, max_bytes=1048576):
+        self.local = LRUCache(maxsize, ttl)
+        self.max_bytes = max_bytes
+        self.coalesced = 0
+        self.oversized = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Configure cache from app config."""
+
+        self.local = LRUCache(app.config.get('QUERY_CACHE_SIZE', self.local.maxsize),
+                              app.config.get('QUERY_CACHE_TTL', self.local.ttl))
+        self.max_bytes = app.config.get('QUERY_CACHE_MAX_BYTES', self.max_bytes)
+        self.coalesced = 0
+        self.oversized = 0
+        app.extensions['query_cache'] = self
+
+    def key(self, index, source):
+        """Return cache key of a JSON query source. Sources are normalized
+        so that formatting and key order do not matter; invalid JSON is
+        keyed as is."""
+
+        try: source = json.dumps(json.loads(source), sort_keys=True, separators=(',', ':'))
+        except ValueError: pass
+        if isinstance(source, unicode): source = source.encode('utf-8')
+        return 'query/%s/%s' % (index, hashlib.sha1(source).hexdigest())
+
+    def get(self, key, compute):
+        """Return cached response or the response of compute(), which is
+        called at most once at a time per key."""
+
+        with self._lock:
+            value = self.local.get(key)
+            if value is not None: return value
+            flight = self._flights.get(key, None)
+            leader = flight is None
+            if leader: flight = self._flights[key] = _Flight()
+            else: self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None: raise flight.error
+            return flight.value
+
+        try:
+            flight.value = compute()
+            if len(flight.value) <= self.max_bytes: self.local.set(key, flight.value)
+            else:
+                with self._lock: self.oversized += 1
+            return flight.value
+        except Exception, e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock: del self._flights[key]
+            flight.done.set()
+
+    def stats(self):
+        """Return dict of cache counters."""
+
+        stats = self.local.stats()
+        stats['in_flight'] = len(self._flights)
+        stats['coalesced'] = self.coalesced
+        stats['oversized'] = self.oversized
+        return stats
+
+
+class _Flight(object):
+    """Result of a computation other requests may wait for."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
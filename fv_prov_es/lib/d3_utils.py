@@ -39,3 +39,69 @@ def get_entity_node(id, doc):
         'prov_type': 'entity',
         'doc': doc,
     }
+
+
+class D3Graph(object):
+    """Indexed builder for d3 node/link data structures.
+
+    Nodes are deduplicated by id and resolved to their index in constant
+    time. Entity roles (input/output) are tracked in sets and merged into
+    the node group when the viz dict is generated.
+    """
+
+    def __init__(self):
+        self.nodes = []
+        self.node_index = {}
+        self.links = []
+        self.link_keys = set()
+        self.input_ents = set()
+        self.output_ents = set()
+
+    def __contains__(self, id):
+        return id in self.node_index
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def index(self, id):
+        """Return index of node."""
+
+        return self.node_index[id]
+
+    def add_node(self, node):
+        """Add d3 node. Return False if a node with the same id exists."""
+
+        if node['id'] in self.node_index: return False
+        self.node_index[node['id']] = len(self.nodes)
+        self.nodes.append(node)
+        return True
+
+    def add_link(self, source, target, type, concept, doc=None, unique=False):
+        """Add d3 link between two node ids. If unique is True, only one
+           link of this type is added per source/target pair."""
+
+        if unique:
+            key = (type, source, target)
+            if key in self.link_keys: return False
+            self.link_keys.add(key)
+        self.links.append({
+            'source': self.node_index[source],
+            'target': self.node_index[target],
+            'type': type,
+            'concept': concept,
+            'value': 1,
+            'doc': doc,
+        })
+        return True
+
+    def get_viz_dict(self):
+        """Return d3 viz dict with entity roles merged into node groups."""
+
+        # modify color of entities that are inputs and outputs or just outputs
+        for n in self.nodes:
+            is_input = n['id'] in self.input_ents
+            is_output = n['id'] in self.output_ents
+            if is_input and is_output: n['group'] = 6
+            elif is_output: n['group'] = 5
+            elif is_input: n['group'] = 4
+        return {'nodes': self.nodes, 'links': self.links}
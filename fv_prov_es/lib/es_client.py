@@ -0,0 +1,88 @@
+import os, json, requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+
+class ESClient(object):
+    """ElasticSearch HTTP client sharing a pooled keep-alive session.
+
+    Paths are relative to the ES url, e.g. es.post('/prov_es/_search', data=q).
+    The session is created lazily per process so that forked gunicorn
+    workers each get their own connection pool.
+    """
+
+    def __init__(self, url=None, pool_maxsize=20, connect_timeout=3.05,
+                 read_timeout=30, retries=2):
+        self.url = url
+        self.pool_maxsize = pool_maxsize
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self._session = None
+        self._pid = None
+
+    def init_app(self, app):
+        """Configure client from app config."""
+
+        self.url = app.config['ES_URL']
+        self.pool_maxsize = app.config.get('ES_POOL_MAXSIZE', self.pool_maxsize)
+        self.timeout = (app.config.get('ES_CONNECT_TIMEOUT', self.timeout[0]),
+                        app.config.get('ES_READ_TIMEOUT', self.timeout[1]))
+        self.retries = app.config.get('ES_RETRIES', self.retries)
+        self._session = None
+        app.extensions['es_client'] = self
+
+    @property
+    def session(self):
+        """Return requests session for this process."""
+
+        if self._session is None or self._pid != os.getpid():
+            # retry connection failures and gateway errors but not read
+            # timeouts, which would re-run expensive queries
+            retry = Retry(total=self.retries, read=0, backoff_factor=0.1,
+                          status_forcelist=(502, 503, 504), method_whitelist=False,
+                          raise_on_status=False)
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize,
+                                  max_retries=retry)
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._session = session
+            self._pid = os.getpid()
+        return self._session
+
+    def set_session(self, session):
+        """Send the requests of this process through session, e.g. a stub
+        in tests; None goes back to a pooled session."""
+
+        self._session = session
+        self._pid = os.getpid()
+
+    def request(self, method, path, **kwargs):
+        """Send request to ES and return the response."""
+
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.request(method, '%s%s' % (self.url, path), **kwargs)
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def head(self, path, **kwargs):
+        return self.request('HEAD', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request('PUT', path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request('DELETE', path, **kwargs)
+
+    def index(self, doc, index, doc_type, id=None):
+        """Index a document; same signature as pyes ES.index()."""
+
+        if id is None: r = self.post('/%s/%s' % (index, doc_type), data=json.dumps(doc))
+        else: r = self.put('/%s/%s/%s' % (index, doc_type, requests.utils.quote(id, safe='')),
+                           data=json.dumps(doc))
+        r.raise_for_status()
+        return r.json()
@@ -0,0 +1,92 @@
+import os, json, time, types, hashlib, threading
+
+
+class CompiledExpansionMap(object):
+    """Concept expansion map compiled into per-concept tables of
+    predicate -> (object type, object is link source)."""
+
+    def __init__(self, pem, version):
+        self.version = version
+        self.tables = {}
+        for concept, preds in pem.iteritems():
+            self.tables[concept] = dict((pred, (spec['type'], spec.get('source', False)))
+                                        for pred, spec in preds.iteritems())
+        self.predicates = frozenset([pred for table in self.tables.itervalues()
+                                     for pred in table])
+
+    def expansions(self, concept, doc):
+        """Return list of (predicate, object type, object is source, object
+           ids) for the expansion predicates present in a concept's doc."""
+
+        table = self.tables.get(concept)
+        if not table or not isinstance(doc, types.DictType): return []
+        expansions = []
+        for pred in sorted(table.viewkeys() & doc.viewkeys()):
+            obj_type, obj_is_source = table[pred]
+            obj_ids = doc[pred] if isinstance(doc[pred], (types.ListType, types.TupleType)) else [doc[pred]]
+            expansions.append((pred, obj_type, obj_is_source, obj_ids))
+        return expansions
+
+
+class ExpansionMap(object):
+    """Loads the concept expansion map once per process. A background thread
+    checks the file's mtime every check_interval seconds and recompiles the
+    map when it changes, so requests never touch the filesystem. Set
+    check_interval to 0 to disable reloading."""
+
+    def __init__(self, path=None, check_interval=30):
+        self.path = path
+        self.check_interval = check_interval
+        self._compiled = None
+        self._mtime = None
+        self._watcher_pid = None
+        self._lock = threading.Lock()
+        if path is not None: self.load()
+
+    def init_app(self, app):
+        """Configure and load map from app config."""
+
+        self.path = os.path.normpath(os.path.join(app.root_path,
+                                                  app.config['PROV_EXPANSION_CFG']))
+        self.check_interval = app.config.get('PROV_EXPANSION_CHECK_INTERVAL',
+                                             self.check_interval)
+        self.load()
+        app.extensions['expansion_map'] = self
+
+    def load(self):
+        """Read and compile the map file."""
+
+        mtime = os.stat(self.path).st_mtime
+        with open(self.path) as f:
+            data = f.read()
+        self._compiled = CompiledExpansionMap(json.loads(data),
+                                              hashlib.sha1(data).hexdigest())
+        self._mtime = mtime
+
+    def reload_if_changed(self):
+        """Reload map if the file changed. A missing or invalid file, e.g.
+           while it is being rewritten, keeps the current map."""
+
+        try:
+            if os.stat(self.path).st_mtime == self._mtime: return False
+            self.load()
+        except (OSError, IOError, ValueError):
+            return False
+        return True
+
+    def _watch(self):
+        while True:
+            time.sleep(self.check_interval)
+            self.reload_if_changed()
+
+    def get(self):
+        """Return current CompiledExpansionMap."""
+
+        if self.check_interval and self._watcher_pid != os.getpid():
+            with self._lock:
+                if self._watcher_pid != os.getpid():
+                    watcher = threading.Thread(target=self._watch)
+                    watcher.daemon = True
+                    watcher.start()
+                    self._watcher_pid = os.getpid()
+        return self._compiled
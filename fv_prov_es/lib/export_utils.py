@@ -0,0 +1,231 @@
+import json, zlib, hashlib, zipfile, urllib
+
+from flask import request, Response
+
+from fv_prov_es import es, doc_cache, export_cache, id_resolver
+from fv_prov_es.lib.ttl_utils import get_ttl, iter_ttl
+from fv_prov_es.lib.utils import get_prov_es_json, get_prov_es_jsons, get_json_hash
+
+
+def serialize_json(pej):
+    """Return pretty-printed PROV-ES JSON."""
+
+    return json.dumps(pej, indent=2)
+
+
+def serialize_ttl(pej):
+    """Return Turtle of PROV-ES JSON encoded as UTF-8."""
+
+    return get_ttl(pej).encode('utf-8')
+
+
+# export formats: (media type, serializer)
+EXPORT_FORMATS = {
+    'json': ('application/json', serialize_json),
+    'ttl':  ('text/turtle', serialize_ttl),
+}
+
+
+def iter_serialized(pej, fmt):
+    """Yield serialization of PROV-ES JSON in chunks; Turtle is generated
+    statement by statement."""
+
+    if fmt == 'ttl':
+        for chunk in iter_ttl(pej): yield chunk.encode('utf-8')
+    else: yield EXPORT_FORMATS[fmt][1](pej)
+
+
+def get_version_hash(hit):
+    """Return hash of the location and _version of a document hit, which
+    identifies the stored version of the document."""
+
+    return hashlib.sha1((u'%s/%s/%s/%d' % (hit['_index'], hit['_type'], hit['_id'],
+                                          hit['_version'])).encode('utf-8')).hexdigest()
+
+
+def iter_gzip(chunks):
+    """Yield gzip compression of chunks of data. The header has no timestamp
+    so the output only depends on the data."""
+
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data: yield data
+    yield compressor.flush()
+
+
+def gzip_data(data):
+    """Return gzip compressed data."""
+
+    return "".join(iter_gzip([data]))
+
+
+def get_export(id, pej, fmt, compressed=False, digest=None):
+    """Return serialized export of a PROV-ES JSON document from the export
+    cache, generating and caching it on a miss."""
+
+    if digest is None: digest = get_json_hash(pej)
+    variant = '%s.gz' % fmt if compressed else fmt
+    data = export_cache.get(variant, id, digest)
+    if data is None:
+        if compressed: data = gzip_data(get_export(id, pej, fmt, digest=digest))
+        else: data = EXPORT_FORMATS[fmt][1](pej)
+        export_cache.set(variant, id, digest, data)
+    return data
+
+
+def warm_exports(docs):
+    """Generate and cache all export variants of a dict of id to PROV-ES
+    JSON document."""
+
+    for id, pej in docs.iteritems():
+        digest = get_json_hash(pej)
+        for fmt in EXPORT_FORMATS:
+            get_export(id, pej, fmt, True, digest)
+
+
+def iter_export(id, pej, fmt, compressed=False):
+    """Yield serialized export of a PROV-ES JSON document. A cached export
+    is yielded whole; otherwise the export is streamed as it is generated
+    and cached once complete."""
+
+    digest = get_json_hash(pej)
+    variant = '%s.gz' % fmt if compressed else fmt
+    data = export_cache.get(variant, id, digest)
+    if data is not None:
+        yield data
+        return
+    chunks = []
+    serialized = iter_serialized(pej, fmt)
+    for chunk in iter_gzip(serialized) if compressed else serialized:
+        chunks.append(chunk)
+        yield chunk
+    export_cache.set(variant, id, digest, "".join(chunks))
+
+
+def make_export_response(id, fmt):
+    """Return download response of the PROV-ES JSON document of an id in the
+    specified format or None if it is not found. The strong ETag identifies
+    the stored version of the document, which is taken from the cached
+    document or read from ES without the source, so conditional requests
+    for a known ETag are answered with 304 before the document is fetched.
+    The gzip variant is served if accepted by the client."""
+
+    hit = doc_cache.get(id)
+    if hit is None or '_version' not in hit:
+        hit = id_resolver.get_version(id)
+        if hit is None: return None
+    compressed = request.accept_encodings['gzip'] > 0
+    get_etag = lambda hit: '%s-%s%s' % (get_version_hash(hit), fmt, '-gz' if compressed else '')
+    etag = get_etag(hit)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        if '_source' not in hit:
+            hit = get_prov_es_json(id)
+            if len(hit) == 0: return None
+            if '_version' in hit: etag = get_etag(hit)
+        response = Response(iter_export(id, hit['_source']['prov_es_json'], fmt, compressed),
+                            mimetype=EXPORT_FORMATS[fmt][0])
+        if compressed: response.headers['Content-Encoding'] = 'gzip'
+        response.headers['Content-Disposition'] = "attachment; filename=prov_es.%s" % fmt
+    response.set_etag(etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+
+class StreamBuffer(object):
+    """Write-only file object that holds written data until it is drained.
+    It reports its position so zipfile can write an archive to it without
+    seeking."""
+
+    def __init__(self):
+        self.chunks = []
+        self.pos = 0
+
+    def write(self, data):
+        self.chunks.append(data)
+        self.pos += len(data)
+
+    def tell(self):
+        return self.pos
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        """Return and forget data written since the last drain."""
+
+        data = "".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_scroll(scroll_id, scroll='5m'):
+    """Yield hits of an ES scroll. The scroll is cleared when exhausted or
+    when the generator is closed early."""
+
+    try:
+        while True:
+            r = es.post('/_search/scroll?scroll=%s' % scroll, data=scroll_id)
+            r.raise_for_status()
+            res = r.json()
+            scroll_id = res['_scroll_id']
+            if len(res['hits']['hits']) == 0: break
+            for hit in res['hits']['hits']: yield hit
+    finally:
+        try: es.delete('/_search/scroll', data=scroll_id)
+        except Exception: pass
+
+
+def iter_scan(index, query, size=100, scroll='5m'):
+    """Start a scan of all hits of a query and return a generator of them.
+    The scan is started right away so that query errors are raised before
+    a response is streamed."""
+
+    r = es.post('/%s/_search?search_type=scan&scroll=%s&size=%d' % (index, scroll, size),
+                data=json.dumps(query))
+    r.raise_for_status()
+    return iter_scroll(r.json()['_scroll_id'], scroll)
+
+
+def iter_id_hits(ids, batch_size=100):
+    """Yield PROV-ES documents of a list of ids read in batches; ids that are
+    not found are skipped."""
+
+    for i in range(0, len(ids), batch_size):
+        chunk = ids[i:i+batch_size]
+        docs = get_prov_es_jsons(chunk)
+        for id in chunk:
+            if id in docs: yield docs[id]
+
+
+def iter_ndjson(hits):
+    """Yield a line of JSON with id and PROV-ES JSON per document."""
+
+    for hit in hits:
+        yield json.dumps({'id': hit['_id'], 'prov_es_json': hit['_source']['prov_es_json']}) + "\n"
+
+
+def get_export_filename(id, fmt):
+    """Return archive file name of a document id; ids are URL quoted so
+    that distinct ids never share a name."""
+
+    if isinstance(id, unicode): id = id.encode('utf-8')
+    return '%s.%s' % (urllib.quote(id, safe=''), fmt)
+
+
+def iter_zip(hits, fmt):
+    """Yield a zip archive of one file per document in the specified export
+    format, one chunk per document. Only the archive's directory entries are
+    kept until the end."""
+
+    buf = StreamBuffer()
+    zf = zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED, allowZip64=True)
+    serialize = EXPORT_FORMATS[fmt][1]
+    for hit in hits:
+        zf.writestr(get_export_filename(hit['_id'], fmt),
+                    serialize(hit['_source']['prov_es_json']))
+        yield buf.drain()
+    zf.close()
+    yield buf.drain()
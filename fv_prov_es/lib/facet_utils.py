@@ -0,0 +1,286 @@
+import json, time, threading
+
+
+class FacetSnapshot(object):
+    """Facet counts per concept up to the _timestamp watermark:
+    terms[concept][field] dicts of term to count, others[concept][field]
+    counts of terms that ES didn't return and dates[concept][field] dicts of
+    month start in ms to count. prepare() precomputes the sorted facets of
+    each concept and of all concepts (concept None), so serving a facet
+    only slices a list. The term counts themselves are never truncated, so
+    a term can overtake the top terms as refreshes add to it."""
+
+    def __init__(self, watermark=None):
+        self.terms = {}
+        self.others = {}
+        self.dates = {}
+        self.watermark = watermark
+        self.sorted_terms = {}
+        self.sorted_dates = {}
+
+    def copy(self):
+        """Return copy of the counts."""
+
+        copy_counts = lambda counts: dict((concept, dict((field, dict(c))
+                                                         for field, c in fields.iteritems()))
+                                          for concept, fields in counts.iteritems())
+        snapshot = FacetSnapshot(self.watermark)
+        snapshot.terms = copy_counts(self.terms)
+        snapshot.others = dict((concept, dict(fields)) for concept, fields in self.others.iteritems())
+        snapshot.dates = copy_counts(self.dates)
+        return snapshot
+
+    def prepare(self, size):
+        """Precompute the sorted facets, keeping the size most frequent
+        terms of each."""
+
+        by_count = lambda counts: sorted(counts.iteritems(), key=lambda i: (-i[1], i[0]))
+        groups = dict((concept, [concept]) for concept in set(self.terms) | set(self.dates))
+        groups[None] = groups.keys()
+        self.sorted_terms = {}
+        self.sorted_dates = {}
+        for group, concepts in groups.iteritems():
+            for kind, sorted_facets in (('terms', self.sorted_terms), ('dates', self.sorted_dates)):
+                merged = {}
+                for concept in concepts:
+                    for field, counts in getattr(self, kind).get(concept, {}).iteritems():
+                        total = merged.setdefault(field, {})
+                        for key, count in counts.iteritems(): total[key] = total.get(key, 0) + count
+                for field, counts in merged.iteritems():
+                    if kind == 'dates':
+                        sorted_facets[(field, group)] = sorted(counts.iteritems())
+                        continue
+                    other = sum([self.others.get(concept, {}).get(field, 0) for concept in concepts])
+                    sorted_facets[(field, group)] = (by_count(counts)[:size],
+                                                     sum(counts.itervalues()) + other)
+
+    def get_terms_facet(self, field, concept=None, size=10):
+        """Return terms facet of a field over one or all concepts."""
+
+        terms, total = self.sorted_terms.get((field, concept), ([], 0))
+        return get_terms_facet(terms, total, size)
+
+    def get_date_histogram_facet(self, field, concept=None):
+        """Return date_histogram facet of a field over one or all concepts."""
+
+        return get_date_histogram_facet(self.sorted_dates.get((field, concept), []))
+
+
+def get_terms_facet(terms, total, size=10):
+    """Return ES terms facet result of the size most frequent of a list of
+    (term, count) tuples sorted by count and the total count."""
+
+    terms = terms[:size]
+    return {
+        '_type': 'terms',
+        'total': total,
+        'other': total - sum([count for term, count in terms]),
+        'terms': [{'term': term, 'count': count} for term, count in terms],
+    }
+
+
+def get_date_histogram_facet(entries):
+    """Return ES date_histogram facet result of a sorted list of (month
+    start in ms, count) tuples."""
+
+    return {
+        '_type': 'date_histogram',
+        'entries': [{'time': t, 'count': count} for t, count in entries],
+    }
+
+
+def get_query_concept(query):
+    """Return (True, concept) if a parsed query source matches all documents
+    (concept is None) or all documents of one concept, as FacetView queries
+    without filters or filtered on _type do; else (False, None). Top-level
+    filters don't apply to facets."""
+
+    q = query.get('query', {'match_all': {}})
+    if q == {'match_all': {}}: return True, None
+    try:
+        must, = q['bool']['must']
+        value = must['term']['_type']
+        if q.keys() == ['bool'] and q['bool'].keys() == ['must'] and \
+           must.keys() == ['term'] and must['term'].keys() == ['_type'] and \
+           isinstance(value, basestring): return True, value
+    except (KeyError, TypeError, ValueError, AttributeError): pass
+    return False, None
+
+
+class FacetCounts(object):
+    """Precomputed counts of the terms_fields and monthly histograms of the
+    date_fields of all documents per concept. Counts are computed with one
+    aggregation query and refreshed every refresh_interval seconds by adding
+    the counts of documents indexed since, going by _timestamp. Documents
+    indexed in the last lag seconds may not be searchable yet and are
+    counted at the next refresh. Everything is recounted every
+    full_refresh_interval seconds to pick up deletions.
+
+    Each query asks ES for the terms_size most frequent terms of each
+    concept and field, which bounds the size of facets that can be served;
+    the rest are only counted as others. A term's count is therefore low by
+    at most the documents it had in queries where it missed the top
+    terms_size, until the next full recount."""
+
+    def __init__(self, terms_fields=(), date_fields=(), terms_size=100,
+                 refresh_interval=30, full_refresh_interval=3600, lag=5):
+        self.es = None
+        self.index = None
+        self.terms_fields = list(terms_fields)
+        self.terms_size = terms_size
+        self.date_fields = list(date_fields)
+        self.refresh_interval = refresh_interval
+        self.full_refresh_interval = full_refresh_interval
+        self.lag = lag
+        self.snapshot = None
+        self.refreshed = 0
+        self.full_refreshed = 0
+        self.refreshes = 0
+        self.full_refreshes = 0
+        self.served = 0
+        self.errors = 0
+        self.last_error = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Configure counts from app config."""
+
+        self.es = app.extensions['es_client']
+        self.index = app.config['PROVES_ES_ALIAS']
+        self.terms_fields = list(app.config.get('FACET_TERMS_FIELDS', self.terms_fields))
+        self.date_fields = list(app.config.get('FACET_DATE_FIELDS', self.date_fields))
+        self.terms_size = app.config.get('FACET_TERMS_SIZE', self.terms_size)
+        self.refresh_interval = app.config.get('FACET_REFRESH_INTERVAL', self.refresh_interval)
+        self.full_refresh_interval = app.config.get('FACET_FULL_REFRESH_INTERVAL',
+                                                    self.full_refresh_interval)
+        self.lag = app.config.get('FACET_REFRESH_LAG', self.lag)
+        self.snapshot = None
+        app.extensions['facet_counts'] = self
+
+    def get_query(self, watermark=None):
+        """Return aggregation query of the counts of documents indexed after
+        watermark and before the lag."""
+
+        aggs = {}
+        for i, field in enumerate(self.terms_fields):
+            aggs['t%d' % i] = { 'terms': { 'field': field, 'size': self.terms_size } }
+        for i, field in enumerate(self.date_fields):
+            aggs['d%d' % i] = { 'date_histogram': { 'field': field, 'interval': 'month' } }
+        window = { 'lte': 'now-%ds' % self.lag }
+        if watermark is not None: window['gt'] = watermark
+        return {
+            'size': 0,
+            'query': { 'filtered': { 'filter': { 'range': { '_timestamp': window } } } },
+            'aggs': {
+                'concepts': { 'terms': { 'field': '_type', 'size': 0 }, 'aggs': aggs },
+                'watermark': { 'max': { 'field': '_timestamp' } },
+            },
+        }
+
+    def add_counts(self, snapshot, result):
+        """Add counts of an aggregation result to a snapshot."""
+
+        for bucket in result['aggregations']['concepts']['buckets']:
+            for kind, prefix, fields in (('terms', 't', self.terms_fields),
+                                         ('dates', 'd', self.date_fields)):
+                counts = getattr(snapshot, kind).setdefault(bucket['key'], {})
+                for i, field in enumerate(fields):
+                    agg = bucket['%s%d' % (prefix, i)]
+                    field_counts = counts.setdefault(field, {})
+                    for b in agg['buckets']:
+                        field_counts[b['key']] = field_counts.get(b['key'], 0) + b['doc_count']
+                    if agg.get('sum_other_doc_count', 0):
+                        others = snapshot.others.setdefault(bucket['key'], {})
+                        others[field] = others.get(field, 0) + agg['sum_other_doc_count']
+        watermark = result['aggregations']['watermark'].get('value', None)
+        if watermark is not None: snapshot.watermark = int(watermark)
+
+    def refresh(self, full=False):
+        """Count documents indexed since the last refresh, or all documents
+        if full, and swap in the new snapshot."""
+
+        full = full or self.snapshot is None
+        snapshot = FacetSnapshot() if full else self.snapshot.copy()
+        r = self.es.post('/%s/_search' % self.index,
+                         data=json.dumps(self.get_query(snapshot.watermark)))
+        r.raise_for_status()
+        self.add_counts(snapshot, r.json())
+        snapshot.prepare(self.terms_size)
+        now = time.time()
+        self.snapshot = snapshot
+        self.refreshed = now
+        self.refreshes += 1
+        if full:
+            self.full_refreshed = now
+            self.full_refreshes += 1
+
+    def current(self):
+        """Return the current snapshot, refreshing it first if due; None if
+        counts are unavailable. Only one request refreshes at a time while
+        the others use the previous snapshot."""
+
+        now = time.time()
+        if self.snapshot is None or now - self.refreshed > self.refresh_interval:
+            if self._lock.acquire(False):
+                try: self.refresh(now - self.full_refreshed > self.full_refresh_interval)
+                except Exception, e:
+                    # retry after refresh_interval instead of on every request
+                    self.refreshed = now
+                    self.errors += 1
+                    self.last_error = str(e)
+                finally:
+                    self._lock.release()
+        return self.snapshot
+
+    def get_facet(self, snapshot, spec, concept=None):
+        """Return ES facet result of a facet request served from a snapshot
+        or None if the request can't be served."""
+
+        if spec.keys() == ['terms']:
+            params = spec['terms']
+            if not set(params) <= set(['field', 'size', 'order']) or \
+               params.get('order', 'count') != 'count' or \
+               params.get('size', 10) > self.terms_size or \
+               params.get('field', None) not in self.terms_fields: return None
+            return snapshot.get_terms_facet(params['field'], concept, params.get('size', 10))
+        if spec.keys() == ['date_histogram']:
+            params = spec['date_histogram']
+            if not set(params) <= set(['field', 'interval']) or \
+               params.get('interval', None) != 'month' or \
+               params.get('field', None) not in self.date_fields: return None
+            return snapshot.get_date_histogram_facet(params['field'], concept)
+        return None
+
+    def serve(self, query):
+        """Remove the facets of a parsed query source that can be served from
+        precomputed counts and return dict of their results."""
+
+        facets = query.get('facets', None)
+        if not facets or not (self.terms_fields or self.date_fields): return {}
+        matches, concept = get_query_concept(query)
+        if not matches: return {}
+        snapshot = self.current()
+        if snapshot is None: return {}
+        served = {}
+        for name, spec in facets.items():
+            if not isinstance(spec, dict): continue
+            result = self.get_facet(snapshot, spec, concept)
+            if result is not None:
+                served[name] = result
+                del facets[name]
+        if not facets: del query['facets']
+        self.served += len(served)
+        return served
+
+    def stats(self):
+        """Return dict of refresh counters."""
+
+        return {
+            'watermark': None if self.snapshot is None else self.snapshot.watermark,
+            'refreshed': self.refreshed,
+            'refreshes': self.refreshes,
+            'full_refreshes': self.full_refreshes,
+            'served': self.served,
+            'errors': self.errors,
+            'last_error': self.last_error,
+        }
@@ -1,64 +1,115 @@
-import os, sys, json
-from tempfile import NamedTemporaryFile
-from pydot import Dot, Subgraph, Node, Edge
+import os, sys, json, hashlib
+from subprocess import Popen, PIPE
 
 from flask import current_app
-from .utils import get_etree
+
+
+def get_topology(viz_data):
+    """Return tuple of node count and list of (source index, target index)
+    edges of viz data."""
+
+    return len(viz_data['nodes']), [(link_data['source'], link_data['target'])
+                                    for link_data in viz_data['links']]
+
+
+def get_topology_dot(n, edges):
+    """Return DOT source of a graph with n nodes named by their index and
+    (source index, target index) edges."""
+
+    lines = ['digraph graphname {']
+    lines.extend(['%d;' % i for i in range(n)])
+    lines.extend(['%d -> %d;' % edge for edge in edges])
+    lines.append('}')
+    return "\n".join(lines)
+
+
+def get_dot(viz_data):
+    """Take session visualization data and return DOT source with nodes
+    named by their index."""
+
+    return get_topology_dot(*get_topology(viz_data))
+
+
+def run_dot(dot, fmt, dot_cmd=None):
+    """Lay out DOT source with Graphviz and return the output in the
+    specified format. Source and output are passed over pipes."""
+
+    if dot_cmd is None: dot_cmd = current_app.config.get('GRAPHVIZ_DOT', 'dot')
+    p = Popen([dot_cmd, '-T%s' % fmt], stdin=PIPE, stdout=PIPE, stderr=PIPE)
+    out, err = p.communicate(dot)
+    if p.returncode != 0:
+        raise RuntimeError("Graphviz exited with status %d: %s" % (p.returncode, err.strip()))
+    return out
 
 
 def get_session_svg(viz_data):
     """Take session visualization data and return svg."""
-    
-    graph = Dot('graphname', graph_type='digraph')
-    
-    #loop create all nodes and store by id
-    node_dict = {}
-    for i, node_data in enumerate(viz_data['nodes']):
-        id = node_data['id']
-        node_dict[id] = str(i)
-        graph.add_node(Node(str(i)))
-        
-    #add edges by links
-    for link_data in viz_data['links']:
-        snode = node_dict[viz_data['nodes'][link_data['source']]['id']]
-        tnode = node_dict[viz_data['nodes'][link_data['target']]['id']]
-        graph.add_edge(Edge(snode, tnode))
-    
-    #get svg of graph
-    file = NamedTemporaryFile()
-    graph.write_svg(file.name)
-    svg = file.read()
-    file.close()
-    
-    #f = open('/tmp/session/session.svg', 'w')
-    #f.write("%s\n" % svg)
-    #f.close()
-
-    return svg
+
+    return run_dot(get_dot(viz_data), 'svg')
+
+
+def parse_plain_positions(plain):
+    """Parse Graphviz plain output and return dict of node name to (x, y)
+    position in points. Plain output is in inches with 5 significant digits
+    and y pointing up."""
+
+    positions = {}
+    for line in plain.splitlines():
+        if not line.startswith('node '): continue
+        name, x, y = line.split(None, 4)[1:4]
+        positions[name.strip('"')] = (float(x) * 72, float(y) * 72)
+    return positions
+
+
+def get_topology_key(viz_data):
+    """Return hash of the node ids and edges of viz data, ignoring node and
+    link payloads and their order. Return None if node ids are not unique."""
+
+    ids = [node_data['id'] for node_data in viz_data['nodes']]
+    if len(set(ids)) != len(ids): return None
+    edges = sorted([[ids[link_data['source']], ids[link_data['target']]]
+                    for link_data in viz_data['links']])
+    return hashlib.sha1(json.dumps([sorted(ids), edges])).hexdigest()
+
+
+def get_positions(viz_data):
+    """Return dict of node id to (x, y) position."""
+
+    return dict((node_data['id'], (node_data['gv_x'], node_data['gv_y']))
+                for node_data in viz_data['nodes'])
+
+
+def set_positions(viz_data, positions):
+    """Set node positions from dict of node id to (x, y) position."""
+
+    for node_data in viz_data['nodes']:
+        node_data['gv_x'], node_data['gv_y'] = positions[node_data['id']]
+    return viz_data
+
+
+def graphviz_layout(n, edges, dot_cmd=None):
+    """Lay out a graph with n nodes and (source index, target index) edges
+    with Graphviz. Return list of (x, y) node positions."""
+
+    #get positions
+    positions = parse_plain_positions(run_dot(get_topology_dot(n, edges), 'plain', dot_cmd))
+
+    #flip y to match svg coordinates and move y values into the positive
+    xys = []
+    for i in range(n):
+        if str(i) not in positions:
+            raise RuntimeError("Graphviz returned no position for node %d." % i)
+        x, y = positions[str(i)]
+        xys.append((int(round(x)), int(round(-y))))
+    min_y = min([0] + [y for x, y in xys])
+    return [(x, y - min_y) for x, y in xys]
+
 
 def add_graphviz_positions(viz_data):
     """Take viz data and add positions as determined by graphviz."""
-    
-    #get svg
-    svg = get_session_svg(viz_data)
-    
-    #parse svg
-    #get xml etree
-    et, nsdict = get_etree(svg)
-    #log.debug(nsdict)
-    
-    #loop over each node and set x and y positions
-    min_y = 0
-    for i, node_data in enumerate(viz_data['nodes']):
-        id = node_data['id']
-        el_elt = et.xpath('.//_:g/_:ellipse[../_:title = "%s"]' % str(i), namespaces=nsdict)
-        if len(el_elt) != 1: raise RuntimeError("Failed to xpath query node %s." % str(i))
-        else: el_elt = el_elt[0]
-        node_data['gv_x'] = int(eval(el_elt.get('cx')))
-        node_data['gv_y'] = int(eval(el_elt.get('cy')))
-        if node_data['gv_y'] < min_y: min_y = node_data['gv_y']
-        
-    #move y values into the positive
-    for node_data in viz_data['nodes']: node_data['gv_y'] -= min_y
-        
+
+    n, edges = get_topology(viz_data)
+    for node_data, (x, y) in zip(viz_data['nodes'], graphviz_layout(n, edges)):
+        node_data['gv_x'] = x
+        node_data['gv_y'] = y
     return viz_data
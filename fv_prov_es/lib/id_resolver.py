@@ -0,0 +1,137 @@
+import json, requests
+
+from fv_prov_es.lib.cache_utils import LRUCache
+
+
+def get_hit(doc):
+    """Return search hit format of a GET or _mget document, keeping its
+    _version."""
+
+    return dict((k, doc[k]) for k in ('_index', '_type', '_id', '_version', '_source') if k in doc)
+
+
+class IdResolver(object):
+    """Reads PROV-ES documents by id from the concrete index holding them.
+    Locations (index, type) of ids are learned from search hits and at
+    import and kept in a per-worker LRU cache. Documents of known ids are
+    read with realtime GET/_mget, which only touches the shard holding the
+    id; unknown ids, and ids no longer found where they were, fall back to
+    an ids search over the alias. Hits carry the _version of the document."""
+
+    def __init__(self, maxsize=100000):
+        self.es = None
+        self.alias = None
+        self.locations = LRUCache(maxsize)
+        self.gets = 0
+        self.searches = 0
+        self.stale = 0
+
+    def init_app(self, app):
+        """Configure resolver from app config."""
+
+        self.es = app.extensions['es_client']
+        self.alias = app.config['PROVES_ES_ALIAS']
+        self.locations = LRUCache(app.config.get('ID_LOCATION_CACHE_SIZE', self.locations.maxsize))
+        self.gets = 0
+        self.searches = 0
+        self.stale = 0
+        app.extensions['id_resolver'] = self
+
+    def set(self, id, index, doc_type):
+        """Remember the index and type of a document id."""
+
+        self.locations.set(id, (index, doc_type))
+
+    def remember(self, hits):
+        """Remember the locations of search hits."""
+
+        for hit in hits:
+            if '_index' in hit and '_type' in hit: self.set(hit['_id'], hit['_index'], hit['_type'])
+
+    def search(self, ids, chunk_size=500):
+        """Return dict of id to hit of ids found by searching the alias."""
+
+        docs = {}
+        for i in range(0, len(ids), chunk_size):
+            chunk = ids[i:i+chunk_size]
+            query = { 'query': { 'ids': { 'values': chunk } }, 'size': len(chunk),
+                      'version': True }
+            r = self.es.post('/%s/_search' % self.alias, data=json.dumps(query))
+            r.raise_for_status()
+            self.searches += 1
+            for hit in r.json()['hits']['hits']:
+                if hit['_id'] in docs: continue
+                docs[hit['_id']] = hit
+                self.set(hit['_id'], hit['_index'], hit['_type'])
+        return docs
+
+    def get_located(self, id, source=True):
+        """Return GET result of a document id from its known location or None
+        if the location is unknown or stale."""
+
+        location = self.locations.get(id)
+        if location is None: return None
+        r = self.es.get('/%s/%s/%s%s' % (location[0], requests.utils.quote(location[1], safe=''),
+                                         requests.utils.quote(id, safe=''),
+                                         '' if source else '?_source=false'))
+        if r.status_code != 404: r.raise_for_status()
+        self.gets += 1
+        doc = r.json()
+        if doc.get('found', False): return doc
+        self.locations.delete(id)
+        self.stale += 1
+        return None
+
+    def get(self, id):
+        """Return hit of a document id or {} if not found."""
+
+        doc = self.get_located(id)
+        if doc is not None: return get_hit(doc)
+        return self.search([id]).get(id, {})
+
+    def get_version(self, id):
+        """Return hit of a document id without _source, i.e. its location and
+        _version, or None if not found."""
+
+        doc = self.get_located(id, False)
+        if doc is not None: return get_hit(doc)
+        query = { 'query': { 'ids': { 'values': [id] } }, 'size': 1,
+                  'version': True, '_source': False }
+        r = self.es.post('/%s/_search' % self.alias, data=json.dumps(query))
+        r.raise_for_status()
+        self.searches += 1
+        for hit in r.json()['hits']['hits']:
+            self.set(hit['_id'], hit['_index'], hit['_type'])
+            return get_hit(hit)
+        return None
+
+    def get_many(self, ids, chunk_size=500):
+        """Return dict of id to hit of document ids; ids that were not found
+        are omitted."""
+
+        docs = {}
+        located = [(id, self.locations.get(id)) for id in set(ids)]
+        located = [(id, location) for id, location in located if location is not None]
+        for i in range(0, len(located), chunk_size):
+            chunk = located[i:i+chunk_size]
+            query = { 'docs': [ { '_index': index, '_type': doc_type, '_id': id }
+                                for id, (index, doc_type) in chunk ] }
+            r = self.es.post('/_mget', data=json.dumps(query))
+            r.raise_for_status()
+            self.gets += 1
+            for doc in r.json()['docs']:
+                if doc.get('found', False): docs[doc['_id']] = get_hit(doc)
+                else:
+                    self.locations.delete(doc['_id'])
+                    self.stale += 1
+        docs.update(self.search([id for id in set(ids) if id not in docs], chunk_size))
+        return docs
+
+    def stats(self):
+        """Return dict of location cache and lookup counters."""
+
+        stats = self.locations.stats()
+        stats['gets'] = self.gets
+        stats['searches'] = self.searches
+        stats['stale'] = self.stale
+        return stats
@@ -1,22 +1,142 @@
 import os, sys, json, requests, copy, types
-from pyes import ES, TermQuery
-from pyes.exceptions import SearchPhaseExecutionException
 from flask import current_app
 
 from prov_es.model import get_uuid
 
+from fv_prov_es import doc_cache, id_resolver
+from .es_client import ESClient
+from .utils import PROV_RELATIONS
+
+
+def create_index(conn, index, alias=None):
+    """Create index if it doesn't exist and add it to the alias."""
+
+    if conn.head('/%s' % index).status_code != 404: return
+    r = conn.put('/%s' % index)
+    if r.status_code == 400 and 'IndexAlreadyExists' in r.text: return
+    r.raise_for_status()
+    if alias is not None:
+        actions = { 'actions': [ { 'add': { 'index': index, 'alias': alias } } ] }
+        r = conn.post('/_aliases', data=json.dumps(actions))
+        r.raise_for_status()
+
 
 def get_es_conn(es_url, index, alias=None):
     """Create connection and create index if it doesn't exist."""
 
-    conn = ES(es_url)
-    if not conn.indices.exists_index(index):
-        conn.indices.create_index(index)
-        if alias is not None:
-            conn.indices.add_alias(alias, [index])
+    conn = ESClient(es_url)
+    create_index(conn, index, alias)
     return conn
 
 
+class BulkIndexer(object):
+    """Buffer index actions and send them to ElasticSearch with the _bulk
+       API. The buffer is flushed when max_actions actions or max_bytes bytes
+       are queued. Items that ES fails to index are collected in errors and
+       on_indexed, if given, is called with the result of each item that ES
+       indexed.
+
+       index() has the same signature as ESClient.index() so a BulkIndexer
+       can be used wherever a connection is only used for writes."""
+
+    def __init__(self, conn, max_actions=500, max_bytes=5242880, on_indexed=None):
+        self.conn = conn
+        self.max_actions = max_actions
+        self.max_bytes = max_bytes
+        self.on_indexed = on_indexed
+        self.lines = []
+        self.bytes = 0
+        self.indexed = 0
+        self.errors = []
+
+    def __len__(self):
+        return len(self.lines) / 2
+
+    def index(self, doc, index, doc_type, id=None):
+        """Queue document for indexing."""
+
+        meta = { '_index': index, '_type': doc_type }
+        if id is not None: meta['_id'] = id
+        action = json.dumps({ 'index': meta })
+        source = json.dumps(doc)
+        self.lines.extend([action, source])
+        self.bytes += len(action) + len(source) + 2
+        if len(self) >= self.max_actions or self.bytes >= self.max_bytes:
+            self.flush()
+
+    def flush(self):
+        """Send queued actions to ES. Return number of failed items."""
+
+        if len(self.lines) == 0: return 0
+        body = "\n".join(self.lines) + "\n"
+        self.lines = []
+        self.bytes = 0
+        r = self.conn.post('/_bulk', data=body)
+        r.raise_for_status()
+        failed = 0
+        for item in r.json()['items']:
+            op, info = item.items()[0]
+            if info.get('status', 200) >= 300 or 'error' in info:
+                self.errors.append({
+                    'index': info.get('_index', None),
+                    'type': info.get('_type', None),
+                    'id': info.get('_id', None),
+                    'status': info.get('status', None),
+                    'error': info.get('error', None),
+                })
+                failed += 1
+            else:
+                self.indexed += 1
+                if self.on_indexed is not None: self.on_indexed(info)
+        return failed
+
+
+def record_indexed(result):
+    """Record the location of a PROV-ES document ES indexed, given the
+       result of its index request or bulk item, and invalidate the cached
+       document if it was overwritten. Edge documents are ignored since
+       they share the ids of their relations."""
+
+    if result['_type'] == 'edge': return
+    id_resolver.set(result['_id'], result['_index'], result['_type'])
+    if not result.get('created', result.get('status', 201) == 201):
+        doc_cache.delete_many([result['_id']])
+
+
+def get_existing_ids(conn, alias, ids, chunk_size=1000):
+    """Return set of ids that are already indexed in the alias. Ids are
+       checked with one ids query per chunk."""
+
+    existing = set()
+    ids = list(set(ids))
+    for i in range(0, len(ids), chunk_size):
+        chunk = ids[i:i+chunk_size]
+        query = { 'query': { 'ids': { 'values': chunk } }, 'fields': [], 'size': len(chunk) }
+        r = conn.post('/%s/_search' % alias, data=json.dumps(query))
+        if r.status_code != 200:
+            # alias without searchable indices yet
+            if r.status_code == 404 or 'SearchPhaseExecutionException' in r.text: continue
+            r.raise_for_status()
+        existing.update([hit['_id'] for hit in r.json()['hits']['hits']])
+    return existing
+
+
+def get_candidate_ids(prov_es_json):
+    """Return ids of all concepts, bundles and bundle members in a PROV-ES
+       document."""
+
+    ids = []
+    for concept in prov_es_json:
+        if concept == 'prefix': continue
+        ids.extend(prov_es_json[concept].keys())
+        if concept == 'bundle':
+            for bundle_prov in prov_es_json['bundle'].itervalues():
+                for b_concept in bundle_prov:
+                    if b_concept == 'prefix': continue
+                    ids.extend(bundle_prov[b_concept].keys())
+    return ids
+
+
 def fix_hadMember_ids(prov_es_json):
     """Fix the id's of hadMember relationships."""
 
@@ -28,25 +148,72 @@ def fix_hadMember_ids(prov_es_json):
         del prov_es_json['hadMember'][id]
 
 
-def import_prov(conn, index, alias, prov_es_json):
-    """Index PROV-ES concepts into ElasticSearch."""
+def get_edge(concept, doc, bundle_id=None):
+    """Return edge document for a PROV relation or None if concept is not
+       a relation."""
+
+    if concept not in PROV_RELATIONS: return None
+    src_attr, tgt_attr = PROV_RELATIONS[concept]
+    if doc.get(src_attr, None) is None or doc.get(tgt_attr, None) is None: return None
+    prov_type = doc.get('prov:type', None)
+    if isinstance(prov_type, types.DictType): prov_type = prov_type.get('$', '')
+    return {
+        'source': doc[src_attr],
+        'target': doc[tgt_attr],
+        'relation': concept,
+        'prov_type': prov_type,
+        'bundle': bundle_id,
+        'time': doc.get('prov:time', None),
+    }
+
+
+def index_edge(writer, edge_index, concept, id, doc, bundle_id=None):
+    """Index edge document for a PROV relation. The relation id is used as
+       the edge id."""
+
+    if edge_index is None: return
+    edge = get_edge(concept, doc, bundle_id)
+    if edge is None: return
+    edge['doc_id'] = id
+    writer.index(edge, edge_index, 'edge', id)
+
+
+def import_prov(conn, index, alias, prov_es_json, edge_index=None, bulk=None,
+                existing=None):
+    """Index PROV-ES concepts into ElasticSearch. If edge_index is specified,
+       an edge document is also indexed for each PROV relation. If bulk is a
+       BulkIndexer, documents are queued on it instead of being indexed one
+       request at a time; the caller is responsible for flushing it.
+
+       Concepts whose id is in existing are skipped. If existing is None, it
+       is looked up for all ids in the document with get_existing_ids().
+
+       Documents are passed to record_indexed() once ES indexed them; a bulk
+       indexer should be created with it as on_indexed. Returns dict of
+       written id to its PROV-ES JSON document."""
+
+    writer = conn if bulk is None else bulk
+    written = {}
+
+    def write(doc, doc_type, id):
+        result = writer.index(doc, index, doc_type, id)
+        if bulk is None: record_indexed(result)
 
     # fix hadMember ids
     fix_hadMember_ids(prov_es_json)
     #print(json.dumps(prov_es_json, indent=2))
 
+    # check which ids are already indexed
+    if existing is None:
+        existing = get_existing_ids(conn, alias, get_candidate_ids(prov_es_json))
+
     # import
     prefix = prov_es_json['prefix']
     for concept in prov_es_json:
         if concept == 'prefix': continue
         elif concept == 'bundle':
             for bundle_id in prov_es_json['bundle']:
-                try:
-                    found = len(conn.search(query=TermQuery("_id", bundle_id),
-                                            indices=[alias]))
-                except SearchPhaseExecutionException:
-                    found = 0
-                if found > 0: continue
+                if bundle_id in existing: continue
                 bundle_prov = copy.deepcopy(prov_es_json['bundle'][bundle_id])
                 bundle_prov['prefix'] = prefix
                 bundle_doc = {
@@ -64,23 +231,17 @@ def import_prov(conn, index, alias, prov_es_json):
                         doc['prov_es_json'].setdefault(b_concept, {})[i] = prov_doc
                         if 'prov:type' in doc and isinstance(doc['prov:type'], types.DictType):
                             doc['prov:type'] = doc['prov:type'].get('$', '')
-                        try:
-                            found = len(conn.search(query=TermQuery("_id", i),
-                                                    indices=[alias]))
-                        except SearchPhaseExecutionException:
-                            found = 0
-                        if found > 0: pass
-                        else: conn.index(doc, index, b_concept, i)
+                        if i in existing: pass
+                        else:
+                            write(doc, b_concept, i)
+                            index_edge(writer, edge_index, b_concept, i, prov_doc, bundle_id)
+                            written[i] = doc['prov_es_json']
                         bundle_doc[b_concept].append(i)
-                conn.index(bundle_doc, index, 'bundle', bundle_id)
+                write(bundle_doc, 'bundle', bundle_id)
+                written[bundle_id] = bundle_prov
         else:
             for i in prov_es_json[concept]:
-                try:
-                    found = len(conn.search(query=TermQuery("_id", i),
-                                            indices=[alias]))
-                except SearchPhaseExecutionException:
-                    found = 0
-                if found > 0: continue
+                if i in existing: continue
                 docs = prov_es_json[concept][i]
                 if not isinstance(docs, types.ListType): docs = [docs]
                 for doc in docs:
@@ -90,4 +251,7 @@ def import_prov(conn, index, alias, prov_es_json):
                     doc['prov_es_json'].setdefault(concept, {})[i] = prov_doc
                     if 'prov:type' in doc and isinstance(doc['prov:type'], types.DictType):
                         doc['prov:type'] = doc['prov:type'].get('$', '')
-                    conn.index(doc, index, concept, i)
+                    write(doc, concept, i)
+                    index_edge(writer, edge_index, concept, i, prov_doc)
+                    written[i] = doc['prov_es_json']
+    return written
@@ -0,0 +1,303 @@
+NODE_SEP = 72   # min distance between node centers in a layer
+DUMMY_SEP = 36  # min distance from a dummy node (edge bend) to a neighbor
+RANK_SEP = 72   # distance between layers
+MAX_SPAN = 4    # max layers spanned by an edge routed through dummy nodes
+MARGIN_X = 27   # x of the leftmost node center
+SWEEPS = 8      # crossing reduction iterations
+PASSES = 4      # coordinate assignment iterations
+
+
+def break_cycles(n, edges):
+    """Return edges with the back edges of a depth-first search reversed
+    so that the graph is acyclic. Self loops are dropped."""
+
+    succ = [[] for i in range(n)]
+    for s, t in edges:
+        if s != t: succ[s].append(t)
+    state = [0] * n # 0: unvisited, 1: on stack, 2: done
+    back = set()
+    for root in range(n):
+        if state[root]: continue
+        state[root] = 1
+        stack = [(root, iter(succ[root]))]
+        while stack:
+            v, it = stack[-1]
+            for w in it:
+                if state[w] == 1: back.add((v, w))
+                elif state[w] == 0:
+                    state[w] = 1
+                    stack.append((w, iter(succ[w])))
+                    break
+            else:
+                state[v] = 2
+                stack.pop()
+    return [(t, s) if (s, t) in back else (s, t) for s, t in edges if s != t]
+
+
+def assign_layers(n, edges):
+    """Return list of layer indices of the nodes of an acyclic graph: the
+    longest path from the sources, with sources pulled down next to their
+    successors."""
+
+    succ = [[] for i in range(n)]
+    indegree = [0] * n
+    for s, t in edges:
+        succ[s].append(t)
+        indegree[t] += 1
+
+    # longest path from the sources in topological order
+    rank = [0] * n
+    order = [v for v in range(n) if indegree[v] == 0]
+    remaining = list(indegree)
+    for v in order:
+        for w in succ[v]:
+            rank[w] = max(rank[w], rank[v] + 1)
+            remaining[w] -= 1
+            if remaining[w] == 0: order.append(w)
+
+    # pull sources down to just above their closest successor
+    for v in range(n):
+        if indegree[v] == 0 and succ[v]:
+            rank[v] = min([rank[w] for w in succ[v]]) - 1
+    min_rank = min(rank)
+    return [r - min_rank for r in rank]
+
+
+def count_crossings(upper, lower, pos):
+    """Return number of crossings of the edges between two ordered layers
+    given as lists of (node, lower neighbors)."""
+
+    targets = sorted((pos[v], pos[w]) for v, neighbors in upper for w in neighbors)
+    size = len(lower) + 1
+    tree = [0] * (size + 1)
+    crossings = 0
+    for seen, (p, q) in enumerate(targets):
+        # previously seen edges ending right of q cross this one
+        j = q + 1
+        left = 0
+        while j > 0:
+            left += tree[j]
+            j -= j & -j
+        crossings += seen - left
+        j = q + 1
+        while j <= size:
+            tree[j] += 1
+            j += j & -j
+    return crossings
+
+
+def place_layer(layer, desired, seps):
+    """Return x coordinates for the ordered nodes of a layer that minimize
+    the squared distance to the desired coordinates with each node at least
+    seps[i] right of the previous one (pool adjacent violators)."""
+
+    offsets = [0.]
+    for sep in seps: offsets.append(offsets[-1] + sep)
+    blocks = []
+    for i, v in enumerate(layer):
+        blocks.append([desired[v] - offsets[i], 1])
+        while len(blocks) > 1 and blocks[-2][0] * blocks[-1][1] > blocks[-1][0] * blocks[-2][1]:
+            total, count = blocks.pop()
+            blocks[-1][0] += total
+            blocks[-1][1] += count
+    xs = []
+    for total, count in blocks: xs.extend([total / count] * count)
+    return [x + offsets[i] for i, x in enumerate(xs)]
+
+
+def layered_layout(n, edges, sweeps=SWEEPS, passes=PASSES):
+    """Lay out a directed graph with n nodes and edges given as (source
+    index, target index) tuples in layers (Sugiyama-style). Return list of
+    (x, y) node positions in points with layers running top to bottom from
+    y 0, as add_graphviz_positions() does.
+
+    Cycles are broken, layers assigned and edges spanning up to MAX_SPAN
+    layers split by dummy nodes; longer edges (e.g. from agents associated
+    with many activities) only pull their endpoints together, which keeps
+    the number of dummies linear in the number of edges. Crossings are then
+    reduced by barycenter ordering in sweeps alternating down and up, and
+    each layer placed as close as possible to the mean x of its neighbors
+    in passes.
+
+    With sweeps and passes set to 0 only layers are assigned, which is a
+    quick degraded layout for graphs too large to lay out in time."""
+
+    if n == 0: return []
+    edges = break_cycles(n, edges)
+    rank = assign_layers(n, edges)
+
+    # split long edges with dummy nodes; up/down hold neighbors in the
+    # adjacent layers, far_up/far_down endpoints of edges spanning more than
+    # MAX_SPAN layers
+    node_rank = list(rank)
+    up = [[] for i in range(n)]
+    down = [[] for i in range(n)]
+    far_up = [[] for i in range(n)]
+    far_down = [[] for i in range(n)]
+    for s, t in edges:
+        if rank[t] - rank[s] > MAX_SPAN:
+            far_down[s].append(t)
+            far_up[t].append(s)
+            continue
+        prev = s
+        for r in range(rank[s] + 1, rank[t]):
+            node_rank.append(r)
+            up.append([prev])
+            down.append([])
+            far_up.append([])
+            far_down.append([])
+            down[prev].append(len(node_rank) - 1)
+            prev = len(node_rank) - 1
+        down[prev].append(t)
+        up[t].append(prev)
+    layers = [[] for i in range(max(node_rank) + 1)]
+    for v, r in enumerate(node_rank): layers[r].append(v)
+    pos = [0] * len(node_rank)
+    for layer in layers:
+        for i, v in enumerate(layer): pos[v] = i
+
+    def total_crossings():
+        return sum([count_crossings([(v, down[v]) for v in layers[i]], layers[i + 1], pos)
+                    for i in range(len(layers) - 1)])
+
+    widths = [float(len(layer)) for layer in layers]
+
+    def reorder(layer, neighbors, far_neighbors):
+        # positions relative to layer width so that neighbors in distant
+        # layers are comparable
+        def barycenter(v):
+            ws = neighbors[v] + far_neighbors[v]
+            if ws:
+                return sum([(pos[w] + .5) / widths[node_rank[w]] for w in ws]) / len(ws)
+            return (pos[v] + .5) / widths[node_rank[v]]
+        layer.sort(key=lambda v: (barycenter(v), pos[v]))
+        for i, v in enumerate(layer): pos[v] = i
+
+    # crossing reduction
+    best = total_crossings() if sweeps > 0 else 0
+    best_layers = [list(layer) for layer in layers]
+    for sweep in range(sweeps):
+        if best == 0: break
+        for i in range(1, len(layers)): reorder(layers[i], up, far_up)
+        for i in range(len(layers) - 2, -1, -1): reorder(layers[i], down, far_down)
+        crossings = total_crossings()
+        if crossings < best:
+            best = crossings
+            best_layers = [list(layer) for layer in layers]
+    layers = best_layers
+    for layer in layers:
+        for i, v in enumerate(layer): pos[v] = i
+
+    # coordinate assignment
+    x = [0.] * len(node_rank)
+    seps = []
+    for layer in layers:
+        seps.append([NODE_SEP if layer[i] < n and layer[i + 1] < n else DUMMY_SEP
+                     for i in range(len(layer) - 1)])
+        xs = place_layer(layer, dict((v, 0.) for v in layer), seps[-1])
+        for v, xv in zip(layer, xs): x[v] = xv
+    for p in range(passes):
+        for neighbors, far_neighbors, layer_range in \
+            ((up, far_up, range(1, len(layers))),
+             (down, far_down, range(len(layers) - 2, -1, -1))):
+            for i in layer_range:
+                desired = {}
+                for v in layers[i]:
+                    ws = neighbors[v] + far_neighbors[v]
+                    if ws: desired[v] = sum([x[w] for w in ws]) / len(ws)
+                    else: desired[v] = x[v]
+                for v, xv in zip(layers[i], place_layer(layers[i], desired, seps[i])):
+                    x[v] = xv
+
+    min_x = min(x[:n])
+    return [(int(round(x[v] - min_x + MARGIN_X)), rank[v] * RANK_SEP) for v in range(n)]
+
+
+def incremental_layout(n, edges, pinned):
+    """Lay out the nodes of a graph that are missing from pinned, a dict of
+    node index to (x, y) position. Return list of (x, y) positions of all
+    nodes with the pinned nodes kept in place.
+
+    Each connected group of new nodes is laid out together with the pinned
+    nodes it links to, then moved so that those pinned nodes land on their
+    positions on average. Groups not linked to pinned nodes are placed right
+    of the graph. Groups whose new nodes end up left of MARGIN_X or above 0
+    are moved right or down, so coordinates stay positive without moving
+    pinned nodes. New nodes overlapping other nodes are pushed right."""
+
+    positions = [pinned.get(v) for v in range(n)]
+    if len(pinned) == n: return positions
+    if not pinned: return layered_layout(n, edges)
+
+    # group new nodes connected through edges that are not between two
+    # pinned nodes; pinned endpoints of those edges serve as anchors
+    parent = range(n)
+    def find(v):
+        while parent[v] != v:
+            parent[v] = parent[parent[v]]
+            v = parent[v]
+        return v
+    touching = [(s, t) for s, t in edges if s not in pinned or t not in pinned]
+    for s, t in touching: parent[find(s)] = find(t)
+    members = {}
+    for v in range(n):
+        if v not in pinned: members.setdefault(find(v), set()).add(v)
+    group_edges = dict((root, []) for root in members)
+    for s, t in touching:
+        root = find(s)
+        members[root].update((s, t))
+        group_edges[root].append((s, t))
+
+    right = max([x for x, y in pinned.itervalues()]) + NODE_SEP
+    top = min([y for x, y in pinned.itervalues()])
+    for root in sorted(members, key=lambda r: min(members[r])):
+        vs = sorted(members[root])
+        index = dict((v, i) for i, v in enumerate(vs))
+        sub = layered_layout(len(vs), [(index[s], index[t]) for s, t in group_edges[root]])
+        anchors = [i for i, v in enumerate(vs) if v in pinned]
+        if anchors:
+            dx = sum([pinned[vs[i]][0] - sub[i][0] for i in anchors]) / float(len(anchors))
+            dy = sum([pinned[vs[i]][1] - sub[i][1] for i in anchors]) / float(len(anchors))
+        else:
+            dx = right - min([x for x, y in sub])
+            dy = top
+        new = [i for i, v in enumerate(vs) if v not in pinned]
+        dx += max(0, MARGIN_X - min([sub[i][0] + dx for i in new]))
+        dy += max(0, -min([sub[i][1] + dy for i in new]))
+        for i in new:
+            positions[vs[i]] = (int(round(sub[i][0] + dx)), int(round(sub[i][1] + dy)))
+        right = max(right, max([positions[v][0] for v in vs]) + NODE_SEP)
+
+    # push overlapping new nodes right; nodes are bucketed into cells of
+    # NODE_SEP by half a layer so overlaps are found in neighboring cells
+    row_sep = RANK_SEP / 2
+    cells = {}
+    def overlaps(x, y):
+        cx, cy = int(x // NODE_SEP), int(y // row_sep)
+        found = [ox for i in (-1, 0, 1) for j in (-1, 0, 1)
+                 for ox, oy in cells.get((cx + i, cy + j), ())
+                 if abs(ox - x) < NODE_SEP and abs(oy - y) < row_sep]
+        return max(found) if found else None
+    def occupy(x, y):
+        cells.setdefault((int(x // NODE_SEP), int(y // row_sep)), []).append((x, y))
+    for x, y in pinned.itervalues(): occupy(x, y)
+    for v in sorted([v for v in range(n) if v not in pinned], key=lambda v: positions[v][::-1]):
+        x, y = positions[v]
+        ox = overlaps(x, y)
+        while ox is not None:
+            x = ox + NODE_SEP
+            ox = overlaps(x, y)
+        positions[v] = (x, y)
+        occupy(x, y)
+    return positions
+
+
+def add_layered_positions(viz_data):
+    """Take viz data and add positions as determined by the layered layout."""
+
+    edges = [(link_data['source'], link_data['target']) for link_data in viz_data['links']]
+    positions = layered_layout(len(viz_data['nodes']), edges)
+    for node_data, (x, y) in zip(viz_data['nodes'], positions):
+        node_data['gv_x'] = x
+        node_data['gv_y'] = y
+    return viz_data
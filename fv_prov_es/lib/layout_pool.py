@@ -0,0 +1,140 @@
+import os, time, errno, signal, select, threading
+import cPickle as pickle
+
+
+class LayoutBusy(Exception):
+    """Raised when no layout slot frees up in time."""
+    pass
+
+
+class LayoutTimeout(Exception):
+    """Raised when a layout job is killed for exceeding its timeout."""
+    pass
+
+
+def run_in_child(func, args, timeout):
+    """Run func(*args) in a forked child process and return its result. The
+    result is read over a pipe with select(), which gevent makes cooperative,
+    so waiting does not block other requests. The child runs in its own
+    process group, which is killed and LayoutTimeout raised if it runs
+    longer than timeout seconds, so that processes it started (e.g. dot)
+    are killed with it."""
+
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.setpgrp()
+            os.close(r)
+            try: result = ('ok', func(*args))
+            except Exception, e: result = ('error', "%s: %s" % (type(e).__name__, str(e)))
+            data = pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+            while data: data = data[os.write(w, data):]
+        finally:
+            os._exit(0)
+
+    # also set the group in the parent so it is in place before a timeout
+    try: os.setpgid(pid, pid)
+    except OSError: pass
+    os.close(w)
+    chunks = []
+    deadline = time.time() + timeout
+    try:
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                try: os.killpg(pid, signal.SIGKILL)
+                except OSError: os.kill(pid, signal.SIGKILL)
+                raise LayoutTimeout("Layout did not finish within %s seconds." % timeout)
+            try: ready = select.select([r], [], [], remaining)[0]
+            except select.error, e:
+                if e.args[0] == errno.EINTR: continue
+                raise
+            if not ready: continue
+            chunk = os.read(r, 65536)
+            if not chunk: break
+            chunks.append(chunk)
+    finally:
+        os.close(r)
+        os.waitpid(pid, 0)
+
+    if len(chunks) == 0: raise RuntimeError("Layout process exited without a result.")
+    status, result = pickle.loads("".join(chunks))
+    if status == 'error': raise RuntimeError(result)
+    return result
+
+
+class LayoutPool(object):
+    """Runs layout jobs in child processes with at most size jobs at a time
+    per worker. Up to queue_size further jobs wait at most queue_timeout
+    seconds for a slot; beyond that LayoutBusy is raised immediately so that
+    a few giant graphs cannot starve all other requests. Jobs running longer
+    than timeout seconds are killed."""
+
+    def __init__(self, size=2, queue_size=4, timeout=10, queue_timeout=2):
+        self.size = size
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.running = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self._cond = threading.Condition()
+
+    def init_app(self, app):
+        """Configure pool from app config."""
+
+        self.size = app.config.get('LAYOUT_POOL_SIZE', self.size)
+        self.queue_size = app.config.get('LAYOUT_QUEUE_SIZE', self.queue_size)
+        self.timeout = app.config.get('LAYOUT_TIMEOUT', self.timeout)
+        self.queue_timeout = app.config.get('LAYOUT_QUEUE_TIMEOUT', self.queue_timeout)
+        app.extensions['layout_pool'] = self
+
+    def _acquire(self):
+        with self._cond:
+            if self.running >= self.size:
+                if self.waiting >= self.queue_size:
+                    self.rejected += 1
+                    raise LayoutBusy("Layout queue is full.")
+                self.waiting += 1
+                deadline = time.time() + self.queue_timeout
+                try:
+                    while self.running >= self.size:
+                        remaining = deadline - time.time()
+                        if remaining <= 0:
+                            self.rejected += 1
+                            raise LayoutBusy("Timed out waiting for a layout slot.")
+                        self._cond.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            self.running += 1
+
+    def _release(self):
+        with self._cond:
+            self.running -= 1
+            self._cond.notify()
+
+    def run(self, func, *args):
+        """Run func(*args) in a child process and return its result."""
+
+        self._acquire()
+        try:
+            return run_in_child(func, args, self.timeout)
+        except LayoutTimeout:
+            with self._cond: self.timeouts += 1
+            raise
+        finally:
+            self._release()
+
+    def stats(self):
+        """Return dict of pool settings and counters."""
+
+        return {
+            'size': self.size,
+            'queue_size': self.queue_size,
+            'running': self.running,
+            'waiting': self.waiting,
+            'rejected': self.rejected,
+            'timeouts': self.timeouts,
+        }
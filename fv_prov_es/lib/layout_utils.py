@@ -0,0 +1,71 @@
+from flask import current_app
+
+from fv_prov_es import layout_pool
+from .graphviz import get_topology, graphviz_layout
+from .layered_layout import layered_layout, incremental_layout
+
+
+# layout engines by name; each takes a node count and list of (source
+# index, target index) edges and returns a list of (x, y) positions
+LAYOUT_ENGINES = {
+    'dot': graphviz_layout,
+    'layered': layered_layout,
+}
+
+
+def get_layout_positions(engine, n, edges, dot_cmd='dot'):
+    """Return node positions of a graph laid out with the specified engine.
+    If the dot executable is missing, fall back to the layered layout."""
+
+    if engine == 'dot':
+        try: return graphviz_layout(n, edges, dot_cmd)
+        except OSError: pass
+    return layered_layout(n, edges)
+
+
+def set_layout_positions(viz_data, positions):
+    """Set gv_x/gv_y of viz data nodes from a list of (x, y) positions."""
+
+    for node_data, (x, y) in zip(viz_data['nodes'], positions):
+        node_data['gv_x'] = x
+        node_data['gv_y'] = y
+    return viz_data
+
+
+def get_pinned_positions(viz_data):
+    """Return dict of node index to (x, y) position of the viz data nodes
+    that already have positions."""
+
+    return dict((i, (node_data['gv_x'], node_data['gv_y']))
+                for i, node_data in enumerate(viz_data['nodes'])
+                if node_data.get('gv_x') is not None and node_data.get('gv_y') is not None)
+
+
+def add_layout_positions(viz_data, engine='dot', pinned=None):
+    """Take viz data and add positions using the specified layout engine.
+    Graphs with more than LAYOUT_INLINE_NODES nodes are laid out in the
+    layout pool, which raises LayoutBusy or LayoutTimeout when saturated.
+
+    If pinned positions are given and at most LAYOUT_INCREMENTAL_NODES
+    nodes are new, only the new nodes are placed around the pinned ones."""
+
+    if engine not in LAYOUT_ENGINES:
+        raise ValueError("Invalid layout engine %s." % engine)
+    n, edges = get_topology(viz_data)
+    if pinned and n - len(pinned) <= current_app.config.get('LAYOUT_INCREMENTAL_NODES', 0):
+        return set_layout_positions(viz_data, incremental_layout(n, edges, pinned))
+    args = (engine, n, edges, current_app.config.get('GRAPHVIZ_DOT', 'dot'))
+    if n <= current_app.config.get('LAYOUT_INLINE_NODES', 0):
+        positions = get_layout_positions(*args)
+    else: positions = layout_pool.run(get_layout_positions, *args)
+    return set_layout_positions(viz_data, positions)
+
+
+def add_degraded_positions(viz_data):
+    """Take viz data and add positions of a layered layout without crossing
+    reduction; used when the layout pool is saturated. The layout runs in
+    the worker, so callers must bound the graph size with
+    LAYOUT_DEGRADE_NODES."""
+
+    n, edges = get_topology(viz_data)
+    return set_layout_positions(viz_data, layered_layout(n, edges, sweeps=0, passes=0))
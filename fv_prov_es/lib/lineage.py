@@ -0,0 +1,188 @@
+import json
+
+from flask import current_app
+
+from fv_prov_es import es
+from .utils import PROV_RELATIONS, update_dict, get_prov_es_jsons
+
+
+# data flow direction of lineage relations: (upstream attribute, downstream attribute)
+LINEAGE_RELATIONS = {
+    'used':              ('prov:entity', 'prov:activity'),
+    'wasGeneratedBy':    ('prov:activity', 'prov:entity'),
+    'hadMember':         ('prov:entity', 'prov:collection'),
+    'wasAssociatedWith': ('prov:agent', 'prov:activity'),
+}
+
+# attributes that are traversed into but not out of; agents are associated
+# with too many activities to be useful hops
+LEAF_ATTRS = ('prov:agent',)
+
+DIRECTIONS = ('upstream', 'downstream', 'both')
+
+# edge index -> whether it holds edges, checked once per worker; enabling
+# LINEAGE_USE_EDGE_INDEX after a backfill restarts the workers anyway
+EDGE_INDEX_CHECKS = {}
+
+
+def search(index, query):
+    """Run ES query and return result."""
+
+    r = es.post('/%s/_search' % index, data=json.dumps(query))
+    result = r.json()
+    if r.status_code != 200:
+        current_app.logger.debug("Failed to query ES. Got status code %d:\n%s" %
+                                 (r.status_code, json.dumps(result, indent=2)))
+    r.raise_for_status()
+    return result
+
+
+def get_alias_edges(frontier, size):
+    """Return lineage edges (relation id, upstream id, upstream attribute,
+       downstream id, downstream attribute) of frontier concepts from the
+       relation documents in the PROV-ES alias. Return a tuple of (edges,
+       PROV-ES docs of matched concepts and relations, truncated flag)."""
+
+    should = [ { 'ids': { 'values': frontier } } ]
+    attrs = set()
+    for up_attr, down_attr in LINEAGE_RELATIONS.itervalues():
+        attrs.update([up_attr, down_attr])
+    for attr in sorted(attrs):
+        should.append({ 'terms': { '%s.raw' % attr: frontier } })
+    query = {
+        'query': { 'bool': { 'should': should } },
+        'size': size,
+    }
+    result = search(current_app.config['PROVES_ES_ALIAS'], query)
+
+    edges = []
+    docs = {}
+    for hit in result['hits']['hits']:
+        pej = hit['_source'].get('prov_es_json', {})
+        docs[hit['_id']] = pej
+        if hit['_type'] not in LINEAGE_RELATIONS: continue
+        rel = pej.get(hit['_type'], {}).get(hit['_id'], hit['_source'])
+        up_attr, down_attr = LINEAGE_RELATIONS[hit['_type']]
+        edges.append((hit['_id'], rel.get(up_attr), up_attr, rel.get(down_attr), down_attr))
+    return edges, docs, result['hits']['total'] > len(result['hits']['hits'])
+
+
+def get_index_edges(frontier, size):
+    """Return lineage edges of frontier concepts from the edge index. Return
+       a tuple of (edges, empty docs dict, truncated flag)."""
+
+    query = {
+        'query': {
+            'bool': {
+                'must': [ { 'terms': { 'relation': LINEAGE_RELATIONS.keys() } } ],
+                'should': [
+                    { 'terms': { 'source': frontier } },
+                    { 'terms': { 'target': frontier } },
+                ],
+                'minimum_should_match': 1,
+            }
+        },
+        'size': size,
+    }
+    result = search(current_app.config['PROVES_ES_EDGE_INDEX'], query)
+
+    edges = []
+    for hit in result['hits']['hits']:
+        edge = hit['_source']
+        sub_attr, obj_attr = PROV_RELATIONS[edge['relation']]
+        ids = { sub_attr: edge['source'], obj_attr: edge['target'] }
+        up_attr, down_attr = LINEAGE_RELATIONS[edge['relation']]
+        edges.append((edge['doc_id'], ids[up_attr], up_attr, ids[down_attr], down_attr))
+    return edges, {}, result['hits']['total'] > len(result['hits']['hits'])
+
+
+def has_edges(index):
+    """Return True if the edge index exists and holds any edges. The result
+       is cached for the life of the worker."""
+
+    if index not in EDGE_INDEX_CHECKS:
+        r = es.get('/%s/_count' % index)
+        if r.status_code == 404: EDGE_INDEX_CHECKS[index] = False
+        else:
+            r.raise_for_status()
+            EDGE_INDEX_CHECKS[index] = r.json()['count'] > 0
+    return EDGE_INDEX_CHECKS[index]
+
+
+def get_neighbors(edge, frontier, direction):
+    """Return list of (neighbor id, attribute) reached from frontier concepts
+       through a lineage edge."""
+
+    doc_id, up_id, up_attr, down_id, down_attr = edge
+    neighbors = []
+    if direction in ('downstream', 'both') and up_id in frontier and down_id is not None:
+        neighbors.append((down_id, down_attr))
+    if direction in ('upstream', 'both') and down_id in frontier and up_id is not None:
+        neighbors.append((up_id, up_attr))
+    return neighbors
+
+
+def traverse_lineage(id, depth=1, direction='both', max_nodes=500, hop_size=1000):
+    """Breadth-first traversal of lineage relations starting at a concept.
+       Each hop is fetched with a single ES query; documents not returned by
+       the hop queries are fetched in batches at the end. Adjacency is looked
+       up in the edge index if enabled and it holds edges, else in the
+       relation documents. Return a tuple of the merged PROV-ES JSON subgraph
+       and traversal metadata."""
+
+    if direction not in DIRECTIONS:
+        raise ValueError("Invalid lineage direction %s." % direction)
+    edge_index = current_app.config.get('PROVES_ES_EDGE_INDEX', None)
+    if current_app.config.get('LINEAGE_USE_EDGE_INDEX', False) and \
+       edge_index is not None and has_edges(edge_index):
+        get_edges = get_index_edges
+    else: get_edges = get_alias_edges
+
+    docs = {}
+    nodes = set([id])
+    relations = set()
+    frontier = [id]
+    truncated = False
+    hop = 0
+    while len(frontier) > 0 and hop < depth:
+        edges, hop_docs, hop_truncated = get_edges(frontier, hop_size)
+        docs.update(hop_docs)
+        if hop_truncated: truncated = True
+
+        # add relations whose neighbors fit the node budget
+        frontier_set = set(frontier)
+        next_frontier = []
+        for edge in edges:
+            neighbors = get_neighbors(edge, frontier_set, direction)
+            if len(neighbors) == 0: continue
+            in_budget = True
+            for neighbor_id, attr in neighbors:
+                if neighbor_id in nodes: continue
+                if len(nodes) >= max_nodes:
+                    in_budget = False
+                    truncated = True
+                    continue
+                nodes.add(neighbor_id)
+                if attr not in LEAF_ATTRS: next_frontier.append(neighbor_id)
+            if in_budget: relations.add(edge[0])
+        frontier = next_frontier
+        hop += 1
+
+    # merge documents of all traversed concepts and relations
+    doc_ids = nodes | relations
+    missing = [i for i in doc_ids if i not in docs]
+    for i, hit in get_prov_es_jsons(missing).iteritems():
+        docs[i] = hit['_source'].get('prov_es_json', {})
+    merged_doc = {}
+    for i in doc_ids:
+        if i in docs: merged_doc = update_dict(merged_doc, docs[i])
+
+    return merged_doc, {
+        'id': id,
+        'direction': direction,
+        'depth': hop,
+        'nodes': len(nodes),
+        'max_nodes': max_nodes,
+        'unexpanded': len(frontier),
+        'truncated': truncated,
+    }
@@ -0,0 +1,318 @@
+import os, json, time, errno, fcntl, atexit, select, threading
+from tempfile import mkstemp, gettempdir
+from subprocess import Popen, PIPE
+
+
+class ConverterBusy(Exception):
+    """Raised when no converter process frees up in time."""
+    pass
+
+
+class ConverterError(Exception):
+    """Raised when a conversion fails or a converter process dies."""
+    pass
+
+
+class ConverterSlots(object):
+    """Host-wide limit of count converter processes shared by all processes
+    using the same lock_dir. Each slot is a lock file; a slot is held by
+    keeping its file locked and is freed by closing it, which the OS also
+    does when the holder exits."""
+
+    def __init__(self, lock_dir, count):
+        self.lock_dir = lock_dir
+        self.count = count
+
+    def acquire(self):
+        """Return file descriptor of a locked free slot or None."""
+
+        for i in range(self.count):
+            fd = os.open(os.path.join(self.lock_dir, 'provconvert-slot-%d.lock' % i),
+                         os.O_RDWR | os.O_CREAT, 0644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except IOError:
+                os.close(fd)
+        return None
+
+    def wait(self, deadline):
+        """Return file descriptor of a locked slot, polling until deadline;
+        None if none frees up."""
+
+        while True:
+            fd = self.acquire()
+            if fd is not None or time.time() >= deadline: return fd
+            time.sleep(min(0.05, max(0, deadline - time.time())))
+
+
+class ConverterProcess(object):
+    """A long-lived provconvert server that converts the files named on each
+    line of its stdin and answers with one line on its stdout. The process
+    holds the global slot slot, if any, until it is killed, and belongs to
+    the given pool generation."""
+
+    def __init__(self, cmd, slot=None, generation=0):
+        self.slot = slot
+        self.generation = generation
+        self.owner = os.getpid()
+        self.proc = Popen([cmd], stdin=PIPE, stdout=PIPE, close_fds=True)
+        self.checked = time.time()
+
+    def alive(self):
+        return self.proc.poll() is None
+
+    def kill(self):
+        if self.alive():
+            try: self.proc.kill()
+            except OSError: pass
+        self.proc.wait()
+        self.forget()
+
+    def forget(self):
+        """Close this process' handle on its slot."""
+
+        if self.slot is not None:
+            os.close(self.slot)
+            self.slot = None
+
+    def request(self, line, timeout):
+        """Send a request line and return the response line. The process is
+        killed and ConverterError raised if it does not answer within
+        timeout seconds or exits."""
+
+        try:
+            self.proc.stdin.write(line + "\n")
+            self.proc.stdin.flush()
+        except IOError, e:
+            self.kill()
+            raise ConverterError("Converter exited: %s" % str(e))
+        fd = self.proc.stdout.fileno()
+        deadline = time.time() + timeout
+        data = ""
+        while not data.endswith("\n"):
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                self.kill()
+                raise ConverterError("Conversion did not finish within %s seconds." % timeout)
+            try: ready = select.select([fd], [], [], remaining)[0]
+            except select.error, e:
+                if e.args[0] == errno.EINTR: continue
+                raise
+            if not ready: continue
+            chunk = os.read(fd, 4096)
+            if not chunk:
+                self.kill()
+                raise ConverterError("Converter exited with status %s." % self.proc.returncode)
+            data += chunk
+        self.checked = time.time()
+        return data.strip()
+
+    def ping(self, timeout):
+        """Return True if the process answers a health check."""
+
+        try: return self.request("PING", timeout) == "PONG"
+        except ConverterError: return False
+
+
+class ProvConvertPool(object):
+    """Pool of at most size warm provconvert server processes per worker.
+    Processes are started on demand, checked with a PING when idle longer
+    than health_interval seconds and replaced when they die or time out.
+    Jobs wait at most queue_timeout seconds for a free process before
+    ConverterBusy is raised.
+
+    If global_slots is set, the processes of all workers on the host are
+    limited to that many by lock files in lock_dir, and processes idle
+    longer than idle_timeout seconds are stopped to free their slots.
+
+    close() stops the pool's processes; it is called at exit once the pool
+    is configured with init_app()."""
+
+    def __init__(self, cmd=None, size=2, timeout=60, queue_timeout=10, health_interval=60,
+                 global_slots=None, lock_dir=None, idle_timeout=300):
+        self.cmd = cmd
+        self.size = size
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.health_interval = health_interval
+        self.slots = None
+        if global_slots: self.slots = ConverterSlots(lock_dir or gettempdir(), global_slots)
+        self.idle_timeout = idle_timeout
+        self.conversions = 0
+        self.failures = 0
+        self.restarts = 0
+        self.rejected = 0
+        self._idle = []
+        self._busy = 0
+        self._pid = None
+        self._generation = 0
+        self._reaper = None
+        self._stopped = threading.Event()
+        self._registered = False
+        self._cond = threading.Condition()
+
+    def init_app(self, app):
+        """Configure pool from app config; the command defaults to the
+        bundled provconvert-server. Processes of a previous configuration
+        are stopped."""
+
+        self.close()
+        self.cmd = app.config.get('PROVCONVERT_CMD', None) or os.path.normpath(
+            os.path.join(app.root_path, '..', 'scripts', 'provToolbox', 'bin', 'provconvert-server'))
+        self.size = app.config.get('PROVCONVERT_POOL_SIZE', self.size)
+        self.timeout = app.config.get('PROVCONVERT_TIMEOUT', self.timeout)
+        self.queue_timeout = app.config.get('PROVCONVERT_QUEUE_TIMEOUT', self.queue_timeout)
+        self.health_interval = app.config.get('PROVCONVERT_HEALTH_INTERVAL', self.health_interval)
+        self.slots = None
+        if app.config.get('PROVCONVERT_GLOBAL_SLOTS', None):
+            self.slots = ConverterSlots(app.config.get('PROVCONVERT_LOCK_DIR', None) or gettempdir(),
+                                        app.config['PROVCONVERT_GLOBAL_SLOTS'])
+        self.idle_timeout = app.config.get('PROVCONVERT_IDLE_TIMEOUT', self.idle_timeout)
+        if not self._registered:
+            atexit.register(self.close)
+            self._registered = True
+        app.extensions['provconvert'] = self
+
+    def _reset(self):
+        """Start a new generation of processes and its reaper; called with
+        the condition held."""
+
+        self._pid = os.getpid()
+        self._generation += 1
+        self._idle = []
+        self._busy = 0
+        self._stopped = threading.Event()
+        self._reaper = None
+        if self.slots is not None and self.idle_timeout:
+            self._reaper = threading.Thread(target=self._reap, args=(self._stopped,))
+            self._reaper.daemon = True
+            self._reaper.start()
+
+    def close(self):
+        """Stop the reaper and kill idle processes; processes in use are
+        killed when they are released. The pool starts afresh when used
+        again."""
+
+        with self._cond:
+            # processes of a parent are not ours to stop after a fork
+            if self._pid != os.getpid(): return
+            self._pid = None
+            self._stopped.set()
+            reaper, self._reaper = self._reaper, None
+            idle, self._idle = self._idle, []
+        if reaper is not None: reaper.join()
+        for proc in idle: proc.kill()
+
+    def _acquire(self):
+        """Return a healthy converter process, starting one if fewer than
+        size processes exist."""
+
+        with self._cond:
+            # processes of a parent are not ours after a fork
+            if self._pid != os.getpid():
+                for proc in self._idle: proc.forget()
+                self._reset()
+            deadline = time.time() + self.queue_timeout
+            while not self._idle and self._busy >= self.size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    self.rejected += 1
+                    raise ConverterBusy("No converter available within %s seconds." % self.queue_timeout)
+                self._cond.wait(remaining)
+            self._busy += 1
+            generation = self._generation
+            proc = self._idle.pop() if self._idle else None
+
+        try:
+            if proc is not None and (not proc.alive() or
+                                     (time.time() - proc.checked > self.health_interval and
+                                      not proc.ping(min(self.timeout, 10)))):
+                proc.kill()
+                proc = None
+                with self._cond: self.restarts += 1
+            if proc is None: proc = self._start(deadline, generation)
+        except:
+            self._release(None, generation)
+            raise
+        return proc
+
+    def _start(self, deadline, generation):
+        """Start a converter process of a generation, waiting until deadline
+        for a global slot."""
+
+        if self.slots is None: return ConverterProcess(self.cmd, None, generation)
+        slot = self.slots.wait(deadline)
+        if slot is None:
+            with self._cond: self.rejected += 1
+            raise ConverterBusy("All %d converter slots of the host are in use." % self.slots.count)
+        try: return ConverterProcess(self.cmd, slot, generation)
+        except:
+            os.close(slot)
+            raise
+
+    def _release(self, proc, generation=None):
+        with self._cond:
+            if proc is not None: generation = proc.generation
+            if generation != self._generation or self._pid != os.getpid():
+                # acquired before the pool was closed or forked
+                if proc is not None:
+                    if proc.owner == os.getpid(): proc.kill()
+                    else: proc.forget()
+                return
+            self._busy -= 1
+            if proc is not None:
+                if proc.alive(): self._idle.append(proc)
+                else: proc.kill()
+            self._cond.notify()
+
+    def _reap(self, stopped):
+        """Stop processes idle longer than idle_timeout until the stopped
+        event is set."""
+
+        while not stopped.wait(min(self.idle_timeout, 10)):
+            with self._cond:
+                now = time.time()
+                expired = [p for p in self._idle if now - p.checked > self.idle_timeout]
+                self._idle = [p for p in self._idle if p not in expired]
+            for proc in expired: proc.kill()
+
+    def convert(self, pej, fmt):
+        """Convert a PROV-JSON document to the format of the given file
+        extension and return the output."""
+
+        fd, json_file = mkstemp(suffix='.json')
+        os.close(fd)
+        fd, out_file = mkstemp(suffix='.%s' % fmt)
+        os.close(fd)
+        try:
+            with open(json_file, 'w') as f: json.dump(pej, f)
+            proc = self._acquire()
+            try: response = proc.request("%s\t%s" % (json_file, out_file), self.timeout)
+            except ConverterError:
+                with self._cond: self.failures += 1
+                raise
+            finally:
+                self._release(proc)
+            if response != "OK":
+                with self._cond: self.failures += 1
+                raise ConverterError("Conversion failed: %s" % response)
+            with self._cond: self.conversions += 1
+            with open(out_file) as f: return f.read()
+        finally:
+            os.unlink(json_file)
+            os.unlink(out_file)
+
+    def stats(self):
+        """Return dict of pool settings and counters."""
+
+        return {
+            'size': self.size,
+            'global_slots': None if self.slots is None else self.slots.count,
+            'busy': self._busy,
+            'idle': len(self._idle),
+            'conversions': self.conversions,
+            'failures': self.failures,
+            'restarts': self.restarts,
+            'rejected': self.rejected,
+        }
@@ -0,0 +1,363 @@
+import re, decimal, datetime
+
+
+PROV_NS = "http://www.w3.org/ns/prov#"
+XSD_NS = "http://www.w3.org/2001/XMLSchema#"
+RDF_NS = "http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+RDFS_NS = "http://www.w3.org/2000/01/rdf-schema#"
+
+# namespaces always declared
+DEFAULT_PREFIXES = (
+    ('prov', PROV_NS),
+    ('xsd', XSD_NS),
+    ('rdf', RDF_NS),
+    ('rdfs', RDFS_NS),
+)
+
+# element types and their PROV-O classes
+ELEMENTS = (
+    ('entity', 'prov:Entity'),
+    ('activity', 'prov:Activity'),
+    ('agent', 'prov:Agent'),
+)
+
+# PROV attributes mapped to PROV-O properties; qualified name values of
+# prov:type become rdf:type statements
+ATTRIBUTES = {
+    'prov:label':     'rdfs:label',
+    'prov:location':  'prov:atLocation',
+    'prov:role':      'prov:hadRole',
+    'prov:startTime': 'prov:startedAtTime',
+    'prov:endTime':   'prov:endedAtTime',
+    'prov:time':      'prov:atTime',
+}
+
+# PROV attributes that hold xsd:dateTime values when given as plain strings
+TIME_ATTRIBUTES = ('prov:startTime', 'prov:endTime', 'prov:time')
+
+# prov:type values of derivations that replace prov:Derivation and
+# prov:qualifiedDerivation by their own class and qualified property
+DERIVATION_TYPES = ('prov:Revision', 'prov:Quotation', 'prov:PrimarySource')
+
+# relations: (subject attribute, property, object attribute, qualified
+# property, qualified class, influencer property, dict of further attributes
+# that reference records to their properties). Relations without qualified
+# form drop their attributes; provconvert rejects the prov:type of hadMember
+# added by the GCIS import.
+RELATIONS = (
+    ('used', ('prov:activity', 'prov:used', 'prov:entity',
+              'prov:qualifiedUsage', 'prov:Usage', 'prov:entity', {})),
+    ('wasGeneratedBy', ('prov:entity', 'prov:wasGeneratedBy', 'prov:activity',
+                        'prov:qualifiedGeneration', 'prov:Generation', 'prov:activity', {})),
+    ('wasInvalidatedBy', ('prov:entity', 'prov:wasInvalidatedBy', 'prov:activity',
+                          'prov:qualifiedInvalidation', 'prov:Invalidation', 'prov:activity', {})),
+    ('wasStartedBy', ('prov:activity', 'prov:wasStartedBy', 'prov:trigger',
+                      'prov:qualifiedStart', 'prov:Start', 'prov:entity',
+                      {'prov:starter': 'prov:hadActivity'})),
+    ('wasEndedBy', ('prov:activity', 'prov:wasEndedBy', 'prov:trigger',
+                    'prov:qualifiedEnd', 'prov:End', 'prov:entity',
+                    {'prov:ender': 'prov:hadActivity'})),
+    ('wasAssociatedWith', ('prov:activity', 'prov:wasAssociatedWith', 'prov:agent',
+                           'prov:qualifiedAssociation', 'prov:Association', 'prov:agent',
+                           {'prov:plan': 'prov:hadPlan'})),
+    ('wasAttributedTo', ('prov:entity', 'prov:wasAttributedTo', 'prov:agent',
+                         'prov:qualifiedAttribution', 'prov:Attribution', 'prov:agent', {})),
+    ('actedOnBehalfOf', ('prov:delegate', 'prov:actedOnBehalfOf', 'prov:responsible',
+                         'prov:qualifiedDelegation', 'prov:Delegation', 'prov:agent',
+                         {'prov:activity': 'prov:hadActivity'})),
+    ('wasDerivedFrom', ('prov:generatedEntity', 'prov:wasDerivedFrom', 'prov:usedEntity',
+                        'prov:qualifiedDerivation', 'prov:Derivation', 'prov:entity',
+                        {'prov:activity': 'prov:hadActivity',
+                         'prov:generation': 'prov:hadGeneration',
+                         'prov:usage': 'prov:hadUsage'})),
+    ('wasInformedBy', ('prov:informed', 'prov:wasInformedBy', 'prov:informant',
+                       'prov:qualifiedCommunication', 'prov:Communication', 'prov:activity', {})),
+    ('wasInfluencedBy', ('prov:influencee', 'prov:wasInfluencedBy', 'prov:influencer',
+                         'prov:qualifiedInfluence', 'prov:Influence', 'prov:influencer', {})),
+    ('specializationOf', ('prov:specificEntity', 'prov:specializationOf', 'prov:generalEntity',
+                          None, None, None, {})),
+    # provconvert writes alternate2 prov:alternateOf alternate1
+    ('alternateOf', ('prov:alternate2', 'prov:alternateOf', 'prov:alternate1',
+                     None, None, None, {})),
+    ('hadMember', ('prov:collection', 'prov:hadMember', 'prov:entity',
+                   None, None, None, {})),
+)
+
+# local parts that can be written as prefixed names
+LOCAL_NAME_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_-]*$')
+
+# characters escaped in IRIs and string literals
+IRI_ESCAPE_RE = re.compile(u'[\x00-\x20<>"{}|^`\\\\]')
+STRING_ESCAPES = {'\\': '\\\\', '"': '\\"', '\n': '\\n', '\r': '\\r', '\t': '\\t'}
+STRING_ESCAPE_RE = re.compile(r'[\\"\n\r\t]')
+
+# Integer.parseInt() syntax, with any Unicode decimal digits, and
+# Double.parseDouble() syntax, after trimming JAVA_WHITESPACE
+INT_RE = re.compile(r'^[+-]?\d+\Z', re.U)
+DOUBLE_RE = re.compile(r'^[+-]?(?:NaN|Infinity|(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][+-]?[0-9]+)?[fFdD]?)\Z')
+JAVA_WHITESPACE = u''.join(map(unichr, range(33)))
+
+# ISO 8601 date and time with optional time, fraction and time zone
+DATETIME_RE = re.compile(r'^(\d{4})-(\d\d)-(\d\d)(?:T(\d\d):(\d\d)(?::(\d\d)(?:\.(\d+))?)?)?'
+                         r'(Z|([+-])(\d\d):?(\d\d))?$')
+
+
+def get_xsd_datetime(value):
+    """Return a PROV time as provconvert writes it: in UTC with
+    milliseconds, times without zone taken as UTC; None if value is not an
+    ISO 8601 date or time."""
+
+    m = DATETIME_RE.match(value.strip())
+    if m is None: return None
+    year, month, day, hour, minute, second, fraction, zone, sign, zh, zm = m.groups()
+    try:
+        t = datetime.datetime(int(year), int(month), int(day), int(hour or 0),
+                              int(minute or 0), int(second or 0))
+    except ValueError: return None
+    if sign is not None:
+        offset = datetime.timedelta(hours=int(zh), minutes=int(zm))
+        t = t - offset if sign == '+' else t + offset
+    millis = int((fraction or '')[:3].ljust(3, '0'))
+    return u'%04d-%02d-%02dT%02d:%02d:%02d.%03dZ' % (t.year, t.month, t.day, t.hour,
+                                                      t.minute, t.second, millis)
+
+
+def get_java_number(value):
+    """Return the int or float a string attribute value is read as by
+    provconvert, which tries Integer.parseInt() and Double.parseDouble(),
+    or None if it reads as neither. Hexadecimal floats are not read."""
+
+    if INT_RE.match(value):
+        number = int(value)
+        if -2**31 <= number < 2**31: return number
+    text = value.strip(JAVA_WHITESPACE)
+    if DOUBLE_RE.match(text):
+        return float(text.rstrip('fFdD').replace('Infinity', 'inf'))
+    return None
+
+
+def get_java_double(value):
+    """Return a float as Java's Double.toString() writes it, which is how
+    provconvert writes xsd:double values."""
+
+    if value != value: return u'NaN'
+    if value in (float('inf'), float('-inf')): return u'Infinity' if value > 0 else u'-Infinity'
+    if value == 0: return u'-0.0' if str(value).startswith('-') else u'0.0'
+    if 1e-3 <= abs(value) < 1e7:
+        text = repr(value)
+        return unicode(text if '.' in text else text + '.0')
+    d = decimal.Decimal(repr(value))
+    sign, digits, exponent = d.as_tuple()
+    digits = ''.join(map(str, digits)).rstrip('0')
+    return u'%s%s.%sE%d' % ('-' if sign else '', digits[0], digits[1:] or '0', d.adjusted())
+
+
+class TurtleWriter(object):
+    """Writes Turtle terms for the prefixes of a PROV-JSON document."""
+
+    def __init__(self, prefixes):
+        self.prefixes = dict(DEFAULT_PREFIXES)
+        self.prefixes.update(prefixes)
+        self.blanks = {}
+        self.terms = {}
+
+    def iri(self, iri):
+        """Return Turtle IRI reference."""
+
+        return u'<%s>' % IRI_ESCAPE_RE.sub(lambda m: u'\\u%04X' % ord(m.group(0)), iri)
+
+    def qname(self, qname):
+        """Return Turtle term of a PROV-JSON qualified name: a prefixed name
+        if the prefix is declared and the local part allows it, else the
+        expanded IRI. Qualified names with undeclared prefixes are taken as
+        IRIs and names without prefix belong to the default namespace."""
+
+        term = self.terms.get(qname, None)
+        if term is not None: return term
+        if qname.startswith('_:'): return self.blank(qname)
+        if ':' in qname: prefix, local = qname.split(':', 1)
+        else: prefix, local = 'default', qname
+        if prefix not in self.prefixes: term = self.iri(qname)
+        elif prefix != 'default' and LOCAL_NAME_RE.match(local):
+            term = u'%s:%s' % (prefix, local)
+        else: term = self.iri(self.prefixes[prefix] + local)
+        self.terms[qname] = term
+        return term
+
+    def blank(self, id=None):
+        """Return blank node label for a blank node identifier of the
+        document or a new one if id is None. Labels of the document are not
+        reused since they need not be valid Turtle."""
+
+        if id is None or id not in self.blanks:
+            label = u'_:b%d' % (len(self.blanks) + 1)
+            self.blanks[label if id is None else id] = label
+            return label
+        return self.blanks[id]
+
+    def string(self, value):
+        """Return quoted Turtle string."""
+
+        return u'"%s"' % STRING_ESCAPE_RE.sub(lambda m: STRING_ESCAPES[m.group(0)], value)
+
+    def values(self, value, datatype='xsd:string'):
+        """Return list of Turtle terms of a PROV-JSON attribute value, which
+        may be a list of values, typed as provconvert types them. Plain
+        strings are typed with datatype, or left untyped if it is None;
+        xsd:string values that read as numbers and numbers that fit no
+        xsd:int become xsd:int or xsd:double."""
+
+        if isinstance(value, list):
+            terms = []
+            for v in value: terms.extend(self.values(v, datatype))
+            return terms
+        if isinstance(value, dict):
+            v = unicode(value.get('$', ''))
+            if 'lang' in value: return [u'%s@%s' % (self.string(v), value['lang'])]
+            t = value.get('type', None)
+            if t in ('prov:QualifiedName', 'xsd:QName'): return [self.qname(v)]
+            if t is None or (t == 'xsd:string' and datatype is None): return [self.string(v)]
+            return [u'%s^^%s' % (self.string(v), self.qname(t))]
+        if isinstance(value, basestring) and datatype == 'xsd:string':
+            number = get_java_number(value)
+            if number is not None: value = number
+        if isinstance(value, bool):
+            return [u'"%s"^^xsd:boolean' % ('true' if value else 'false')]
+        if isinstance(value, (int, long)):
+            if -2**31 <= value < 2**31: return [u'"%d"^^xsd:int' % value]
+            value = float(value)
+        if isinstance(value, float): return [u'"%s"^^xsd:double' % get_java_double(value)]
+        value = unicode(value)
+        if datatype == 'xsd:dateTime': value = get_xsd_datetime(value) or value
+        if datatype is None: return [self.string(value)]
+        return [u'%s^^%s' % (self.string(value), datatype)]
+
+    def ref(self, value):
+        """Return Turtle term of a PROV-JSON record reference."""
+
+        if isinstance(value, dict): value = value.get('$', '')
+        return self.qname(unicode(value))
+
+    def refs(self, value):
+        """Return list of Turtle terms of a record reference or a list of
+        them, as hadMember allows."""
+
+        if isinstance(value, list): return [self.ref(v) for v in value]
+        return [self.ref(value)]
+
+    def attributes(self, attrs, skip=()):
+        """Return list of (property, object) tuples of PROV-JSON attributes,
+        types first and the others sorted by attribute name. All prov:type
+        values, literals included, become rdf:type statements and labels
+        are plain literals, as with provconvert."""
+
+        pos = []
+        for attr in sorted(attrs, key=lambda a: (a != 'prov:type', a)):
+            if attr in skip: continue
+            value = attrs[attr]
+            if attr == 'prov:type':
+                pos.extend([('a', o) for o in self.values(value)])
+                continue
+            pred = self.qname(ATTRIBUTES.get(attr, attr))
+            datatype = 'xsd:dateTime' if attr in TIME_ATTRIBUTES else \
+                       None if attr == 'prov:label' else 'xsd:string'
+            pos.extend([(pred, o) for o in self.values(value, datatype)])
+        return pos
+
+    def statement(self, subject, pos):
+        """Return Turtle statement block of a subject and list of
+        (property, object) tuples."""
+
+        lines = []
+        last_pred = None
+        for pred, obj in pos:
+            if pred == last_pred: lines[-1] += u' , %s' % obj
+            else: lines.append(u'%s %s' % (pred, obj))
+            last_pred = pred
+        return u'%s %s .\n\n' % (subject, u' ;\n\t'.join(lines))
+
+
+def get_derivation_type(attrs):
+    """Return the first of DERIVATION_TYPES among the prov:type values of
+    derivation attributes and the attributes without it, or None and the
+    attributes."""
+
+    types = attrs.get('prov:type', [])
+    if not isinstance(types, list): types = [types]
+    for i, t in enumerate(types):
+        if isinstance(t, dict) and t.get('type', None) == 'prov:QualifiedName' and \
+           t.get('$', None) in DERIVATION_TYPES:
+            attrs = dict(attrs)
+            attrs['prov:type'] = types[:i] + types[i+1:]
+            if not attrs['prov:type']: del attrs['prov:type']
+            return t['$'], attrs
+    return None, attrs
+
+
+def iter_document(writer, pej):
+    """Yield Turtle statements of the records of a PROV-JSON document or
+    bundle. Relations with an identifier or further attributes become only
+    a qualified influence node, the others only their unqualified property.
+    Bundles are flattened into the same graph, as Turtle has no named
+    graphs."""
+
+    for element, cls in ELEMENTS:
+        records = pej.get(element, {})
+        for id in sorted(records):
+            attrs = records[id] or {}
+            if isinstance(attrs, list): attrs = attrs[0] if attrs else {}
+            yield writer.statement(writer.qname(id), [('a', cls)] + writer.attributes(attrs))
+
+    for relation, (subj_attr, prop, obj_attr, qual_prop, qual_cls,
+                   influencer, refs) in RELATIONS:
+        records = pej.get(relation, {})
+        for id in sorted(records):
+            attrs = records[id] or {}
+            if isinstance(attrs, list): attrs = attrs[0] if attrs else {}
+            if subj_attr not in attrs: continue
+            subj = writer.ref(attrs[subj_attr])
+
+            # qualified influence for identified relations or further attributes
+            others = [a for a in attrs if a not in (subj_attr, obj_attr)]
+            if qual_prop is None or (id.startswith('_:') and len(others) == 0):
+                if obj_attr in attrs:
+                    yield writer.statement(subj, [(prop, o) for o in writer.refs(attrs[obj_attr])])
+                continue
+            cls, qual_link = qual_cls, qual_prop
+            if relation == 'wasDerivedFrom':
+                derivation, attrs = get_derivation_type(attrs)
+                if derivation is not None:
+                    cls, qual_link = derivation, 'prov:qualified' + derivation[len('prov:'):]
+            qual = writer.qname(id)
+            yield writer.statement(subj, [(qual_link, qual)])
+            qual_pos = [('a', cls)]
+            if obj_attr in attrs: qual_pos.append((influencer, writer.ref(attrs[obj_attr])))
+            for attr in sorted(refs):
+                if attr in attrs: qual_pos.append((refs[attr], writer.ref(attrs[attr])))
+            qual_pos.extend(writer.attributes(attrs, skip=(subj_attr, obj_attr) + tuple(refs)))
+            yield writer.statement(qual, qual_pos)
+
+    bundles = pej.get('bundle', {})
+    for id in sorted(bundles):
+        for statement in iter_document(writer, bundles[id]): yield statement
+
+
+def iter_ttl(pej):
+    """Yield Turtle serialization of a PROV-ES JSON document in chunks."""
+
+    prefixes = dict(pej.get('prefix', {}))
+    for bundle in pej.get('bundle', {}).itervalues():
+        prefixes.update(bundle.get('prefix', {}))
+    writer = TurtleWriter(prefixes)
+
+    yield u''.join([u'@prefix %s: %s .\n' % (prefix, writer.iri(ns))
+                    for prefix, ns in sorted(writer.prefixes.items())
+                    if prefix != 'default'] + [u'\n'])
+    for statement in iter_document(writer, pej): yield statement
+
+
+def get_ttl(pej):
+    """Return Turtle serialization of a PROV-ES JSON document following the
+    PROV-O mapping of ProvToolbox's provconvert."""
+
+    return u''.join(iter_ttl(pej))
@@ -1,12 +1,22 @@
-import os, sys, re, json, requests, collections
+import os, sys, re, json, requests, hashlib, collections
 from StringIO import StringIO
 from lxml.etree import XMLParser, parse, tostring
-from tempfile import mkstemp
-from subprocess import check_call
 
-from flask import current_app
+from fv_prov_es import id_resolver, doc_cache, expansion_map, provconvert
+from fv_prov_es.lib.ttl_utils import get_ttl, iter_ttl
 
-from fv_prov_es import cache
+
+# PROV relations and their (subject, object) attributes
+PROV_RELATIONS = {
+    'used':              ('prov:activity', 'prov:entity'),
+    'wasGeneratedBy':    ('prov:entity', 'prov:activity'),
+    'hadMember':         ('prov:collection', 'prov:entity'),
+    'wasAssociatedWith': ('prov:activity', 'prov:agent'),
+    'actedOnBehalfOf':   ('prov:delegate', 'prov:responsible'),
+    'wasAttributedTo':   ('prov:entity', 'prov:agent'),
+    'wasDerivedFrom':    ('prov:generatedEntity', 'prov:usedEntity'),
+    'wasInformedBy':     ('prov:informed', 'prov:informant'),
+}
 
 
 def get_etree(xml):
@@ -56,14 +66,9 @@ def pprint_xml(et):
 
 
 def get_expansion_map():
-    """Return concept/relation expansion map."""
+    """Return compiled concept/relation expansion map."""
     
-    map_file = os.path.join(current_app.root_path,
-                            current_app.config['PROV_EXPANSION_CFG'])
-    map_file = os.path.normpath(map_file)
-    with open(map_file) as f:
-        prov_exp_map = json.load(f)
-    return prov_exp_map
+    return expansion_map.get()
 
 
 def update_dict(d, u):
@@ -78,50 +83,69 @@ def update_dict(d, u):
     return d
 
 
-@cache.cached(timeout=1000)
+def get_json_hash(obj):
+    """Return hash of the JSON serialization of an object with sorted keys,
+    so equal documents hash alike regardless of key order."""
+
+    return hashlib.sha1(json.dumps(obj, sort_keys=True, separators=(',', ':'))).hexdigest()
+
+
 def get_prov_es_json(id):
     """Get PROV-ES document by ID."""
 
-    # query
-    es_url = current_app.config['ES_URL']
-    es_index = current_app.config['PROVES_ES_ALIAS']
-    query = { 'query': { 'term': { '_id': id } } }
-    #current_app.logger.debug("ES query for query(): %s" % json.dumps(query, indent=2))
-    r = requests.post('%s/%s/_search' % (es_url, es_index), data=json.dumps(query))
-    result = r.json()
-    if r.status_code != 200:
-        current_app.logger.debug("Failed to query ES. Got status code %d:\n%s" %
-                                 (r.status_code, json.dumps(result, indent=2)))
-    r.raise_for_status()
-    #current_app.logger.debug("result: %s" % pformat(r.json()))
+    # check cache
+    hit = doc_cache.get(id)
+    if hit is not None: return hit
+
+    # read from the index holding the id, searching if it is not known
+    hit = id_resolver.get(id)
+    doc_cache.set(id, hit)
+    return hit
+
+
+def get_prov_es_jsons(ids, chunk_size=500):
+    """Get PROV-ES documents by ID in batches. Return dict of ID to document;
+       IDs that were not found are omitted."""
+
+    docs = doc_cache.get_many(set(ids))
+    found = id_resolver.get_many([i for i in set(ids) if i not in docs], chunk_size)
+    for id, hit in found.iteritems(): doc_cache.set(id, hit)
+    docs.update(found)
+    return docs
 
-    # return only result
-    if len(result['hits']['hits']) > 0:
-        return result['hits']['hits'][0]
-    else: return {}
 
+# formats exported with provconvert and their media types
+PROVCONVERT_FORMATS = {
+    'provn': 'text/provenance-notation',
+    'xml':   'application/xml',
+    'rdf':   'application/rdf+xml',
+    'trig':  'application/trig',
+    'svg':   'image/svg+xml',
+    'dot':   'text/vnd.graphviz',
+}
 
-@cache.cached(timeout=1000)
-def get_ttl(pej):
+
+def get_provconvert_json(pej):
+    """Return PROV-ES JSON document as ProvToolbox accepts it."""
 
     # clean out prov:type from hadMember since provToolbox will bomb on it
-    for hm_id in pej.get('hadMember', {}):
-        hm = pej['hadMember'][hm_id]
-        if 'prov:type' in hm: del hm['prov:type']
-
-    # get ttl using ProvToolbox
-    json_file = mkstemp(suffix='.json')[1]
-    ttl_file = mkstemp(suffix='.ttl')[1]
-    provconvert_cmd = os.path.normpath(
-                          os.path.join(current_app.root_path, '..', 'scripts',
-                                       'provToolbox', 'bin', 'provconvert')
-                      )
-    with open(json_file, 'w') as f:
-        json.dump(pej, f, indent=2)
-    #current_app.logger.debug(" ".join([provconvert_cmd, '-infile', json_file, '-outfile', ttl_file]))
-    status = check_call([provconvert_cmd, '-infile', json_file, '-outfile', ttl_file])
-    with open(ttl_file) as f:
-        ttl = f.read()
-    os.unlink(json_file)
-    os.unlink(ttl_file)
-    return ttl
+    if 'hadMember' in pej:
+        pej = dict(pej)
+        pej['hadMember'] = dict((hm_id, dict((k, v) for k, v in hm.iteritems() if k != 'prov:type'))
+                                for hm_id, hm in pej['hadMember'].iteritems())
+    return pej
+
+
+def convert_prov(pej, fmt):
+    """Return PROV-ES JSON document converted by ProvToolbox to the format
+    of the given file extension. Conversions run in the pool of warm
+    provconvert processes."""
+
+    return provconvert.convert(get_provconvert_json(pej), fmt)
+
+
+def get_provconvert_ttl(pej):
+    """Return Turtle of a PROV-ES JSON document converted with provconvert.
+    Superseded by the native get_ttl(); kept for comparison."""
+
+    return convert_prov(pej, 'ttl')
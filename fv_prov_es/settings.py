@@ -2,16 +2,156 @@ class Config(object):
     SECRET_KEY = 'secret key'
     ES_URL = 'http://128.149.122.28:9200' # default port is 9200
 
+    # ES client: max pooled keep-alive connections per worker, timeouts in
+    # seconds and retries on connection errors/gateway errors
+    ES_POOL_MAXSIZE = 20
+    ES_CONNECT_TIMEOUT = 3.05
+    ES_READ_TIMEOUT = 30
+    ES_RETRIES = 2
+
     # for PROVES app
     PROVES_ES_PREFIX = 'prov_es'
     PROVES_ES_ALIAS = 'prov_es'
 
-    # ES template
+    # index of relation edges (source, target, relation) written at ingest;
+    # set to None to disable
+    PROVES_ES_EDGE_INDEX = 'prov_es_edges'
+
+    # ES templates
     ES_TEMPLATE = "../config/es_template-prov_es.json"
+    ES_EDGE_TEMPLATE = "../config/es_template-prov_es_edges.json"
+
+    # max ids per worker whose index is remembered so their documents can
+    # be read with realtime GET/_mget instead of searching the alias
+    ID_LOCATION_CACHE_SIZE = 100000
+
+    # PROV-ES document cache: max docs and seconds cached per worker; set
+    # DOC_CACHE_DIR to also share cached docs between workers and scripts
+    DOC_CACHE_SIZE = 10000
+    DOC_CACHE_TTL = 300
+    DOC_CACHE_DIR = None
+    DOC_CACHE_DIR_THRESHOLD = 50000
+    DOC_CACHE_DIR_TTL = 86400
+
+    # serialized downloads (pretty JSON, Turtle and their gzip variants):
+    # max exports cached per worker; set EXPORT_CACHE_DIR to share them
+    # between workers, and EXPORT_EAGER to generate them at import
+    EXPORT_CACHE_SIZE = 1000
+    EXPORT_CACHE_DIR = None
+    EXPORT_CACHE_DIR_THRESHOLD = 10000
+    EXPORT_CACHE_DIR_TTL = 604800
+    EXPORT_EAGER = False
+
+    # bulk downloads: documents read from ES per batch and how long the ES
+    # scroll of query downloads is kept alive between batches
+    EXPORT_BULK_BATCH_SIZE = 100
+    EXPORT_BULK_SCROLL = '5m'
+
+    # FacetView query responses: max responses cached per worker, seconds
+    # cached and max size in bytes of a cached response; identical queries
+    # running at the same time share one ES request
+    QUERY_CACHE_SIZE = 500
+    QUERY_CACHE_TTL = 10
+    QUERY_CACHE_MAX_BYTES = 1048576
+
+    # _source projections of Query hits selectable with the profile
+    # parameter: list drops the prov_es_json copy in every document, detail
+    # only its prefixes; the full document is fetched on demand by id
+    QUERY_PROFILES = {
+        'list': { 'exclude': [ 'prov_es_json' ] },
+        'detail': { 'exclude': [ 'prov_es_json.prefix' ] },
+    }
+
+    # profile applied to Query requests without a profile parameter; None
+    # returns hits as indexed
+    QUERY_DEFAULT_PROFILE = None
+
+    # facets counted once and refreshed from newly indexed documents, then
+    # served from memory for searches without filters or filtered by
+    # concept: terms fields, most frequent terms fetched per concept and
+    # field, fields with monthly histograms, seconds between refreshes and
+    # full recounts, and seconds documents may take to become searchable.
+    # Fields with mostly unique values (labels, ids, locations) are left to
+    # ES.
+    FACET_TERMS_FIELDS = [
+        '_type', 'prov:type.raw', 'prov:role.raw', 'eos:partOfCollection.raw',
+        'eos:version.raw', 'eos:usesSoftware.raw', 'eos:level.raw',
+        'gcis:implements.raw', 'gcis:implementedIn.raw',
+        'gcis:sourceInstrument.raw', 'gcis:hasInstrument.raw',
+        'gcis:inInstrument.raw', 'gcis:inPlatform.raw', 'gcis:hasSensor.raw',
+        'gcis:hasGoverningOrganization.raw',
+    ]
+    FACET_TERMS_SIZE = 100
+    FACET_DATE_FIELDS = [ 'prov:startTime', 'prov:endTime' ]
+    FACET_REFRESH_INTERVAL = 30
+    FACET_FULL_REFRESH_INTERVAL = 3600
+    FACET_REFRESH_LAG = 5
+
+    # D3 graphs built from PROV-ES documents: max graphs and seconds cached
+    # per worker
+    GRAPH_CACHE_SIZE = 500
+    GRAPH_CACHE_TTL = 600
+
+    # bulk ingest: flush buffered index actions at this many actions or bytes
+    ES_BULK_MAX_ACTIONS = 500
+    ES_BULK_MAX_BYTES = 5242880
+
+    # Graphviz dot executable used to lay out FDL graphs
+    GRAPHVIZ_DOT = "dot"
+
+    # default FDL layout engine: dot (Graphviz) or layered (built-in); can be
+    # overridden per request with the engine parameter
+    LAYOUT_ENGINE = "dot"
+
+    # FDL layouts: max layouts cached per worker and seconds cached; layouts
+    # only depend on graph topology so they don't expire by default
+    LAYOUT_CACHE_SIZE = 1000
+    LAYOUT_CACHE_TTL = None
+
+    # FDL layouts run in child processes: max running and waiting jobs per
+    # worker, seconds a job may run and seconds to wait for a free slot;
+    # graphs with up to LAYOUT_INLINE_NODES nodes are laid out in the worker
+    LAYOUT_POOL_SIZE = 2
+    LAYOUT_QUEUE_SIZE = 4
+    LAYOUT_TIMEOUT = 10
+    LAYOUT_QUEUE_TIMEOUT = 2
+    LAYOUT_INLINE_NODES = 100
+
+    # max new nodes placed around the existing ones by incremental layouts;
+    # larger expansions get a full layout
+    LAYOUT_INCREMENTAL_NODES = 1000
+
+    # when the layout pool is saturated or a job times out, return a quick
+    # layered layout without crossing reduction instead of a 503 response;
+    # it runs in the worker, so larger graphs still get a 503 response
+    LAYOUT_DEGRADE = True
+    LAYOUT_DEGRADE_NODES = 2000
+
+    # warm provconvert processes for exports in formats without native
+    # support: command (defaults to the bundled provconvert-server), max
+    # processes per worker, seconds a conversion may take, seconds to wait
+    # for a free process and seconds of idleness before a health check
+    PROVCONVERT_CMD = None
+    PROVCONVERT_POOL_SIZE = 2
+    PROVCONVERT_TIMEOUT = 60
+    PROVCONVERT_QUEUE_TIMEOUT = 10
+    PROVCONVERT_HEALTH_INTERVAL = 60
+
+    # max provconvert processes of all workers on the host, enforced with
+    # lock files in PROVCONVERT_LOCK_DIR (defaults to the temp dir); idle
+    # processes are stopped after PROVCONVERT_IDLE_TIMEOUT seconds so other
+    # workers can use their slots. None leaves only the per-worker limit.
+    PROVCONVERT_GLOBAL_SLOTS = 4
+    PROVCONVERT_LOCK_DIR = None
+    PROVCONVERT_IDLE_TIMEOUT = 300
 
     # concept expansion mapping
     PROV_EXPANSION_CFG = "../config/prov_expansion_map.json"
 
+    # seconds between checks for changes to the expansion map; 0 disables
+    # reloading
+    PROV_EXPANSION_CHECK_INTERVAL = 30
+
     # title and descriptions
     TITLE = "PROV-ES Facet Search"
     DESCRIPTION = "faceted search interface for earth science provenance"
@@ -20,6 +160,20 @@ class Config(object):
     # max lineage nodes to add to FDL per query; if exceeded, prompt user
     LINEAGE_NODES_MAX = 50
 
+    # server-side lineage traversal: default and max hops, max nodes per
+    # traversal and max ES hits fetched per hop
+    LINEAGE_DEPTH = 1
+    LINEAGE_DEPTH_MAX = 10
+    LINEAGE_NODE_BUDGET = 500
+    LINEAGE_HOP_SIZE = 1000
+
+    # look up lineage adjacency in the edge index instead of the relation
+    # documents; enable after backfilling edges of existing documents
+    # (scripts/backfill_edges.py). Lineage falls back to the relation
+    # documents if the edge index is missing or empty when a worker first
+    # checks it.
+    LINEAGE_USE_EDGE_INDEX = False
+
 
 class ProdConfig(Config):
     SQLALCHEMY_DATABASE_URI = 'sqlite:///../database.db'
@@ -42,6 +196,7 @@ class DevConfig(Config):
     # for PROVES app
     PROVES_ES_PREFIX = 'prov_es_dev'
     PROVES_ES_ALIAS = 'prov_es_dev'
+    PROVES_ES_EDGE_INDEX = 'prov_es_dev_edges'
 
     # title and descriptions
     BADGE = "DEV"
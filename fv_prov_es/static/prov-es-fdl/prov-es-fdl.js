@@ -554,29 +554,45 @@ function addNodesAndLinks(json) {
     }
   });
       
-  // get graphviz location info
+  // add new links and redraw
+  function addLinks() {
+    new_links.forEach(function(nl) {
+      var link_id = nl.source + '_' + nl.target;
+      if (linksDict[link_id] === undefined) {
+        links.push(nl);
+        linksDict[link_id] = true;
+      }
+    });
+    restart();
+  }
+
+  // positions were returned with the data
+  if (nodes.every(function(n) { return n.gv_x !== undefined; })) {
+    addLinks();
+    return;
+  }
+
+  // get graphviz location info for the new nodes; only the topology and
+  // the positions of the nodes already drawn are sent
   $.ajax({
     url: addVizUrl + '/layout',
-    data: {viz_dict: JSON.stringify({links: new_links, nodes: nodes}, null)},
+    data: {
+      topology: JSON.stringify({
+        nodes: nodes.map(function(n) { return n.id; }),
+        links: new_links.map(function(l) { return [l.source, l.target]; }),
+        positions: nodes.map(function(n) {
+          return n.gv_x === undefined ? null : [n.gv_x, n.gv_y];
+        })
+      }),
+      incremental: true
+    },
     type: 'POST',
     success: function(data, sts, xhr) {
-      data.nodes.forEach(function(nn, ni) {
-        if (ni < nodes.length) {
-          nodes[ni].gv_x = nn.gv_x;
-          nodes[ni].gv_y = nn.gv_y;
-        }else {
-          nodes.push(nn);
-        }
+      data.positions.forEach(function(p, ni) {
+        nodes[ni].gv_x = p[0];
+        nodes[ni].gv_y = p[1];
       });
-
-      data.links.forEach(function(nl, ni) {
-        var link_id = nl.source + '_' + nl.target;
-        if (linksDict[link_id] === undefined) {
-          links.push(nl);
-          linksDict[link_id] = true;
-        }
-      });
-      restart();
+      addLinks();
     },
     error:  function(xhr, sts, err) {
       alert(xhr.responseText);
@@ -591,7 +607,7 @@ function addViz(id, url) {
   addVizUrl = url;
   $.ajax({
     url: addVizUrl,
-    data: {id: id},
+    data: {id: id, layout: true},
     success: function(data, sts, xhr) {
       addNodesAndLinks(data);
     },
@@ -915,6 +931,16 @@ function get_search_link(val) {
 }
 
 
+// get PROV attributes of a search hit indexed without its prov_es_json
+function get_indexed_attrs(doc) {
+  var attrs = {};
+  for (var k in doc) {
+    if (doc.hasOwnProperty(k) && k[0] !== '_' && k !== 'identifier') attrs[k] = doc[k];
+  }
+  return attrs;
+}
+
+
 function show_prov_es_info(div_id, doc) {
   //console.log(div_id);
   //console.log(doc);
@@ -922,7 +948,8 @@ function show_prov_es_info(div_id, doc) {
   //console.log(APP_URL);
   var id = doc['_id'];
   var type = doc['_type'];
-  var info = get_info_snippet(id, doc['prov_es_json'][type][id]);
+  var info = get_info_snippet(id, doc['prov_es_json'] ? doc['prov_es_json'][type][id]
+                                                      : get_indexed_attrs(doc));
   var ns_div = $(jq(div_id));
   $(ns_div).next('br').remove();
   //console.log(info['html']);
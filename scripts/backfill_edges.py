@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+import os, sys, json
+
+from fv_prov_es import create_app
+from fv_prov_es.lib.utils import PROV_RELATIONS
+from fv_prov_es.lib.import_utils import get_es_conn, index_edge, BulkIndexer
+
+
+def scan(conn, index, doc_types, query):
+    """Yield all hits of a query over the specified doc types."""
+
+    r = conn.post('/%s/%s/_search?search_type=scan&scroll=60m&size=100' %
+                  (index, ",".join(doc_types)), data=json.dumps(query))
+    r.raise_for_status()
+    scroll_id = r.json()['_scroll_id']
+    while True:
+        r = conn.post('/_search/scroll?scroll=60m', data=scroll_id)
+        res = r.json()
+        scroll_id = res['_scroll_id']
+        if len(res['hits']['hits']) == 0: break
+        for hit in res['hits']['hits']: yield hit
+
+
+def backfill_edges(es_url, alias, edge_index):
+    """Index edge documents for all PROV relations in the alias."""
+
+    conn = get_es_conn(es_url, edge_index)
+    bulk = BulkIndexer(conn)
+    query = { "query": { "match_all": {} } }
+
+    # relations first so that edges from bundle docs carry the bundle id
+    count = 0
+    for hit in scan(conn, alias, PROV_RELATIONS.keys(), query):
+        doc = hit['_source']['prov_es_json'][hit['_type']][hit['_id']]
+        index_edge(bulk, edge_index, hit['_type'], hit['_id'], doc)
+        count += 1
+    bulk.flush()
+    print "indexed edges for %d relations" % count
+
+    count = 0
+    for hit in scan(conn, alias, ['bundle'], query):
+        bundle_prov = hit['_source']['prov_es_json']
+        for concept in PROV_RELATIONS:
+            for i, doc in bundle_prov.get(concept, {}).iteritems():
+                index_edge(bulk, edge_index, concept, i, doc, hit['_id'])
+        count += 1
+    bulk.flush()
+    print "indexed edges for %d bundles" % count
+    for error in bulk.errors:
+        print "failed to index edge %s: %s" % (error['id'], error['error'])
+
+
+if __name__ == "__main__":
+    env = os.environ.get('PROVES_ENV', 'prod')
+    app = create_app('fv_prov_es.settings.%sConfig' % env.capitalize(), env=env)
+    es_url = app.config['ES_URL']
+    alias = app.config['PROVES_ES_ALIAS']
+    edge_index = app.config['PROVES_ES_EDGE_INDEX']
+    if edge_index is None:
+        print "PROVES_ES_EDGE_INDEX is not configured."
+        sys.exit(1)
+    backfill_edges(es_url, alias, edge_index)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+import os, sys, json, time, threading, requests
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+from fv_prov_es.lib.es_client import ESClient
+from fv_prov_es.lib.import_utils import BulkIndexer
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Minimal ElasticSearch stand-in that acknowledges single document
+       index requests and _bulk requests without storing anything."""
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.getheader('content-length', 0)))
+        if self.path.startswith('/_bulk'):
+            items = []
+            for action in [l for l in body.split("\n") if l != ""][::2]:
+                op, meta = json.loads(action).items()[0]
+                meta.update({ '_version': 1, 'status': 201 })
+                items.append({ op: meta })
+            result = { 'took': 1, 'errors': False, 'items': items }
+        else:
+            index, doc_type, id = self.path.strip('/').split('/', 2)
+            result = { '_index': index, '_type': doc_type, '_id': id,
+                       '_version': 1, 'created': True }
+        resp = json.dumps(result)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(resp)))
+        self.end_headers()
+        self.wfile.write(resp)
+
+    do_PUT = do_POST
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def get_docs(count):
+    """Return synthetic PROV-ES entity documents."""
+
+    docs = []
+    for i in range(count):
+        id = "ex:entity-%d" % i
+        doc = {
+            'prov:type': "eos:granule",
+            'prov:location': "http://path/to/granule-%d.h5" % i,
+            'prov:label': "granule %d" % i,
+        }
+        doc['identifier'] = id
+        doc['prov_es_json'] = { 'entity': { id: dict(doc) } }
+        docs.append((id, doc))
+    return docs
+
+
+def benchmark(es_url, count):
+    """Compare per-document indexing with a new connection per request,
+       per-document indexing over the pooled client and bulk indexing."""
+
+    docs = get_docs(count)
+
+    # one request and one connection per document
+    t0 = time.time()
+    for id, doc in docs:
+        r = requests.put('%s/prov_es-bench/entity/%s' % (es_url, id), data=json.dumps(doc))
+        r.raise_for_status()
+    unpooled = count / (time.time() - t0)
+
+    # one request per document over pooled keep-alive connections
+    conn = ESClient(es_url)
+    t0 = time.time()
+    for id, doc in docs: conn.index(doc, 'prov_es-bench', 'entity', id)
+    single = count / (time.time() - t0)
+
+    # bulk
+    bulk = BulkIndexer(conn)
+    t0 = time.time()
+    for id, doc in docs: bulk.index(doc, 'prov_es-bench', 'entity', id)
+    bulk.flush()
+    bulked = count / (time.time() - t0)
+
+    print "%6d docs: %8.0f docs/sec unpooled, %8.0f docs/sec pooled, %8.0f docs/sec bulk" % \
+          (count, unpooled, single, bulked)
+
+
+if __name__ == "__main__":
+    server = StandInServer(('127.0.0.1', 0), StandInHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    es_url = "http://127.0.0.1:%d" % server.server_address[1]
+    for count in [int(i) for i in sys.argv[1:]] or [1000, 5000, 20000]:
+        benchmark(es_url, count)
+    server.shutdown()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+import os, sys, time
+
+from fv_prov_es import create_app
+from fv_prov_es.controllers.main import parse_d3
+from fv_prov_es.lib.graphviz import add_graphviz_positions
+from fv_prov_es.lib.layered_layout import add_layered_positions
+
+from benchmark_parse_d3 import get_synthetic_prov
+
+
+def get_topology(viz_dict):
+    """Return copy of viz dict without node and link payloads."""
+
+    return {
+        'nodes': [{ 'id': n['id'] } for n in viz_dict['nodes']],
+        'links': [{ 'source': l['source'], 'target': l['target'] } for l in viz_dict['links']],
+    }
+
+
+def time_layout(func, viz_dict):
+    """Return seconds to lay out viz dict or None if the engine failed."""
+
+    t0 = time.time()
+    try: func(get_topology(viz_dict))
+    except (OSError, RuntimeError), e:
+        return None
+    return time.time() - t0
+
+
+def benchmark(app, counts):
+    """Time dot and layered layouts of synthetic PROV-ES documents."""
+
+    with app.test_request_context('/fdl/data/layout'):
+        for count in counts:
+            viz_dict = parse_d3(get_synthetic_prov(count))
+            dot = time_layout(add_graphviz_positions, viz_dict)
+            layered = time_layout(add_layered_positions, viz_dict)
+            print "%6d nodes, %6d links: dot %s, layered %.3fs" % \
+                  (len(viz_dict['nodes']), len(viz_dict['links']),
+                   "n/a" if dot is None else "%.3fs" % dot, layered)
+
+
+if __name__ == "__main__":
+    env = os.environ.get('PROVES_ENV', 'prod')
+    app = create_app('fv_prov_es.settings.%sConfig' % env.capitalize(), env=env)
+    counts = [int(i) for i in sys.argv[1:]] or [100, 500, 1000, 5000]
+    benchmark(app, counts)
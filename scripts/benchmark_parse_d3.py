@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+import os, sys, time, random
+
+from fv_prov_es import create_app
+from fv_prov_es.controllers.main import parse_d3
+
+
+def get_synthetic_prov(count, seed=0):
+    """Return PROV-ES JSON with count used and wasGeneratedBy relations
+       chained into a processing lineage."""
+
+    r = random.Random(seed)
+    ents = ["ex:entity-%d" % i for i in range(count)]
+    acts = ["ex:activity-%d" % i for i in range(count / 4 + 1)]
+    agents = ["ex:agent-%d" % i for i in range(10)]
+    pej = {
+        'prefix': { 'ex': "http://example.org/my_namespace#" },
+        'entity': dict((e, { 'prov:type': "eos:granule" }) for e in ents),
+        'activity': dict((a, { 'prov:type': "eos:processStep" }) for a in acts),
+        'agent': dict((a, { 'prov:type': "prov:SoftwareAgent" }) for a in agents),
+        'used': {},
+        'wasGeneratedBy': {},
+        'wasAssociatedWith': {},
+    }
+    for i in range(count):
+        pej['used']["ex:used-%d" % i] = {
+            'prov:activity': r.choice(acts),
+            'prov:entity': r.choice(ents),
+        }
+        pej['wasGeneratedBy']["ex:generated-%d" % i] = {
+            'prov:activity': r.choice(acts),
+            'prov:entity': ents[i],
+        }
+    for i, a in enumerate(acts):
+        pej['wasAssociatedWith']["ex:association-%d" % i] = {
+            'prov:activity': a,
+            'prov:agent': r.choice(agents),
+        }
+    return pej
+
+
+def benchmark(app, counts):
+    """Time parse_d3 on synthetic PROV-ES documents."""
+
+    with app.test_request_context('/fdl/data'):
+        for count in counts:
+            pej = get_synthetic_prov(count)
+            t0 = time.time()
+            viz_dict = parse_d3(pej)
+            elapsed = time.time() - t0
+            t0 = time.time()
+            parse_d3(pej)
+            cached = time.time() - t0
+            print "%6d relations: %6d nodes, %6d links in %.3fs (cached %.3fs)" % \
+                  (count * 2, len(viz_dict['nodes']), len(viz_dict['links']), elapsed, cached)
+
+
+if __name__ == "__main__":
+    env = os.environ.get('PROVES_ENV', 'prod')
+    app = create_app('fv_prov_es.settings.%sConfig' % env.capitalize(), env=env)
+    counts = [int(i) for i in sys.argv[1:]] or [1000, 5000, 10000, 20000]
+    benchmark(app, counts)
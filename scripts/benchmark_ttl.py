@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+import os, sys, time
+
+from fv_prov_es import create_app
+from fv_prov_es.lib.utils import get_ttl, get_provconvert_ttl
+from fv_prov_es.lib.provconvert_pool import ConverterError
+
+from benchmark_parse_d3 import get_synthetic_prov
+
+
+def time_ttl(func, pej):
+    """Return seconds to convert PROV-ES JSON to Turtle or None if the
+    converter failed."""
+
+    t0 = time.time()
+    try: func(pej)
+    except (OSError, ConverterError), e:
+        return None
+    return time.time() - t0
+
+
+def benchmark(app, counts):
+    """Time native and provconvert Turtle serialization of synthetic PROV-ES
+    documents. provconvert runs in the pool of warm processes, which is
+    started with a small document first."""
+
+    with app.test_request_context('/api/v0.1/prov_es/ttl'):
+        start = time_ttl(get_provconvert_ttl, get_synthetic_prov(1))
+        print "provconvert start: %s" % ("n/a" if start is None else "%.3fs" % start)
+        for count in counts:
+            pej = get_synthetic_prov(count)
+            native = time_ttl(get_ttl, pej)
+            provconvert = time_ttl(get_provconvert_ttl, pej)
+            print "%6d relations: native %.3fs, provconvert %s" % \
+                  (count * 2, native, "n/a" if provconvert is None else "%.3fs" % provconvert)
+
+
+if __name__ == "__main__":
+    env = os.environ.get('PROVES_ENV', 'prod')
+    app = create_app('fv_prov_es.settings.%sConfig' % env.capitalize(), env=env)
+    counts = [int(i) for i in sys.argv[1:]] or [10, 100, 1000, 10000]
+    benchmark(app, counts)
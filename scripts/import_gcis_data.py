@@ -4,7 +4,8 @@ from datetime import datetime
 import requests_cache
 
 from fv_prov_es import create_app
-from fv_prov_es.lib.import_utils import get_es_conn, import_prov
+from fv_prov_es.lib.import_utils import (get_es_conn, create_index, import_prov, record_indexed,
+                                        BulkIndexer)
 
 from prov_es.model import (get_uuid, ProvEsDocument, GCIS, PROV, PROV_TYPE,
                            PROV_ROLE, PROV_LABEL, PROV_LOCATION, HYSDS)
@@ -187,10 +188,12 @@ def get_image_prov(j, gcis_url):
     return prov_json
 
 
-def index_gcis(gcis_url, es_url, index, alias):
+def index_gcis(gcis_url, es_url, index, alias, edge_index=None):
     """Index GCIS into PROV-ES ElasticSearch index."""
 
     conn = get_es_conn(es_url, index, alias)
+    if edge_index is not None: create_index(conn, edge_index)
+    bulk = BulkIndexer(conn, on_indexed=record_indexed)
     r = requests.get('%s/image.json' % gcis_url, params={ 'all': 1 })
     r.raise_for_status()
     imgs = r.json()
@@ -205,7 +208,11 @@ def index_gcis(gcis_url, es_url, index, alias):
         #print(json.dumps(img_md, indent=2))
         prov = get_image_prov(img_md, gcis_url)
         #print(json.dumps(prov, indent=2))
-        import_prov(conn, index, alias, prov)
+        import_prov(conn, index, alias, prov, edge_index, bulk)
+    bulk.flush()
+    print "indexed %d documents" % bulk.indexed
+    for error in bulk.errors:
+        print "failed to index %s: %s" % (error['id'], error['error'])
 
 
 if __name__ == "__main__":
@@ -218,4 +225,5 @@ if __name__ == "__main__":
     #                               dt.year, dt.month, dt.day)
     index = "%s-gcis" % app.config['PROVES_ES_PREFIX']
     alias = app.config['PROVES_ES_ALIAS']
-    index_gcis(gcis_url, es_url, index, alias)
+    edge_index = app.config['PROVES_ES_EDGE_INDEX']
+    index_gcis(gcis_url, es_url, index, alias, edge_index)
@@ -1,9 +1,9 @@
 #!/usr/bin/env python
 import os, sys, json, requests, copy, hashlib, re, csv
 from datetime import datetime
-from pyes import ES, TermQuery
 
 from fv_prov_es import create_app
+from fv_prov_es.lib.import_utils import get_es_conn, BulkIndexer, get_existing_ids
 
 
 EMPTY = re.compile(r'^\s*$')
@@ -40,9 +40,16 @@ def import_instruments(instrs, es_url, index, alias):
         "xlink": "http://www.w3.org/1999/xlink"
     }
 
-    conn = ES(es_url)
-    if not conn.indices.exists_index(index):
-        conn.indices.create_index(index)
+    conn = get_es_conn(es_url, index)
+    bulk = BulkIndexer(conn)
+
+    # check which instruments and organizations are already indexed
+    ids = set()
+    for instr in instrs:
+        ids.add("eos:%s" % instr['Instrument Name Short'])
+        if 'Instrument Agencies' in instr and not EMPTY.search(instr['Instrument Agencies']):
+            ids.add("eos:%s" % instr['Instrument Agencies'])
+    existing = get_existing_ids(conn, alias, ids)
 
     # track agencies/organizations
     orgs = {}
@@ -86,9 +93,8 @@ def import_instruments(instrs, es_url, index, alias):
                    "identifier": org,
                    "prov:type": "prov:Organization",
                }
-               if len(conn.search(query=TermQuery("_id", org),
-                                  indices=[alias])) > 0: pass
-               else: conn.index(orgs[org], index, 'agent', org)
+               if org in existing: pass
+               else: bulk.index(orgs[org], index, 'agent', org)
         else: org = None
         doc = {
             "prov_es_json": {
@@ -108,9 +114,12 @@ def import_instruments(instrs, es_url, index, alias):
             "gcis:hasGoverningOrganization": org,
             "identifier": identifier,
         }
-        if len(conn.search(query=TermQuery("_id", identifier),
-                           indices=[alias])) > 0: pass
-        else: conn.index(doc, index, 'entity', identifier)
+        if identifier in existing: pass
+        else: bulk.index(doc, index, 'entity', identifier)
+    bulk.flush()
+    print "indexed %d documents" % bulk.indexed
+    for error in bulk.errors:
+        print "failed to index %s: %s" % (error['id'], error['error'])
 
 
 if __name__ == "__main__":
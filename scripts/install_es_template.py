@@ -1,29 +1,34 @@
 #!/usr/bin/env python
-import os, sys, json, requests
+import os, sys, json
 from jinja2 import Template
 
-from fv_prov_es import create_app
+from fv_prov_es import create_app, es
 
 
-def write_template(es_url, prefix, alias, tmpl_file):
+def write_template(name, tmpl_file, **kwargs):
     """Write template to ES."""
 
     with open(tmpl_file) as f:
-        tmpl = Template(f.read()).render(prefix=prefix, alias=alias)
-    tmpl_url = "%s/_template/%s" % (es_url, alias)
-    r = requests.put(tmpl_url, data=tmpl)
+        tmpl = Template(f.read()).render(**kwargs)
+    tmpl_path = "/_template/%s" % name
+    r = es.put(tmpl_path, data=tmpl)
     r.raise_for_status()
     print r.json()
-    print "Successfully installed template %s at %s/_templ." % (alias, tmpl_url)
+    print "Successfully installed template %s at %s%s." % (name, es.url, tmpl_path)
 
 
 if __name__ == "__main__":
     env = os.environ.get('PROVES_ENV', 'prod')
     app = create_app('fv_prov_es.settings.%sConfig' % env.capitalize(), env=env)
-    es_url = app.config['ES_URL']
     prefix = app.config['PROVES_ES_PREFIX']
     alias = app.config['PROVES_ES_ALIAS']
+    edge_index = app.config['PROVES_ES_EDGE_INDEX']
     tmpl_file = os.path.normpath(os.path.abspath(os.path.join(
         os.path.dirname(__file__), '..', 'config', 'es_template-prov_es.json'
     )))
-    write_template(es_url, prefix, alias, tmpl_file)
+    write_template(alias, tmpl_file, prefix=prefix, alias=alias)
+    if edge_index is not None:
+        edge_tmpl_file = os.path.normpath(os.path.abspath(os.path.join(
+            os.path.dirname(__file__), '..', 'config', 'es_template-prov_es_edges.json'
+        )))
+        write_template(edge_index, edge_tmpl_file, edge_index=edge_index)
@@ -0,0 +1,45 @@
+import java.io.BufferedReader;
+import java.io.InputStreamReader;
+import java.io.PrintStream;
+
+import org.openprovenance.prov.interop.InteropFramework;
+import org.openprovenance.prov.model.Document;
+
+/**
+ * Long-lived provconvert: reads one request per line from stdin and answers
+ * each with one line on stdout, so a single warm JVM serves many
+ * conversions.
+ *
+ *   PING                      -> PONG
+ *   <infile> TAB <outfile>    -> OK | ERROR <message>
+ *
+ * Formats are determined by the file extensions as with provconvert. Output
+ * of the toolbox itself is redirected to stderr to keep stdout clean.
+ */
+public class ProvConvertServer {
+    public static void main(String[] args) throws Exception {
+        PrintStream protocol = new PrintStream(System.out, true, "UTF-8");
+        System.setOut(System.err);
+        BufferedReader in = new BufferedReader(new InputStreamReader(System.in, "UTF-8"));
+        String line;
+        while ((line = in.readLine()) != null) {
+            if (line.equals("PING")) {
+                protocol.println("PONG");
+                continue;
+            }
+            String[] files = line.split("\t");
+            if (files.length != 2) {
+                protocol.println("ERROR invalid request");
+                continue;
+            }
+            try {
+                InteropFramework framework = new InteropFramework();
+                Document doc = framework.readDocumentFromFile(files[0]);
+                framework.writeDocument(files[1], doc);
+                protocol.println("OK");
+            } catch (Throwable t) {
+                protocol.println("ERROR " + String.valueOf(t).replace('\n', ' '));
+            }
+        }
+    }
+}
@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+import os, sys, json, glob, shutil, tempfile
+from subprocess import check_call
+
+from fv_prov_es.lib.utils import get_provconvert_json
+
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURE_DIR = os.path.join(SCRIPT_DIR, '..', 'tests', 'fixtures', 'ttl')
+PROVCONVERT = os.path.join(SCRIPT_DIR, 'provToolbox', 'bin', 'provconvert')
+
+
+def record(names):
+    """Convert golden PROV-ES JSON documents with the provconvert command
+    line tool and write their Turtle next to them. Requires java."""
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        for name in names:
+            with open(os.path.join(FIXTURE_DIR, '%s.json' % name)) as f:
+                pej = json.load(f)
+            json_file = os.path.join(tmp_dir, '%s.json' % name)
+            with open(json_file, 'w') as f: json.dump(get_provconvert_json(pej), f)
+            check_call([PROVCONVERT, '-infile', json_file, '-outfile',
+                        os.path.join(FIXTURE_DIR, '%s.ttl' % name)])
+            print "recorded %s.ttl" % name
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or sorted(os.path.basename(p)[:-len('.json')]
+                                   for p in glob.glob(os.path.join(FIXTURE_DIR, '*.json')))
+    record(names)
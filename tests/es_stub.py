@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import json
+
+from fv_prov_es.lib.es_client import ESClient
+
+
+class StubResponse(object):
+    """requests response with a JSON result."""
+
+    def __init__(self, result, status_code=200):
+        self.result = result
+        self.status_code = status_code
+        self.text = json.dumps(result)
+        self.closed = False
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.result
+
+    def iter_content(self, chunk_size):
+        # small chunks exercise streaming
+        for i in range(0, len(self.text), 10): yield self.text[i:i+10]
+
+    def close(self):
+        self.closed = True
+
+
+class StubSession(object):
+    """requests session that answers ES requests with handler(method,
+    path, data), which returns a result or a (result, status code) tuple.
+    Requests are kept in calls as (method, path, kwargs) and responses in
+    responses."""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.calls = []
+        self.responses = []
+
+    def paths(self):
+        return [(method, path) for method, path, kwargs in self.calls]
+
+    def request(self, method, url, **kwargs):
+        path = url.split(':9200', 1)[1]
+        self.calls.append((method, path, kwargs))
+        result = self.handler(method, path, kwargs.get('data', None))
+        response = StubResponse(*result) if isinstance(result, tuple) else StubResponse(result)
+        self.responses.append(response)
+        return response
+
+
+def get_es(handler):
+    """Return ES client whose requests are answered by a StubSession of
+    handler."""
+
+    es = ESClient('http://localhost:9200')
+    es.set_session(StubSession(handler))
+    return es
@@ -0,0 +1,145 @@
+#! ../env/bin/python
+# -*- coding: utf-8 -*-
+import shutil
+import tempfile
+import threading
+
+from fv_prov_es.lib.cache_utils import LRUCache, DocCache, ExportCache, QueryCache
+
+
+class TestLRUCache:
+    def setup(self):
+        self.cache = LRUCache(maxsize=2)
+
+    def test_eviction(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        assert self.cache.get('a') == 1
+        self.cache.set('c', 3)
+
+        assert 'b' not in self.cache
+        assert 'a' in self.cache and 'c' in self.cache
+        assert self.cache.stats()['evictions'] == 1
+
+    def test_counters(self):
+        self.cache.set('a', 1)
+        self.cache.get('a')
+        self.cache.get('x')
+        stats = self.cache.stats()
+
+        assert (stats['hits'], stats['misses'], stats['hit_rate']) == (1, 1, .5)
+
+    def test_ttl(self):
+        cache = LRUCache(maxsize=2, ttl=-1)
+        cache.set('a', 1)
+        assert cache.get('a') is None
+
+
+class TestDocCache:
+    def setup(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = DocCache(maxsize=10, cache_dir=self.cache_dir)
+
+    def teardown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_copies(self):
+        self.cache.set('ex:a', {'_id': 'ex:a', '_source': {}})
+        doc = self.cache.get('ex:a')
+        doc['_source']['x'] = 1
+
+        assert self.cache.get('ex:a') == {'_id': 'ex:a', '_source': {}}
+
+    def test_empty_not_cached(self):
+        self.cache.set('ex:a', {})
+        assert self.cache.get('ex:a') is None
+
+    def test_shared_tier(self):
+        self.cache.set('ex:a', {'_id': 'ex:a'})
+        other = DocCache(maxsize=10, cache_dir=self.cache_dir)
+
+        assert other.get_many(['ex:a', 'ex:b']) == {'ex:a': {'_id': 'ex:a'}}
+        assert other.stats()['shared_hits'] == 1
+
+        other.delete_many(['ex:a'])
+        assert self.cache.shared.get(self.cache._key('ex:a')) is None
+
+
+class TestExportCache:
+    def setup(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = ExportCache(maxsize=10, cache_dir=self.cache_dir)
+
+    def teardown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_content_hash(self):
+        self.cache.set('json', 'ex:a', 'abc', '{}')
+
+        assert self.cache.get('json', 'ex:a', 'abc') == '{}'
+        assert self.cache.get('json', 'ex:a', 'def') is None
+        assert self.cache.get('ttl', 'ex:a', 'abc') is None
+
+    def test_shared_tier(self):
+        self.cache.set('json', 'ex:a', 'abc', '{}')
+        other = ExportCache(maxsize=10, cache_dir=self.cache_dir)
+
+        assert other.get('json', 'ex:a', 'abc') == '{}'
+        assert other.stats()['shared_hits'] == 1
+
+
+class TestQueryCache:
+    def setup(self):
+        self.cache = QueryCache(maxsize=10, ttl=10, max_bytes=10)
+        self.calls = 0
+
+    def compute(self, value='{}'):
+        self.calls += 1
+        return value
+
+    def test_normalized_key(self):
+        assert self.cache.key('prov_es', '{"a": 1, "b": [2]}') == \
+            self.cache.key('prov_es', '{"b":[2],\n "a":1}')
+        assert self.cache.key('prov_es', '{"a": 1}') != self.cache.key('other', '{"a": 1}')
+
+    def test_cached(self):
+        assert self.cache.get('q', self.compute) == '{}'
+        assert self.cache.get('q', self.compute) == '{}'
+        assert self.calls == 1
+
+        # too large to cache
+        self.cache.get('r', lambda: self.compute('x' * 11))
+        self.cache.get('r', lambda: self.compute('x' * 11))
+        assert self.calls == 3
+        assert self.cache.stats()['oversized'] == 2
+
+    def test_coalesced(self):
+        started = threading.Event()
+        release = threading.Event()
+        results = []
+
+        def slow():
+            started.set()
+            release.wait()
+            return self.compute()
+
+        leader = threading.Thread(target=lambda: results.append(self.cache.get('q', slow)))
+        leader.start()
+        started.wait()
+        follower = threading.Thread(target=lambda: results.append(self.cache.get('q', slow)))
+        follower.start()
+        while self.cache.stats()['coalesced'] == 0: pass
+        release.set()
+        leader.join()
+        follower.join()
+
+        assert results == ['{}', '{}']
+        assert self.calls == 1
+
+    def test_error_not_cached(self):
+        def fail(): raise ValueError("failed")
+
+        try: self.cache.get('q', fail)
+        except ValueError: pass
+        assert self.cache.get('q', self.compute) == '{}'
+        assert self.cache.stats()['in_flight'] == 0
@@ -0,0 +1,35 @@
+#! ../env/bin/python
+# -*- coding: utf-8 -*-
+from fv_prov_es.lib.d3_utils import (D3Graph, get_activity_node,
+                                     get_entity_node)
+
+
+class TestD3Graph:
+    def setup(self):
+        self.graph = D3Graph()
+        self.graph.add_node(get_activity_node('ex:a', {}))
+        self.graph.add_node(get_entity_node('ex:e1', {}))
+        self.graph.add_node(get_entity_node('ex:e2', {}))
+
+    def test_node_dedup(self):
+        assert self.graph.add_node(get_entity_node('ex:e1', {'x': 1})) is False
+        assert len(self.graph) == 3
+        assert self.graph.nodes[self.graph.index('ex:e1')]['doc'] == {}
+
+    def test_links(self):
+        self.graph.add_link('ex:a', 'ex:e1', 'used', 'prov:used')
+        self.graph.add_link('ex:a', 'ex:e1', 'used', 'prov:used')
+        assert self.graph.add_link('ex:e2', 'ex:e1', 'e2e_related', 'x', unique=True)
+        assert not self.graph.add_link('ex:e2', 'ex:e1', 'e2e_related', 'y', unique=True)
+        links = self.graph.get_viz_dict()['links']
+
+        assert len(links) == 3
+        assert (links[0]['source'], links[0]['target']) == (0, 1)
+        assert links[2]['concept'] == 'x'
+
+    def test_roles(self):
+        self.graph.input_ents.update(['ex:e1', 'ex:e2'])
+        self.graph.output_ents.add('ex:e2')
+        groups = [n['group'] for n in self.graph.get_viz_dict()['nodes']]
+
+        assert groups == [2, 4, 6]
@@ -0,0 +1,41 @@
+#! ../env/bin/python
+# -*- coding: utf-8 -*-
+from fv_prov_es.lib.es_client import ESClient
+from tests.es_stub import StubSession
+
+
+class TestESClient:
+    def setup(self):
+        self.client = ESClient('http://localhost:9200', connect_timeout=1,
+                               read_timeout=5)
+
+    def test_session_reused(self):
+        session = self.client.session
+        assert self.client.session is session
+        adapter = session.get_adapter('http://localhost:9200')
+        assert adapter._pool_maxsize == 20
+
+    def test_request(self):
+        stub = StubSession(lambda method, path, data: {})
+        self.client.set_session(stub)
+        self.client.post('/prov_es/_search', data='{}')
+        self.client.get('/', timeout=10)
+
+        assert stub.calls[0][:2] == ('POST', '/prov_es/_search')
+        assert stub.calls[0][2]['timeout'] == (1, 5)
+        assert stub.calls[1][2]['timeout'] == 10
+
+    def test_index_quotes_id(self):
+        stub = StubSession(lambda method, path, data: {})
+        self.client.set_session(stub)
+        self.client.index({}, 'prov_es', 'entity', 'ex:a/b')
+
+        assert stub.calls[0][:2] == ('PUT', '/prov_es/entity/ex%3Aa%2Fb')
+
+    def test_set_session(self):
+        stub = StubSession(lambda method, path, data: {})
+        self.client.set_session(stub)
+        assert self.client.session is stub
+
+        self.client.set_session(None)
+        assert self.client.session is not stub
@@ -0,0 +1,57 @@
+#! ../env/bin/python
+# -*- coding: utf-8 -*-
+import os
+import json
+import shutil
+import tempfile
+
+from fv_prov_es.lib.expansion_map import ExpansionMap
+
+PEM = {
+    "entity": {
+        "gcis:inPlatform": { "type": "entity", "source": True },
+        "gcis:hasGoverningOrganization": { "type": "agent", "source": False },
+    },
+    "agent": {},
+}
+
+
+class TestExpansionMap:
+    def setup(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'prov_expansion_map.json')
+        with open(self.path, 'w') as f:
+            json.dump(PEM, f)
+        self.pem = ExpansionMap(self.path, check_interval=0)
+
+    def teardown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_expansions(self):
+        doc = { 'prov:type': 'eos:granule', 'gcis:inPlatform': ['ex:p1', 'ex:p2'] }
+        pem = self.pem.get()
+
+        assert pem.expansions('entity', doc) == [('gcis:inPlatform', 'entity', True, ['ex:p1', 'ex:p2'])]
+        assert pem.expansions('agent', doc) == []
+        assert pem.expansions('activity', doc) == []
+        assert 'gcis:hasGoverningOrganization' in pem.predicates
+
+    def test_reload(self):
+        version = self.pem.get().version
+        assert not self.pem.reload_if_changed()
+
+        with open(self.path, 'w') as f:
+            json.dump({ "activity": { "eos:usesSoftware": { "type": "entity", "source": False } } }, f)
+        os.utime(self.path, (0, 0))
+
+        assert self.pem.reload_if_changed()
+        assert self.pem.get().version != version
+        assert self.pem.get().tables == { 'activity': { 'eos:usesSoftware': ('entity', False) } }
+
+    def test_invalid_keeps_map(self):
+        with open(self.path, 'w') as f:
+            f.write('{')
+        os.utime(self.path, (0, 0))
+
+        assert not self.pem.reload_if_changed()
+        assert 'entity' in self.pem.get().tables
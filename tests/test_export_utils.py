@@ -0,0 +1,123 @@
+#! ../env/bin/python
+# -*- coding: utf-8 -*-
+import json
+import gzip
+import zipfile
+from StringIO import StringIO
+
+from fv_prov_es import create_app, es, doc_cache, export_cache, id_resolver
+from fv_prov_es.lib.export_utils import get_version_hash, gzip_data, warm_exports
+from fv_prov_es.lib.utils import get_json_hash
+from tests.es_stub import StubSession
+
+
+def get_session(hit):
+    """Return stub session answering document GETs with hit."""
+
+    def handler(method, path, data):
+        doc = dict(hit, found=True)
+        if path.endswith('?_source=false'): del doc['_source']
+        return doc
+    return StubSession(handler)
+
+
+class TestExportUtils:
+    def setup(self):
+        self.app = create_app('fv_prov_es.settings.DevConfig', env='dev')
+        self.client = self.app.test_client()
+        self.pej = {
+            'prefix': {'ex': 'http://example.org/'},
+            'entity': {'ex:e': {'prov:label': 'e'}},
+        }
+        self.hit = {'_index': 'prov_es_dev-2015.03.22', '_type': 'entity', '_id': 'ex:e',
+                    '_version': 1, '_source': {'prov_es_json': self.pej}}
+        doc_cache.set('ex:e', self.hit)
+        self.url = '/api/v0.1/prov_es/download/json?id=ex:e'
+
+    def teardown(self):
+        es.set_session(None)
+
+    def test_etag(self):
+        rv = self.client.get(self.url)
+        etag = rv.headers['ETag']
+
+        assert json.loads(rv.data) == self.pej
+        assert etag == '"%s-json"' % get_version_hash(self.hit)
+
+        rv = self.client.get(self.url, headers={'If-None-Match': etag})
+        assert rv.status_code == 304
+        assert rv.data == ''
+
+        # serialized once
+        stats = export_cache.stats()
+        assert (stats['hits'], stats['misses']) == (0, 1)
+
+        rv = self.client.get(self.url)
+        assert json.loads(rv.data) == self.pej
+        assert export_cache.stats()['hits'] == 1
+
+    def test_etag_uncached(self):
+        doc_cache.delete_many(['ex:e'])
+        id_resolver.set('ex:e', 'prov_es_dev-2015.03.22', 'entity')
+        session = get_session(dict(self.hit, _version=2))
+        es.set_session(session)
+        etag = '"%s-ttl"' % get_version_hash(dict(self.hit, _version=2))
+
+        # answered from the version without fetching the source
+        rv = self.client.get('/api/v0.1/prov_es/download/ttl?id=ex:e',
+                             headers={'If-None-Match': etag})
+        assert rv.status_code == 304
+        assert session.paths() == [('GET', '/prov_es_dev-2015.03.22/entity/ex%3Ae?_source=false')]
+
+        rv = self.client.get('/api/v0.1/prov_es/download/ttl?id=ex:e',
+                             headers={'If-None-Match': '"%s-ttl"' % get_version_hash(self.hit)})
+        assert rv.status_code == 200
+        assert rv.headers['ETag'] == etag
+        assert 'ex:e a prov:Entity' in rv.data
+        assert export_cache.get('ttl', 'ex:e', get_json_hash(self.pej)) == rv.data
+
+    def test_json_hash(self):
+        pej = json.loads(json.dumps(self.pej), object_pairs_hook=lambda pairs: dict(reversed(pairs)))
+        assert get_json_hash(pej) == get_json_hash(self.pej)
+
+    def test_gzip(self):
+        rv = self.client.get('/api/v0.1/prov_es/download/ttl?id=ex:e',
+                             headers={'Accept-Encoding': 'gzip'})
+
+        assert rv.headers['Content-Encoding'] == 'gzip'
+        assert rv.headers['ETag'].endswith('-ttl-gz"')
+        ttl = gzip.GzipFile(fileobj=StringIO(rv.data)).read()
+        assert 'ex:e a prov:Entity ;\n\trdfs:label "e" .' in ttl
+
+    def test_warm(self):
+        warm_exports({'ex:e': self.pej})
+        digest = get_json_hash(self.pej)
+
+        assert export_cache.get('json.gz', 'ex:e', digest) == \
+            gzip_data(export_cache.get('json', 'ex:e', digest))
+        assert export_cache.get('ttl.gz', 'ex:e', digest) is not None
+
+    def test_bulk_ndjson(self):
+        rv = self.client.post('/api/v0.1/prov_es/download/bulk',
+                              data={'ids': 'ex:e,ex:e', 'id': 'ex:e'})
+        lines = rv.data.splitlines()
+
+        assert rv.mimetype == 'application/x-ndjson'
+        assert len(lines) == 1
+        assert json.loads(lines[0]) == {'id': 'ex:e', 'prov_es_json': self.pej}
+
+    def test_bulk_zip(self):
+        doc_cache.set('ex:f', {'_id': 'ex:f', '_source': {'prov_es_json': self.pej}})
+        rv = self.client.get('/api/v0.1/prov_es/download/bulk?ids=ex:e,ex:f&format=zip&files=ttl')
+        zf = zipfile.ZipFile(StringIO(rv.data))
+
+        assert zf.testzip() is None
+        assert zf.namelist() == ['ex%3Ae.ttl', 'ex%3Af.ttl']
+        assert 'ex:e a prov:Entity' in zf.read('ex%3Ae.ttl')
+
+    def test_bulk_params(self):
+        rv = self.client.get('/api/v0.1/prov_es/download/bulk')
+        assert rv.status_code == 400
+
+        rv = self.client.get('/api/v0.1/prov_es/download/bulk?ids=ex:e&format=tar')
+        assert rv.status_code == 400
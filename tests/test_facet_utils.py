@@ -0,0 +1,94 @@
+#! ../env/bin/python
+# -*- coding: utf-8 -*-
+import json
+
+from fv_prov_es.lib.facet_utils import FacetCounts, get_query_concept
+from tests.es_stub import get_es
+
+
+def get_result(watermark, *concepts):
+    buckets = []
+    for concept, types, months in concepts:
+        buckets.append({
+            'key': concept,
+            't0': {'buckets': [{'key': t, 'doc_count': c} for t, c in types]},
+            'd0': {'buckets': [{'key': m, 'doc_count': c} for m, c in months]},
+        })
+    return {'aggregations': {'concepts': {'buckets': buckets},
+                             'watermark': {'value': watermark}}}
+
+
+class TestFacetCounts:
+    def setup(self):
+        self.results = [
+            get_result(1000., ('entity', [('eos:granule', 3), ('eos:product', 1)], [(0, 4)]),
+                              ('activity', [('eos:processStep', 2)], [])),
+            get_result(2000., ('entity', [('eos:product', 2)], [(0, 1), (86400000, 1)])),
+        ]
+        self.counts = FacetCounts(['prov:type.raw'], ['prov:startTime'], refresh_interval=-1)
+        self.counts.es = get_es(lambda method, path, data: self.results.pop(0))
+        self.counts.index = 'prov_es'
+
+    def get_query(self, i):
+        return json.loads(self.counts.es.session.calls[i][2]['data'])
+
+    def test_incremental(self):
+        self.counts.current()
+        assert 'gt' not in self.get_query(0)['query']['filtered']['filter']['range']['_timestamp']
+
+        snapshot = self.counts.current()
+        assert self.get_query(1)['query']['filtered']['filter']['range']['_timestamp']['gt'] == 1000
+        assert snapshot.watermark == 2000
+        assert snapshot.get_terms_facet('prov:type.raw')['terms'] == [
+            {'term': 'eos:granule', 'count': 3}, {'term': 'eos:product', 'count': 3},
+            {'term': 'eos:processStep', 'count': 2}]
+        assert snapshot.get_date_histogram_facet('prov:startTime', 'entity')['entries'] == \
+            [{'time': 0, 'count': 5}, {'time': 86400000, 'count': 1}]
+        assert self.counts.stats()['full_refreshes'] == 1
+
+    def test_serve(self):
+        query = {
+            'query': {'bool': {'must': [{'term': {'_type': 'entity'}}]}},
+            'facets': {
+                'prov:type.raw': {'terms': {'field': 'prov:type.raw', 'size': 1}},
+                'prov:startTime': {'date_histogram': {'field': 'prov:startTime', 'interval': 'month'}},
+                'prov:label.raw': {'terms': {'field': 'prov:label.raw'}},
+            },
+        }
+        served = self.counts.serve(query)
+
+        assert served['prov:type.raw']['terms'] == [{'term': 'eos:granule', 'count': 3}]
+        assert served['prov:type.raw']['other'] == 1
+        assert served['prov:startTime']['entries'] == [{'time': 0, 'count': 4}]
+        assert query['facets'].keys() == ['prov:label.raw']
+
+    def test_query_concept(self):
+        assert get_query_concept({}) == (True, None)
+        assert get_query_concept({'query': {'bool': {'must': [{'term': {'_type': 'agent'}}]}}}) == \
+            (True, 'agent')
+        assert get_query_concept({'query': {'query_string': {'query': 'x'}}}) == (False, None)
+        assert get_query_concept({'query': {'bool': {'must': [{'term': {'_type': 'agent'}},
+                                                              {'term': {'prov:label': 'x'}}]}}}) == \
+            (False, None)
+
+    def test_bounded_terms(self):
+        self.counts.terms_size = 1
+        snapshot = self.counts.current()
+        facet = snapshot.get_terms_facet('prov:type.raw', 'entity')
+
+        assert self.get_query(0)['aggs']['concepts']['aggs']['t0']['terms']['size'] == 1
+        assert facet['terms'] == [{'term': 'eos:granule', 'count': 3}]
+        assert (facet['total'], facet['other']) == (4, 1)
+
+        # terms beyond the top are kept and can overtake it
+        self.results[0] = get_result(2000., ('entity', [('eos:product', 3)], []))
+        snapshot = self.counts.current()
+        facet = snapshot.get_terms_facet('prov:type.raw', 'entity')
+        assert snapshot.terms['entity']['prov:type.raw'] == {'eos:granule': 3, 'eos:product': 4}
+        assert facet['terms'] == [{'term': 'eos:product', 'count': 4}]
+        assert (facet['total'], facet['other']) == (7, 3)
+
+        # larger facets are left to ES
+        query = {'facets': {'t': {'terms': {'field': 'prov:type.raw', 'size': 2}}}}
+        assert self.counts.serve(query) == {}
+        assert 't' in query['facets']
@@ -0,0 +1,85 @@
+#! ../env/bin/python
+# -*- coding: utf-8 -*-
+import os
+import json
+import stat
+import shutil
+import tempfile
+
+from fv_prov_es import create_app
+from fv_prov_es.lib.graphviz import (get_dot, parse_plain_positions,
+                                     add_graphviz_positions, get_topology_key)
+
+PLAIN = """graph 1 1.75 2.5
+node 0 0.375 2.25 0.75 0.5 0 solid ellipse black lightgrey
+node 1 1.375 0.25 0.75 0.5 1 solid ellipse black lightgrey
+edge 0 1 4 0.5 2 0.75 1.5 1 1 1.25 0.5 solid black
+stop
+"""
+
+
+class TestGraphviz:
+    def setup(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.dot = os.path.join(self.tmp_dir, 'dot')
+        with open(self.dot, 'w') as f:
+            f.write("#!/bin/sh\ncat > /dev/null\ncat <<'EOF'\n%sEOF\n" % PLAIN)
+        os.chmod(self.dot, stat.S_IRWXU)
+        self.app = create_app('fv_prov_es.settings.DevConfig', env='dev')
+        self.app.config['GRAPHVIZ_DOT'] = self.dot
+        self.viz_data = {
+            'nodes': [{'id': 'ex:a'}, {'id': 'ex:e'}],
+            'links': [{'source': 0, 'target': 1}],
+        }
+
+    def teardown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_dot(self):
+        assert get_dot(self.viz_data) == "digraph graphname {\n0;\n1;\n0 -> 1;\n}"
+
+    def test_parse_plain(self):
+        assert parse_plain_positions(PLAIN) == {'0': (27., 162.), '1': (99., 18.)}
+
+    def test_positions(self):
+        with self.app.app_context():
+            nodes = add_graphviz_positions(self.viz_data)['nodes']
+
+        assert (nodes[0]['gv_x'], nodes[0]['gv_y']) == (27, 0)
+        assert (nodes[1]['gv_x'], nodes[1]['gv_y']) == (99, 144)
+
+    def test_dot_failure(self):
+        self.app.config['GRAPHVIZ_DOT'] = 'false'
+        with self.app.app_context():
+            try:
+                add_graphviz_positions(self.viz_data)
+                assert False
+            except RuntimeError:
+                pass
+
+    def test_topology_key(self):
+        key = get_topology_key(self.viz_data)
+        reordered = {
+            'nodes': [{'id': 'ex:e', 'x': 1}, {'id': 'ex:a', 'doc': {}}],
+            'links': [{'source': 1, 'target': 0, 'type': 'used'}],
+        }
+        reversed_link = {
+            'nodes': self.viz_data['nodes'],
+            'links': [{'source': 1, 'target': 0}],
+        }
+
+        assert get_topology_key(reordered) == key
+        assert get_topology_key(reversed_link) != key
+
+    def test_layout_cache(self):
+        client = self.app.test_client()
+        data = {'viz_dict': json.dumps(self.viz_data)}
+        rv = client.post('/fdl/data/layout', data=data)
+        assert json.loads(rv.data)['nodes'][1]['gv_y'] == 144
+
+        self.app.config['GRAPHVIZ_DOT'] = 'false'
+        rv = client.post('/fdl/data/layout', data=data)
+        assert json.loads(rv.data)['nodes'][1]['gv_y'] == 144
+
+        stats = json.loads(client.get('/fdl/data/layout/stats').data)
+        assert (stats['hits'], stats['misses']) == (1, 1)
@@ -0,0 +1,56 @@
+#! ../env/bin/python
+# -*- coding: utf-8 -*-
+import json
+
+from fv_prov_es.lib.id_resolver import IdResolver
+from tests.es_stub import get_es
+
+
+DOC = {'_index': 'prov_es-2015.03.22', '_type': 'entity', '_id': 'ex:e',
+       '_source': {'prov_es_json': {}}}
+
+
+class TestIdResolver:
+    def setup(self):
+        self.indexed = True
+        self.resolver = IdResolver()
+        self.resolver.es = get_es(self.handle)
+        self.resolver.alias = 'prov_es'
+        self.session = self.resolver.es.session
+
+    def handle(self, method, path, data):
+        if method == 'GET':
+            found = path == '/prov_es-2015.03.22/entity/ex%3Ae' and self.indexed
+            return dict(DOC, _version=1, found=found), 200 if found else 404
+        query = json.loads(data)
+        if path == '/_mget':
+            return {'docs': [dict(doc, found=self.indexed and doc['_id'] == 'ex:e',
+                                  _source={'prov_es_json': {}})
+                             for doc in query['docs']]}
+        hits = [DOC] if self.indexed and 'ex:e' in query['query']['ids']['values'] else []
+        return {'hits': {'hits': hits}}
+
+    def test_get(self):
+        assert self.resolver.get('ex:e') == DOC
+        assert self.session.paths() == [('POST', '/prov_es/_search')]
+
+        # known location is read directly
+        assert self.resolver.get('ex:e') == dict(DOC, _version=1)
+        assert self.session.paths()[1] == ('GET', '/prov_es-2015.03.22/entity/ex%3Ae')
+        assert self.resolver.stats()['searches'] == 1
+
+    def test_get_many(self):
+        self.resolver.set('ex:e', 'prov_es-2015.03.22', 'entity')
+        docs = self.resolver.get_many(['ex:e', 'ex:f'])
+
+        assert docs == {'ex:e': DOC}
+        assert self.session.paths() == [('POST', '/_mget'), ('POST', '/prov_es/_search')]
+
+    def test_stale(self):
+        self.indexed = False
+        self.resolver.set('ex:e', 'prov_es-2015.03.22', 'entity')
+
+        assert self.resolver.get('ex:e') == {}
+        assert self.session.paths() == [('GET', '/prov_es-2015.03.22/entity/ex%3Ae'),
+                                 ('POST', '/prov_es/_search')]
+        assert 'ex:e' not in self.resolver.locations
@@ -0,0 +1,146 @@
+#! ../env/bin/python
+# -*- coding: utf-8 -*-
+import json
+
+from fv_prov_es import create_app, doc_cache, id_resolver
+from fv_prov_es.lib.import_utils import (BulkIndexer, record_indexed, index_edge,
+                                         get_existing_ids, import_prov)
+from tests.es_stub import get_es
+
+
+class StubIndex(object):
+    """Answers _bulk requests with the statuses of the queued ids and ids
+    searches with the hits of the indexed ids."""
+
+    def __init__(self, statuses=None, indexed=()):
+        self.statuses = statuses or {}
+        self.indexed = set(indexed)
+        self.bulks = []
+        self.searches = []
+
+    def __call__(self, method, path, data):
+        if path.endswith('/_search'):
+            if path != '/prov_es_dev/_search':
+                return {'error': 'IndexMissingException'}, 404
+            ids = json.loads(data)['query']['ids']['values']
+            self.searches.append(ids)
+            return {'hits': {'hits': [{'_id': id} for id in ids if id in self.indexed]}}
+        actions = [json.loads(line) for line in data.splitlines()[::2]]
+        self.bulks.append(actions)
+        items = []
+        for action in actions:
+            meta = action['index']
+            info = dict(meta, _version=1, status=self.statuses.get(meta['_id'], 201))
+            if info['status'] >= 300: info['error'] = 'MapperParsingException'
+            items.append({'index': info})
+        return {'items': items}
+
+
+class StubWriter(object):
+    def __init__(self):
+        self.docs = []
+
+    def index(self, doc, index, doc_type, id=None):
+        self.docs.append((doc, index, doc_type, id))
+
+
+class TestImportUtils:
+    def setup(self):
+        self.app = create_app('fv_prov_es.settings.DevConfig', env='dev')
+        self.index = StubIndex({'ex:old': 200, 'ex:bad': 400})
+        self.es = get_es(self.index)
+
+    def test_record_indexed(self):
+        doc_cache.set('ex:old', {'_id': 'ex:old', '_source': {'prov_es_json': {}}})
+        doc_cache.set('ex:new', {'_id': 'ex:new', '_source': {'prov_es_json': {}}})
+        bulk = BulkIndexer(self.es, on_indexed=record_indexed)
+        for id in ('ex:new', 'ex:old', 'ex:bad'):
+            bulk.index({}, 'prov_es_dev-2015.03.22', 'entity', id)
+        bulk.index({}, 'prov_es_dev_edges', 'edge', 'ex:new')
+
+        assert bulk.flush() == 1
+        assert [e['id'] for e in bulk.errors] == ['ex:bad']
+        # only indexed documents are located, edges are not
+        assert id_resolver.locations.get('ex:new') == ('prov_es_dev-2015.03.22', 'entity')
+        assert id_resolver.locations.get('ex:old') == ('prov_es_dev-2015.03.22', 'entity')
+        assert id_resolver.locations.get('ex:bad') is None
+        # only the overwritten document is invalidated
+        assert doc_cache.get('ex:old') is None
+        assert doc_cache.get('ex:new') is not None
+
+    def test_index_edge(self):
+        writer = StubWriter()
+        rel = {'prov:entity': 'ex:out', 'prov:activity': 'ex:a',
+               'prov:type': {'$': 'eos:processing', 'type': 'prov:QualifiedName'}}
+        index_edge(writer, 'prov_es_dev_edges', 'wasGeneratedBy', 'ex:g', rel, 'ex:b')
+
+        edge, index, doc_type, id = writer.docs[0]
+        assert (index, doc_type, id) == ('prov_es_dev_edges', 'edge', 'ex:g')
+        assert edge == {'source': 'ex:out', 'target': 'ex:a', 'relation': 'wasGeneratedBy',
+                        'prov_type': 'eos:processing', 'bundle': 'ex:b', 'time': None,
+                        'doc_id': 'ex:g'}
+
+        # no edges for concepts, relations missing an endpoint or no edge index
+        index_edge(writer, 'prov_es_dev_edges', 'entity', 'ex:e', {})
+        index_edge(writer, 'prov_es_dev_edges', 'used', 'ex:u', {'prov:activity': 'ex:a'})
+        index_edge(writer, None, 'wasGeneratedBy', 'ex:g', rel)
+        assert len(writer.docs) == 1
+
+    def test_bulk_flush(self):
+        bulk = BulkIndexer(self.es, max_actions=2)
+        for id in ('ex:e1', 'ex:bad', 'ex:e2'):
+            bulk.index({'identifier': id}, 'prov_es_dev-2015.03.22', 'entity', id)
+
+        # flushed when max_actions are queued
+        assert [len(actions) for actions in self.index.bulks] == [2]
+        assert (len(bulk), bulk.indexed, len(bulk.errors)) == (1, 1, 1)
+        assert bulk.errors[0] == {'index': 'prov_es_dev-2015.03.22', 'type': 'entity',
+                                  'id': 'ex:bad', 'status': 400,
+                                  'error': 'MapperParsingException'}
+
+        assert bulk.flush() == 0
+        assert (len(bulk), bulk.indexed, len(bulk.errors)) == (0, 2, 1)
+        assert self.index.bulks[1] == [{'index': {'_index': 'prov_es_dev-2015.03.22',
+                                               '_type': 'entity', '_id': 'ex:e2'}}]
+
+        # nothing queued, no request
+        assert bulk.flush() == 0
+        assert len(self.index.bulks) == 2
+
+    def test_bulk_max_bytes(self):
+        bulk = BulkIndexer(self.es, max_bytes=100)
+        bulk.index({'identifier': 'x' * 100}, 'prov_es_dev-2015.03.22', 'entity', 'ex:e1')
+
+        assert len(self.index.bulks) == 1 and bulk.indexed == 1
+
+    def test_existing_ids(self):
+        self.index.indexed = set(['ex:e0', 'ex:e999', 'ex:e1000'])
+        ids = ['ex:e%d' % i for i in range(1001)]
+        existing = get_existing_ids(self.es, 'prov_es_dev', ids + ids[:10])
+
+        # one query per 1000 distinct ids
+        assert [len(chunk) for chunk in self.index.searches] == [1000, 1]
+        assert existing == self.index.indexed
+
+        # alias without indices
+        assert get_existing_ids(self.es, 'prov_es_missing', ids[:5]) == set()
+
+    def test_import_skips_existing(self):
+        self.index.indexed = set(['ex:old'])
+        pej = {
+            'prefix': {'ex': 'http://example.org/'},
+            'entity': {'ex:old': {}, 'ex:new': {}},
+            'activity': {'ex:a': {}},
+            'used': {'ex:u': {'prov:activity': 'ex:a', 'prov:entity': 'ex:new'}},
+            'bundle': {'ex:b': {'entity': {'ex:old': {}, 'ex:inner': {}}}},
+        }
+        bulk = BulkIndexer(self.es)
+        written = import_prov(self.es, 'prov_es_dev-2015.03.22', 'prov_es_dev', pej,
+                              'prov_es_dev_edges', bulk)
+        bulk.flush()
+        indexed = [(a['index']['_index'], a['index']['_id']) for a in self.index.bulks[0]]
+
+        assert set(written) == set(['ex:new', 'ex:a', 'ex:u', 'ex:b', 'ex:inner'])
+        assert ('prov_es_dev-2015.03.22', 'ex:old') not in indexed
+        assert ('prov_es_dev_edges', 'ex:u') in indexed
+        assert len(indexed) == 6
@@ -0,0 +1,129 @@
+#! ../env/bin/python
+# -*- coding: utf-8 -*-
+import json
+
+from fv_prov_es import create_app, doc_cache
+from fv_prov_es.lib.layered_layout import (layered_layout, incremental_layout, break_cycles,
+                                           count_crossings, NODE_SEP, RANK_SEP, MARGIN_X)
+
+
+class TestLayeredLayout:
+    def test_dag(self):
+        edges = [(0, 1), (0, 2), (1, 3), (2, 3), (0, 3)]
+        positions = layered_layout(4, edges)
+
+        for s, t in edges:
+            assert positions[s][1] < positions[t][1]
+        assert positions[1][1] == positions[2][1] == RANK_SEP
+        assert abs(positions[1][0] - positions[2][0]) >= NODE_SEP
+
+    def test_cycle(self):
+        assert sorted(break_cycles(3, [(0, 1), (1, 2), (2, 0), (1, 1)])) == [(0, 1), (0, 2), (1, 2)]
+        positions = layered_layout(3, [(0, 1), (1, 2), (2, 0)])
+        assert len(set([y for x, y in positions])) == 3
+
+    def test_disconnected(self):
+        assert layered_layout(0, []) == []
+        positions = layered_layout(3, [])
+        assert set([y for x, y in positions]) == set([0])
+        assert len(set([x for x, y in positions])) == 3
+
+    def test_crossings(self):
+        pos = {'a': 0, 'b': 1, 'c': 0, 'd': 1}
+        assert count_crossings([('a', ['d']), ('b', ['c'])], ['c', 'd'], pos) == 1
+        assert count_crossings([('a', ['c']), ('b', ['d'])], ['c', 'd'], pos) == 0
+
+    def test_no_crossings(self):
+        # two chains drawn crossed in input order get untangled
+        edges = [(0, 3), (1, 2), (2, 5), (3, 4)]
+        positions = layered_layout(6, edges)
+
+        assert (positions[0][0] < positions[1][0]) == (positions[3][0] < positions[2][0])
+        assert (positions[3][0] < positions[2][0]) == (positions[4][0] < positions[5][0])
+
+    def test_engine_param(self):
+        app = create_app('fv_prov_es.settings.DevConfig', env='dev')
+        app.config['GRAPHVIZ_DOT'] = 'false'
+        client = app.test_client()
+        viz_data = {
+            'nodes': [{'id': 'ex:a'}, {'id': 'ex:e'}],
+            'links': [{'source': 0, 'target': 1}],
+        }
+        rv = client.post('/fdl/data/layout', data={'viz_dict': json.dumps(viz_data),
+                                                   'engine': 'layered'})
+        nodes = json.loads(rv.data)['nodes']
+        assert (nodes[0]['gv_y'], nodes[1]['gv_y']) == (0, RANK_SEP)
+
+        rv = client.post('/fdl/data/layout', data={'viz_dict': json.dumps(viz_data),
+                                                   'engine': 'neato'})
+        assert rv.status_code == 500
+
+    def test_incremental(self):
+        pinned = {0: (100, 0), 1: (100, 72), 2: (172, 72)}
+        edges = [(0, 1), (0, 2), (1, 3), (2, 4)]
+        positions = incremental_layout(6, edges, pinned)
+
+        assert positions[:3] == [pinned[0], pinned[1], pinned[2]]
+        assert positions[3][1] == positions[4][1] == 144
+        assert abs(positions[3][0] - positions[4][0]) >= NODE_SEP
+        # unlinked node goes right of the graph
+        assert positions[5][0] > max([x for x, y in positions[:5]])
+
+    def test_incremental_shift(self):
+        # a new parent of the top node is moved down instead of the graph
+        positions = incremental_layout(2, [(1, 0)], {0: (100, 0)})
+        assert positions == [(100, 0), (100 + NODE_SEP, 0)]
+
+        # a new node that would land left of the margin is moved right
+        positions = incremental_layout(3, [(0, 2), (1, 2)], {1: (MARGIN_X, 0)})
+        assert positions[1] == (MARGIN_X, 0)
+        assert min([x for x, y in positions]) >= MARGIN_X
+        assert positions[0] == (MARGIN_X + NODE_SEP, 0)
+
+    def test_incremental_param(self):
+        app = create_app('fv_prov_es.settings.DevConfig', env='dev')
+        client = app.test_client()
+        viz_data = {
+            'nodes': [{'id': 'ex:a', 'gv_x': 500, 'gv_y': 10}, {'id': 'ex:e'}],
+            'links': [{'source': 0, 'target': 1}],
+        }
+        rv = client.post('/fdl/data/layout', data={'viz_dict': json.dumps(viz_data),
+                                                   'engine': 'layered', 'incremental': 'true'})
+        nodes = json.loads(rv.data)['nodes']
+        assert (nodes[0]['gv_x'], nodes[0]['gv_y']) == (500, 10)
+        assert (nodes[1]['gv_x'], nodes[1]['gv_y']) == (500, 10 + RANK_SEP)
+
+    def test_topology_param(self):
+        app = create_app('fv_prov_es.settings.DevConfig', env='dev')
+        client = app.test_client()
+        topology = {
+            'nodes': ['ex:a', 'ex:e'],
+            'links': [[0, 1]],
+            'positions': [[500, 10], None],
+        }
+        rv = client.post('/fdl/data/layout', data={'topology': json.dumps(topology),
+                                                   'engine': 'layered', 'incremental': 'true'})
+        assert json.loads(rv.data) == {'positions': [[500, 10], [500, 10 + RANK_SEP]]}
+
+        topology['links'] = [[0, 2]]
+        rv = client.post('/fdl/data/layout', data={'topology': json.dumps(topology)})
+        assert rv.status_code == 500
+
+    def test_data_layout(self):
+        app = create_app('fv_prov_es.settings.DevConfig', env='dev')
+        app.config['LAYOUT_ENGINE'] = 'layered'
+        client = app.test_client()
+        pej = {
+            'activity': {'ex:a': {}},
+            'entity': {'ex:e': {}},
+            'wasGeneratedBy': {'_:wgb': {'prov:entity': 'ex:e', 'prov:activity': 'ex:a'}},
+        }
+        doc_cache.set('ex:a', {'_id': 'ex:a', '_source': {'prov_es_json': pej}})
+
+        rv = client.get('/fdl/data?id=ex:a&layout=true')
+        viz_dict = json.loads(rv.data)
+        assert sorted([n['gv_y'] for n in viz_dict['nodes']]) == [0, RANK_SEP]
+
+        # cached graph is not modified
+        rv = client.get('/fdl/data?id=ex:a')
+        assert 'gv_x' not in json.loads(rv.data)['nodes'][0]
@@ -0,0 +1,120 @@
+#! ../env/bin/python
+# -*- coding: utf-8 -*-
+import os
+import json
+import time
+import tempfile
+from subprocess import Popen
+
+from fv_prov_es import create_app, layout_pool
+from fv_prov_es.lib.layout_pool import LayoutPool, LayoutBusy, LayoutTimeout
+
+
+def fail():
+    raise ValueError("bad graph")
+
+
+def run_sleep(pid_file):
+    p = Popen(['sleep', '30'])
+    with open(pid_file, 'w') as f: f.write(str(p.pid))
+    p.wait()
+
+
+def is_running(pid):
+    try:
+        with open('/proc/%d/stat' % pid) as f: return f.read().split()[2] != 'Z'
+    except IOError:
+        return False
+
+
+class TestLayoutPool:
+    def setup(self):
+        self.pool = LayoutPool(size=1, queue_size=0, timeout=1, queue_timeout=0.1)
+
+    def test_run(self):
+        assert self.pool.run(sum, [1, 2, 3]) == 6
+        assert self.pool.stats()['running'] == 0
+
+    def test_timeout(self):
+        start = time.time()
+        try:
+            self.pool.run(time.sleep, 30)
+            assert False
+        except LayoutTimeout:
+            pass
+
+        assert time.time() - start < 5
+        assert self.pool.stats()['timeouts'] == 1
+
+    def test_timeout_kills_subprocesses(self):
+        fd, pid_file = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            try:
+                self.pool.run(run_sleep, pid_file)
+                assert False
+            except LayoutTimeout:
+                pass
+            with open(pid_file) as f: pid = int(f.read())
+            for i in range(50):
+                if not is_running(pid): break
+                time.sleep(.1)
+            assert not is_running(pid)
+        finally:
+            os.unlink(pid_file)
+
+    def test_child_error(self):
+        try:
+            self.pool.run(fail)
+            assert False
+        except RuntimeError, e:
+            assert 'bad graph' in str(e)
+
+    def test_busy(self):
+        self.pool._acquire()
+        try:
+            self.pool.run(sum, [1])
+            assert False
+        except LayoutBusy:
+            pass
+        finally:
+            self.pool._release()
+
+        assert self.pool.stats()['rejected'] == 1
+        assert self.pool.run(sum, [1]) == 1
+
+    def test_degraded_route(self):
+        app = create_app('fv_prov_es.settings.DevConfig', env='dev')
+        app.config['LAYOUT_INLINE_NODES'] = 0
+        client = app.test_client()
+        viz_data = {
+            'nodes': [{'id': 'ex:a'}, {'id': 'ex:e'}],
+            'links': [{'source': 0, 'target': 1}],
+        }
+        data = {'viz_dict': json.dumps(viz_data), 'engine': 'layered'}
+
+        layout_pool._acquire()
+        size = layout_pool.size
+        try:
+            # fill the pool so that the request is rejected
+            layout_pool.size = 1
+            layout_pool.queue_size = 0
+            rv = client.post('/fdl/data/layout', data=data)
+            assert json.loads(rv.data)['degraded']
+
+            # too large to lay out in the worker
+            app.config['LAYOUT_DEGRADE_NODES'] = 1
+            rv = client.post('/fdl/data/layout', data=data)
+            assert rv.status_code == 503
+
+            app.config['LAYOUT_DEGRADE_NODES'] = 2000
+            app.config['LAYOUT_DEGRADE'] = False
+            rv = client.post('/fdl/data/layout', data=data)
+            assert rv.status_code == 503
+            assert 'Retry-After' in rv.headers
+        finally:
+            layout_pool._release()
+            layout_pool.size = size
+
+        rv = client.post('/fdl/data/layout', data=data)
+        assert 'degraded' not in json.loads(rv.data)
@@ -0,0 +1,166 @@
+#! ../env/bin/python
+# -*- coding: utf-8 -*-
+import json
+
+from fv_prov_es import create_app, es, doc_cache
+from fv_prov_es.lib.lineage import EDGE_INDEX_CHECKS, traverse_lineage
+from tests.es_stub import StubSession
+
+
+# ex:in --used--> ex:a --wasGeneratedBy--> ex:out --used--> ex:b
+# --wasGeneratedBy--> ex:final, which ex:c used
+DOCS = {
+    'ex:in': ('entity', {}),
+    'ex:a': ('activity', {}),
+    'ex:out': ('entity', {}),
+    'ex:b': ('activity', {}),
+    'ex:final': ('entity', {}),
+    'ex:c': ('activity', {}),
+    'ex:u': ('used', {'prov:entity': 'ex:in', 'prov:activity': 'ex:a'}),
+    'ex:g': ('wasGeneratedBy', {'prov:entity': 'ex:out', 'prov:activity': 'ex:a'}),
+    'ex:u2': ('used', {'prov:entity': 'ex:out', 'prov:activity': 'ex:b'}),
+    'ex:g2': ('wasGeneratedBy', {'prov:entity': 'ex:final', 'prov:activity': 'ex:b'}),
+    'ex:u3': ('used', {'prov:entity': 'ex:final', 'prov:activity': 'ex:c'}),
+}
+
+# ex:a also used ex:final, closing a cycle
+CYCLE = ('ex:u4', ('used', {'prov:entity': 'ex:final', 'prov:activity': 'ex:a'}))
+
+EDGES = [
+    {'doc_id': 'ex:u', 'relation': 'used', 'source': 'ex:a', 'target': 'ex:in'},
+    {'doc_id': 'ex:g', 'relation': 'wasGeneratedBy', 'source': 'ex:out', 'target': 'ex:a'},
+]
+
+
+def get_hit(id):
+    concept, attrs = DOCS[id]
+    return {'_index': 'prov_es_dev-2015.03.22', '_type': concept, '_id': id,
+            '_source': {'prov_es_json': {concept: {id: attrs}}}}
+
+
+def matches(clause, id):
+    """Return True if a stub document matches an ids or terms clause."""
+
+    if 'ids' in clause: return id in clause['ids']['values']
+    (field, values), = clause['terms'].items()
+    return DOCS[id][1].get(field[:-len('.raw')]) in values
+
+
+def get_session(edges=None):
+    """Return stub session over DOCS and the edge index, which is missing
+    if edges is None."""
+
+    def handler(method, path, data):
+        if path == '/prov_es_dev_edges/_count':
+            if edges is None: return {}, 404
+            return {'count': len(edges)}
+        query = json.loads(data)
+        if path == '/_mget':
+            return {'docs': [dict(get_hit(d['_id']), found=True) for d in query['docs']]}
+        query = query['query']
+        if path == '/prov_es_dev_edges/_search':
+            frontier = set(query['bool']['should'][0]['terms']['source'])
+            hits = [{'_source': e} for e in edges
+                    if e['source'] in frontier or e['target'] in frontier]
+        elif 'ids' in query:
+            hits = [get_hit(id) for id in sorted(DOCS) if id in query['ids']['values']]
+        else:
+            hits = [get_hit(id) for id in sorted(DOCS)
+                    if any(matches(c, id) for c in query['bool']['should'])]
+        return {'hits': {'total': len(hits), 'hits': hits}}
+    return StubSession(handler)
+
+
+class TestLineage:
+    def setup(self):
+        self.app = create_app('fv_prov_es.settings.DevConfig', env='dev')
+        self.app.config['LINEAGE_USE_EDGE_INDEX'] = True
+        self.ctx = self.app.test_request_context()
+        self.ctx.push()
+        doc_cache.delete_many(DOCS.keys())
+        EDGE_INDEX_CHECKS.clear()
+
+    def teardown(self):
+        es.set_session(None)
+        self.ctx.pop()
+
+    def test_depth(self):
+        self.app.config['LINEAGE_USE_EDGE_INDEX'] = False
+        es.set_session(get_session())
+        doc, info = traverse_lineage('ex:a', 1, 'downstream')
+
+        assert set(doc['entity']) == set(['ex:out'])
+        assert doc['activity'].keys() == ['ex:a']
+        assert (info['depth'], info['nodes'], info['unexpanded']) == (1, 2, 1)
+
+        doc, info = traverse_lineage('ex:a', 2, 'downstream')
+        assert set(doc['activity']) == set(['ex:a', 'ex:b'])
+        assert set(doc['used']) == set(['ex:u2'])
+        assert info['truncated'] is False
+
+    def test_direction(self):
+        self.app.config['LINEAGE_USE_EDGE_INDEX'] = False
+        es.set_session(get_session())
+        doc, info = traverse_lineage('ex:b', 10, 'upstream')
+
+        assert set(doc['entity']) == set(['ex:in', 'ex:out'])
+        assert set(doc['activity']) == set(['ex:a', 'ex:b'])
+        assert 'ex:g2' not in doc.get('wasGeneratedBy', {})
+        assert info['unexpanded'] == 0
+
+        try:
+            traverse_lineage('ex:b', 1, 'sideways')
+            assert False
+        except ValueError:
+            pass
+
+    def test_cycle(self):
+        self.app.config['LINEAGE_USE_EDGE_INDEX'] = False
+        DOCS[CYCLE[0]] = CYCLE[1]
+        try:
+            es.set_session(get_session())
+            doc, info = traverse_lineage('ex:a', 10, 'both')
+        finally:
+            del DOCS[CYCLE[0]]
+
+        # every concept is visited once and the traversal ends
+        assert info['nodes'] == 6
+        assert info['unexpanded'] == 0 and info['depth'] < 10
+        assert set(doc['used']) == set(['ex:u', 'ex:u2', 'ex:u3', 'ex:u4'])
+
+    def test_budget(self):
+        self.app.config['LINEAGE_USE_EDGE_INDEX'] = False
+        es.set_session(get_session())
+        doc, info = traverse_lineage('ex:a', 10, 'both', max_nodes=2)
+
+        assert info['nodes'] == 2 and info['truncated'] is True
+        # only relations whose endpoints fit the budget are kept
+        relations = set(doc.get('used', {})) | set(doc.get('wasGeneratedBy', {}))
+        assert len(relations) == 1
+
+    def test_edge_index(self):
+        session = get_session(EDGES)
+        es.set_session(session)
+        doc, info = traverse_lineage('ex:a', 1, 'both')
+
+        assert set(doc['entity']) == set(['ex:in', 'ex:out'])
+        assert set(doc['used']) == set(['ex:u'])
+        assert info['nodes'] == 3
+        assert ('POST', '/prov_es_dev_edges/_search') in session.paths()
+
+        # the edge index is checked once
+        doc_cache.delete_many(DOCS.keys())
+        traverse_lineage('ex:a', 1, 'both')
+        assert session.paths().count(('GET', '/prov_es_dev_edges/_count')) == 1
+
+    def test_missing_edge_index(self):
+        for edges in (None, []):
+            doc_cache.delete_many(DOCS.keys())
+            EDGE_INDEX_CHECKS.clear()
+            session = get_session(edges)
+            es.set_session(session)
+            doc, info = traverse_lineage('ex:a', 1, 'both')
+
+            assert set(doc['entity']) == set(['ex:in', 'ex:out'])
+            assert set(doc['wasGeneratedBy']) == set(['ex:g'])
+            assert ('POST', '/prov_es_dev_edges/_search') not in session.paths()
@@ -0,0 +1,75 @@
+#! ../env/bin/python
+# -*- coding: utf-8 -*-
+import json
+
+from fv_prov_es import create_app, es
+from fv_prov_es.controllers.main import resolve_prov_docs
+from fv_prov_es.lib.expansion_map import CompiledExpansionMap
+from tests.es_stub import StubSession
+
+
+PEM = CompiledExpansionMap({
+    'entity': { 'gcis:inPlatform': { 'type': 'entity', 'source': True } },
+}, 1)
+
+
+def get_hit(id):
+    doc = {'gcis:inPlatform': 'ex:platform'} if id == 'ex:e0' else {}
+    return {'_index': 'prov_es_dev-2015.03.22', '_type': 'entity', '_id': id,
+            '_source': {'prov_es_json': {'entity': {id: doc}}}}
+
+
+class StubIndex(object):
+    """Answers ids searches with the hits of indexed ids."""
+
+    def __init__(self, indexed):
+        self.indexed = indexed
+        self.searched = []
+
+    def __call__(self, method, path, data):
+        ids = json.loads(data)['query']['ids']['values']
+        self.searched.append(ids)
+        hits = [get_hit(id) for id in ids if id in self.indexed]
+        return {'hits': {'total': len(hits), 'hits': hits}}
+
+
+class TestResolveProvDocs:
+    def setup(self):
+        self.app = create_app('fv_prov_es.settings.DevConfig', env='dev')
+        self.ctx = self.app.test_request_context()
+        self.ctx.push()
+        # 600 entities used by a local activity; the last one isn't indexed
+        self.ids = ['ex:e%d' % i for i in range(600)]
+        self.pej = {
+            'activity': {'ex:a': {}},
+            'entity': {'ex:local': {}},
+            'used': dict(('ex:u%d' % i, {'prov:activity': 'ex:a', 'prov:entity': id})
+                         for i, id in enumerate(self.ids + ['ex:local'])),
+        }
+        self.index = StubIndex(set(self.ids[:-1] + ['ex:platform']))
+        es.set_session(StubSession(self.index))
+
+    def teardown(self):
+        es.set_session(None)
+        self.ctx.pop()
+
+    def test_batches(self):
+        resolved = resolve_prov_docs(self.pej, PEM)
+
+        # references are fetched in chunks, expansions of fetched docs after
+        assert [len(ids) for ids in self.index.searched] == [500, 100, 1]
+        assert self.index.searched[-1] == ['ex:platform']
+        assert set(resolved) == set(self.ids + ['ex:platform'])
+        assert resolved['ex:e1'] == get_hit('ex:e1')
+        # local concepts aren't fetched and missing ids map to {}
+        assert 'ex:local' not in resolved and 'ex:a' not in resolved
+        assert resolved['ex:e599'] == {}
+
+    def test_cached(self):
+        resolve_prov_docs(self.pej, PEM)
+        del self.index.searched[:]
+        resolved = resolve_prov_docs(self.pej, PEM)
+
+        # only the missing id is looked up again
+        assert self.index.searched == [['ex:e599']]
+        assert resolved['ex:e0'] == get_hit('ex:e0')
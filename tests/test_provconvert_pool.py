@@ -0,0 +1,156 @@
+#! ../env/bin/python
+# -*- coding: utf-8 -*-
+import os
+import time
+import stat
+import shutil
+import tempfile
+
+from fv_prov_es import create_app, doc_cache, provconvert
+from fv_prov_es.lib.provconvert_pool import ProvConvertPool, ConverterBusy, ConverterError
+
+# stand-in for provconvert-server that copies the input file
+SERVER = """#!/bin/sh
+while read line; do
+  if [ "$line" = PING ]; then echo PONG; continue; fi
+  in="${line%%\t*}"
+  grep -q crash "$in" && exit 1
+  grep -q hang "$in" && exec sleep 30
+  cp "$in" "${line#*\t}"
+  echo OK
+done
+"""
+
+
+class TestProvConvertPool:
+    def setup(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cmd = os.path.join(self.tmp_dir, 'provconvert-server')
+        with open(self.cmd, 'w') as f:
+            f.write(SERVER)
+        os.chmod(self.cmd, stat.S_IRWXU)
+        self.pool = ProvConvertPool(self.cmd, size=1, timeout=1, queue_timeout=0.1)
+        self.pools = [self.pool, provconvert]
+
+    def teardown(self):
+        for pool in self.pools: pool.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def make_pools(self, count, **kwargs):
+        """Return pools of count workers sharing the slots in tmp_dir."""
+
+        pools = [ProvConvertPool(self.cmd, size=1, timeout=1, queue_timeout=0.1,
+                                 lock_dir=self.tmp_dir, **kwargs) for i in range(count)]
+        self.pools.extend(pools)
+        return pools
+
+    def test_convert(self):
+        assert self.pool.convert({'entity': {}}, 'provn') == '{"entity": {}}'
+        proc = self.pool._idle[0]
+        self.pool.convert({'agent': {}}, 'provn')
+
+        # the warm process is reused
+        assert self.pool._idle == [proc]
+        assert self.pool.stats()['conversions'] == 2
+
+    def test_restart(self):
+        try:
+            self.pool.convert({'entity': {'ex:crash': {}}}, 'provn')
+            assert False
+        except ConverterError:
+            pass
+        assert self.pool._idle == []
+
+        assert self.pool.convert({}, 'provn') == '{}'
+        assert self.pool.stats()['failures'] == 1
+
+    def test_timeout(self):
+        try:
+            self.pool.convert({'entity': {'ex:hang': {}}}, 'provn')
+            assert False
+        except ConverterError:
+            pass
+        assert self.pool.stats()['busy'] == 0
+
+    def test_health_check(self):
+        self.pool.convert({}, 'provn')
+        proc = self.pool._idle[0]
+        proc.proc.kill()
+        proc.proc.wait()
+        self.pool.convert({}, 'provn')
+
+        assert self.pool._idle[0] is not proc
+        assert self.pool.stats()['restarts'] == 1
+
+    def test_busy(self):
+        proc = self.pool._acquire()
+        try:
+            self.pool.convert({}, 'provn')
+            assert False
+        except ConverterBusy:
+            pass
+        finally:
+            self.pool._release(proc)
+
+    def test_global_slots(self):
+        # pools of two workers sharing one slot
+        pools = self.make_pools(2, global_slots=1, idle_timeout=0)
+        pools[0].convert({}, 'provn')
+        try:
+            pools[1].convert({}, 'provn')
+            assert False
+        except ConverterBusy:
+            pass
+        assert pools[1].stats()['rejected'] == 1
+
+        # the slot is freed when the process stops
+        pools[0]._idle[0].kill()
+        assert pools[1].convert({}, 'provn') == '{}'
+
+    def test_idle_timeout(self):
+        pools = self.make_pools(2, global_slots=1, idle_timeout=0.1)
+        pools[0].convert({}, 'provn')
+        time.sleep(0.5)
+
+        assert pools[0]._idle == []
+        assert pools[1].convert({}, 'provn') == '{}'
+
+    def test_close(self):
+        pool, = self.make_pools(1, global_slots=1, idle_timeout=10)
+        pool.convert({}, 'provn')
+        proc = pool._idle[0]
+        reaper = pool._reaper
+        pool.close()
+
+        # the reaper exits and the process is stopped, freeing its slot
+        assert not reaper.is_alive() and not proc.alive()
+        slot = pool.slots.acquire()
+        assert proc.slot is None and slot is not None
+        os.close(slot)
+
+        # the pool starts afresh when used again
+        assert pool.convert({}, 'provn') == '{}'
+
+    def test_close_busy(self):
+        proc = self.pool._acquire()
+        self.pool.close()
+        self.pool._release(proc)
+
+        # processes in use when closing are stopped when released
+        assert not proc.alive() and self.pool._idle == []
+        assert self.pool.convert({}, 'provn') == '{}'
+        assert self.pool.stats()['busy'] == 0
+
+    def test_download(self):
+        app = create_app('fv_prov_es.settings.DevConfig', env='dev')
+        app.config['PROVCONVERT_CMD'] = self.cmd
+        app.config['PROVCONVERT_LOCK_DIR'] = self.tmp_dir
+        provconvert.init_app(app)
+        client = app.test_client()
+        pej = {'hadMember': {'_:m1': {'prov:collection': 'ex:c', 'prov:entity': 'ex:e',
+                                      'prov:type': 'gcis:hasChapter'}}}
+        doc_cache.set('ex:c', {'_id': 'ex:c', '_source': {'prov_es_json': pej}})
+        rv = client.get('/api/v0.1/prov_es/download/provn?id=ex:c')
+
+        assert rv.mimetype == 'text/provenance-notation'
+        assert 'prov:type' not in rv.data and 'ex:c' in rv.data
@@ -0,0 +1,71 @@
+#! ../env/bin/python
+# -*- coding: utf-8 -*-
+import json
+
+from fv_prov_es import create_app, es, query_cache
+from tests.es_stub import StubSession
+
+
+RESULT = {
+    'hits': {
+        'total': 1,
+        'hits': [{'_id': 'ex:e', '_type': 'entity', '_source': {'prov_es_json': {}}}]
+    }
+}
+
+
+class TestQuery:
+    def setup(self):
+        self.app = create_app('fv_prov_es.settings.DevConfig', env='dev')
+        self.client = self.app.test_client()
+        self.session = StubSession(lambda method, path, data: RESULT)
+        es.set_session(self.session)
+
+    def teardown(self):
+        es.set_session(None)
+
+    def test_cached(self):
+        rv = self.client.get('/api/v0.1/prov_es/query?callback=cb&source={"size": 1}')
+        assert rv.data.startswith('cb(') and rv.data.endswith(')')
+        hit = json.loads(rv.data[3:-1])['hits']['hits'][0]
+        assert hit['fields'] == {'prov_es_json': {}, '_type': 'entity'}
+
+        rv = self.client.get('/api/v0.1/prov_es/query?callback=cb2&source={ "size":1 }')
+        assert rv.data.startswith('cb2(')
+        assert len(self.session.calls) == 1
+        assert query_cache.stats()['hits'] == 1
+
+    def test_passthrough(self):
+        rv = self.client.get('/api/v0.1/prov_es/query?callback=cb&source={}' +
+                             '&passthrough=true&legacy_fields=false')
+
+        assert rv.data == 'cb(%s)' % json.dumps(RESULT)
+        assert self.session.calls[0][2]['stream'] is True
+        assert self.session.responses[0].closed
+
+        rv = self.client.get('/api/v0.1/prov_es/query?callback=cb&source={}&passthrough=true')
+        assert rv.data.startswith('cb((function(r){')
+        assert rv.data.endswith('})(%s))' % json.dumps(RESULT))
+        assert len(self.session.calls) == 2
+
+    def test_passthrough_raw(self):
+        # facets are left to ES, without refreshing precomputed counts
+        source = json.dumps({'facets': {'types': {'terms': {'field': '_type'}}}})
+        rv = self.client.get('/api/v0.1/prov_es/query?callback=cb&passthrough=true&source=' +
+                             source)
+
+        assert rv.status_code == 200
+        assert len(self.session.calls) == 1
+        assert self.session.calls[0][2]['data'] == source
+
+    def test_profile(self):
+        source = json.dumps({'query': {'match_all': {}}, 'fields': ['_id', '_source']})
+        rv = self.client.get('/api/v0.1/prov_es/query?callback=cb&profile=list&source=' + source)
+        query = json.loads(self.session.calls[0][2]['data'])
+
+        assert rv.status_code == 200
+        assert query['_source'] == {'exclude': ['prov_es_json']}
+        assert query['fields'] == ['_id']
+
+        rv = self.client.get('/api/v0.1/prov_es/query?callback=cb&profile=all&source={}')
+        assert rv.status_code == 400
@@ -0,0 +1,121 @@
+#! ../env/bin/python
+# -*- coding: utf-8 -*-
+import os
+import json
+
+from rdflib import Graph
+from rdflib.compare import isomorphic
+
+from fv_prov_es import create_app, doc_cache
+from fv_prov_es.controllers.services_v01 import SAMPLE_PROV_ES_JSON
+from fv_prov_es.lib.ttl_utils import get_ttl, get_xsd_datetime, get_java_double, TurtleWriter
+
+
+# golden documents: <name>.json and its Turtle <name>.ttl as converted by
+# provconvert, recorded with scripts/record_ttl_fixtures.py
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), 'fixtures', 'ttl')
+
+
+def parse_ttl(ttl):
+    """Return rdflib graph of Turtle."""
+
+    g = Graph()
+    g.parse(data=ttl.encode('utf-8') if isinstance(ttl, unicode) else ttl, format='turtle')
+    return g
+
+
+class TestTtlUtils:
+    def setup(self):
+        self.pej = json.loads(SAMPLE_PROV_ES_JSON)
+        self.ttl = get_ttl(self.pej)
+
+    def test_prefixes(self):
+        assert '@prefix ex1: <http://example.org/my_namespace#> .\n' in self.ttl
+        assert '@prefix prov: <http://www.w3.org/ns/prov#> .\n' in self.ttl
+
+    def test_elements(self):
+        assert 'ex1:file-1 a prov:Entity , eos:granule ;\n' \
+               '\tprov:atLocation "http://path/to/my/input-file"^^xsd:string .\n' in self.ttl
+        assert '\tprov:startedAtTime "2015-03-22T14:55:43.906Z"^^xsd:dateTime' in self.ttl
+        assert '\trdfs:label "md5sum command"' in self.ttl
+        assert '\thysds:pid "1921"^^xsd:int' in self.ttl
+
+    def test_qualified(self):
+        # qualified relations have no unqualified shortcut
+        assert 'ex1:my-md5sum-activity prov:qualifiedUsage ex1:used-file-1 .\n' in self.ttl
+        assert 'prov:used ' not in self.ttl
+        assert 'ex1:used-file-1 a prov:Usage ;\n' \
+               '\tprov:entity ex1:file-1 ;\n' \
+               '\tprov:hadRole "input"^^xsd:string ;\n' \
+               '\tprov:atTime "2015-03-22T16:07:05.195Z"^^xsd:dateTime .\n' in self.ttl
+
+    def test_unqualified(self):
+        pej = {
+            'wasDerivedFrom': {'_:d1': {'prov:generatedEntity': 'ex:b', 'prov:usedEntity': 'ex:a'}},
+            'hadMember': {'_:m1': {'prov:collection': 'ex:c', 'prov:entity': 'ex:a',
+                                   'prov:type': 'gcis:hasChapter'}},
+        }
+        ttl = get_ttl(pej)
+
+        assert '<ex:b> prov:wasDerivedFrom <ex:a> .\n' in ttl
+        assert '<ex:c> prov:hadMember <ex:a> .\n' in ttl
+        assert 'qualified' not in ttl and 'gcis:hasChapter' not in ttl
+
+    def test_values(self):
+        writer = TurtleWriter({'ex': 'http://example.org/'})
+
+        assert writer.values({'$': 'chat', 'lang': 'fr'}) == ['"chat"@fr']
+        assert writer.values({'$': '1.5', 'type': 'xsd:float'}) == ['"1.5"^^xsd:float']
+        assert writer.values({'$': '42'}) == ['"42"']
+        assert writer.values([1, True, 2**31]) == ['"1"^^xsd:int', '"true"^^xsd:boolean',
+                                                   '"2.147483648E9"^^xsd:double']
+        assert writer.values(['007', ' 1e5', '0x1F']) == ['"7"^^xsd:int', '"100000.0"^^xsd:double',
+                                                          '"0x1F"^^xsd:string']
+        assert writer.values('say "hi"\n', None) == ['"say \\"hi\\"\\n"']
+        assert writer.qname('ex:odd name') == '<http://example.org/odd\\u0020name>'
+        assert writer.qname('urn:uuid:1') == '<urn:uuid:1>'
+        assert writer.qname('_:x') == writer.qname('_:x') != writer.blank()
+
+    def test_datetime(self):
+        assert get_xsd_datetime('2015-03-22T16:55:43.9996-02:00') == '2015-03-22T18:55:43.999Z'
+        assert get_xsd_datetime('2015-03-22T23:30:00+01:30') == '2015-03-22T22:00:00.000Z'
+        assert get_xsd_datetime('2015-03-22') == '2015-03-22T00:00:00.000Z'
+        assert get_xsd_datetime('yesterday') is None
+
+    def test_java_double(self):
+        assert [get_java_double(v) for v in (2.5, 3.0, 1e-7, 1e7, 0.001, -12345678901.0)] == \
+               ['2.5', '3.0', '1.0E-7', '1.0E7', '0.001', '-1.2345678901E10']
+
+    def test_download(self):
+        app = create_app('fv_prov_es.settings.DevConfig', env='dev')
+        client = app.test_client()
+        doc_cache.set('ex1:md5sum-file', {'_index': 'prov_es_dev-2015.03.22', '_type': 'entity',
+                                          '_id': 'ex1:md5sum-file', '_version': 1,
+                                          '_source': {'prov_es_json': self.pej}})
+        rv = client.get('/api/v0.1/prov_es/download/ttl?id=ex1:md5sum-file')
+
+        assert rv.mimetype == 'text/turtle'
+        assert rv.data == self.ttl
+
+
+class TestTtlFixtures:
+    def check(self, name):
+        with open(os.path.join(FIXTURE_DIR, '%s.json' % name)) as f: pej = json.load(f)
+        with open(os.path.join(FIXTURE_DIR, '%s.ttl' % name)) as f: golden = f.read()
+
+        assert isomorphic(parse_ttl(get_ttl(pej)), parse_ttl(golden))
+
+    def test_qualified(self):
+        self.check('qualified')
+
+    def test_relations(self):
+        self.check('relations')
+
+    def test_literals(self):
+        self.check('literals')
+
+    def test_bundle(self):
+        self.check('bundle')
+
+    def test_sample(self):
+        self.check('sample')